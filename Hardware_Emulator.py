@@ -0,0 +1,219 @@
+"""
+Signal-level emulator of the AWG -> oscilloscope hardware, for regression runs of the recovery chain without the bench
+A waveform, as given to Lab_Automation.saveToFile (one channel per row), goes through the same steps as on the bench:
+    DAC: quantized to dac_bits with one full scale for all channels, as saveToBinaryFiles does, then held for each
+         sample (zero-order hold, if hold), which filters it by sinc(f/fs) and delays it by half a sample
+    AWG: the waveform is looped, so the output repeats every len(waveform) samples, which must be a multiple of seg_len
+    analog: Gaussian responses with -3 dB points at awg_bandwidth and osc_bandwidth
+    scope: sampled at fosc, with its clock off by clock_ppm, random timing jitter and a trigger at a random point of
+           the loop, then noise of osc_noise volts and quantization to adc_bits over osc_range
+The filters are all applied to one loop of the waveform in the frequency domain when it is loaded, and the result is
+kept oversampled, so each capture is only a cubic interpolation at its sample times (Fractional_Delay.farrow_read).
+Captures are worked out block_size points at a time, so memory does not grow with the capture length.
+HardwareEmulator can be given to Instrument_Simulator's SimulatedOscilloscope (or SimulatedResourceManager), which
+then plays the AWG's imported traces through it, so the whole saveToFile -> AWG -> scope -> getDataFromOsc path runs.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+from Waveform_Format import toDACCodes
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "files"))
+import Fractional_Delay
+import Random_Streams
+
+
+def gaussianResponse(f, bandwidth):
+    """
+    Gets the magnitude response of a Gaussian filter with its -3 dB point at bandwidth, 1 everywhere if bandwidth is None
+    """
+    if bandwidth is None:
+        return np.ones_like(f)
+    return np.exp(-np.log(2) / 2 * (f / bandwidth) ** 2)
+
+
+class HardwareEmulator:
+    """
+    Emulates the AWG and oscilloscope, see module docstring
+    """
+
+    def __init__(self, fs=60e9, fosc=80e9, dac_bits=14, adc_bits=8, awg_bandwidth=None, osc_bandwidth=None,
+                 clock_ppm=0.0, jitter=0.0, osc_noise=0.0, osc_range=None, amplitude=1.0, seg_len=None, oversample=4,
+                 points=2 ** 16, block_size=2 ** 16, rng=None, hold=True):
+        """
+        :param fs: sample rate of the AWG, as the fs given to Lab_Automation.qampy_sig
+        :param fosc: sample rate of the oscilloscope
+        :param dac_bits: resolution of the AWG's DAC, as for saveToFile. If None, the waveform is not quantized
+        :param adc_bits: resolution of the oscilloscope's ADC. If None, captures are not quantized
+        :param awg_bandwidth: -3 dB bandwidth of the AWG's output in Hz, if None it is not limited
+        :param osc_bandwidth: -3 dB bandwidth of the oscilloscope's input in Hz, if None it is not limited
+        :param clock_ppm: error of the oscilloscope's sample clock relative to the AWG's, in parts per million
+        :param jitter: rms timing jitter of the oscilloscope's samples, in seconds
+        :param osc_noise: rms noise added at the oscilloscope's input, in volts
+        :param osc_range: full scale range of the ADC (peak to peak) in volts, if None 2.5 * amplitude
+        :param amplitude: peak output of the AWG in volts, for the largest DAC code
+        :param seg_len: length of a segment of the waveform, the waveform length must be a multiple of it if given
+        :param oversample: how many times the AWG rate the loaded waveform is kept at, for interpolating captures
+        :param points: number of points in a capture, when called with no arguments
+        :param block_size: number of points of a capture worked out at a time
+        :param rng: numpy Generator (see Random_Streams) for the trigger, jitter and noise, or an integer seed. If None,
+        a Generator is seeded from numpy's global random state
+        :param hold: if True, the DAC holds each sample (zero-order hold). If False, its output is the bandlimited
+        waveform through the samples, so with no quantization, bandwidth limits, clock error, jitter or noise a capture
+        at start=0 matches the waveform (scaled to amplitude) to rounding error
+        """
+        self.fs = fs
+        self.fosc = fosc
+        self.dac_bits = dac_bits
+        self.adc_bits = adc_bits
+        self.awg_bandwidth = awg_bandwidth
+        self.osc_bandwidth = osc_bandwidth
+        self.clock_ppm = clock_ppm
+        self.jitter = jitter
+        self.osc_noise = osc_noise
+        self.osc_range = 2.5 * amplitude if osc_range is None else osc_range
+        self.amplitude = amplitude
+        self.seg_len = seg_len
+        self.oversample = oversample
+        self.points = points
+        self.block_size = int(block_size)
+        self.rng = Random_Streams.as_generator(rng)
+        self.hold = hold
+        self.loop = None        # one loop of the analog waveform at oversample * fs, one channel per row
+        self._traces = None     # AWG traces that loop was made from, see loadTraces
+
+    def response(self, f):
+        """
+        Gets the frequency response of the DAC's hold and the analog path at frequencies f
+        """
+        response = gaussianResponse(f, self.awg_bandwidth) * gaussianResponse(f, self.osc_bandwidth)
+        if self.hold:
+            # zero-order hold: a rectangular pulse one sample long, which is centred half a sample after each sample
+            response = response * np.sinc(f / self.fs) * np.exp(-1j * np.pi * f / self.fs)
+        return response
+
+    def load(self, arr):
+        """
+        Loads the waveform that the AWG plays, working out one loop of the analog signal reaching the oscilloscope
+        :param arr: waveform, as given to saveToFile, with one channel per row
+        :return: self
+        """
+        arr = np.atleast_2d(np.asarray(arr, dtype=np.float64))
+        n = arr.shape[-1]
+        if self.seg_len is not None and n % self.seg_len != 0:
+            raise ValueError("waveform length %d is not a multiple of the segment length %d" % (n, self.seg_len))
+        if self.dac_bits is not None:
+            max_code = 2 ** (self.dac_bits - 1) - 1
+            arr = toDACCodes(arr, self.dac_bits) * (self.amplitude / max_code)
+        else:
+            peak = np.max(np.abs(arr))
+            arr = arr * (self.amplitude / peak if peak > 0 else 1)
+        spectrum = np.fft.rfft(arr, axis=-1)
+        spectrum *= self.response(np.fft.rfftfreq(n, 1 / self.fs))
+        if n % 2 == 0:
+            spectrum[..., -1] *= 0.5   # Nyquist bin is split between positive and negative frequencies when padded
+        self.loop = np.fft.irfft(spectrum, n * self.oversample, axis=-1) * self.oversample
+        self._traces = None
+        return self
+
+    def loadTraces(self, traces):
+        """
+        Loads the traces imported by a SimulatedAWG (a dictionary of channel number to trace), unless already loaded
+        Channels with no trace are zero
+        """
+        current = [traces.get(channel) for channel in range(1, max(traces) + 1)]
+        if self._traces is not None and len(current) == len(self._traces) and \
+                all(a is b for a, b in zip(current, self._traces)):
+            return self
+        n = max(len(trace) for trace in traces.values())
+        arr = np.zeros((len(current), n))
+        for i, trace in enumerate(current):
+            if trace is not None:
+                arr[i] = np.resize(trace, n)
+        self.load(arr)
+        self._traces = current
+        return self
+
+    def iterCapture(self, points=None, start=None):
+        """
+        Takes a capture of the loaded waveform one block at a time
+        :param points: number of points in the capture, if None self.points
+        :param start: time of the first point from the start of the loop in seconds, if None the scope triggers at a
+        random point of the loop
+        :return: yields [offset, block] where block holds points offset to offset + block_size of each channel, in volts
+        """
+        if self.loop is None:
+            raise ValueError("no waveform is loaded")
+        if points is None:
+            points = self.points
+        rate = self.fs * self.oversample    # rate of the loaded loop
+        period = self.loop.shape[-1] / rate
+        if start is None:
+            start = self.rng.uniform(0, period)
+        step = rate / (self.fosc * (1 + self.clock_ppm * 1e-6))   # loop samples per capture point
+        for offset in range(0, points, self.block_size):
+            k = np.arange(offset, min(offset + self.block_size, points))
+            position = start * rate + k * step
+            if self.jitter:
+                position += self.rng.standard_normal(len(k)) * (self.jitter * rate)
+            block = Fractional_Delay.farrow_read(self.loop, position)
+            if self.osc_noise:
+                block += self.rng.standard_normal(block.shape) * self.osc_noise
+            if self.adc_bits is not None:
+                # midtread ADC over osc_range, clipping at its ends
+                adc_step = self.osc_range / 2 ** self.adc_bits
+                np.rint(block / adc_step, out=block)
+                np.clip(block, -2 ** (self.adc_bits - 1), 2 ** (self.adc_bits - 1) - 1, out=block)
+                block *= adc_step
+            yield [offset, block]
+
+    def capture(self, points=None, start=None):
+        """
+        Takes a capture of the loaded waveform, see iterCapture
+        :return: capture: array of the points of each channel in volts
+        """
+        if points is None:
+            points = self.points
+        capture = None
+        for [offset, block] in self.iterCapture(points, start):
+            if capture is None:
+                capture = np.empty((block.shape[0], points))
+            capture[:, offset:offset + block.shape[-1]] = block
+        return capture
+
+    def __call__(self):
+        # so an emulator can be used as the waveforms function of a SimulatedOscilloscope
+        return self.capture()
+
+
+if __name__ == "__main__":
+    import tempfile
+    from timeit import default_timer as timer
+
+    import Lab_Automation
+    import Instrument_Simulator
+
+    # bench-like settings, and a waveform played through the files, the simulated AWG and oscilloscope
+    seg_len = 64
+    fs = 60e9
+    emulator = HardwareEmulator(fs, 80e9, dac_bits=14, adc_bits=8, awg_bandwidth=25e9, osc_bandwidth=33e9,
+                                clock_ppm=5, jitter=100e-15, osc_noise=2e-3, seg_len=seg_len, rng=2021)
+    arr = np.random.default_rng(1).standard_normal((4, 1000 * seg_len))
+    with tempfile.TemporaryDirectory() as file_dir:
+        filenames = Lab_Automation.saveToFile(arr, seg_len, n_modes=2, complex=True,
+                                              filename=os.path.join(file_dir, "emulated"), file_format="bin")
+        rm = Instrument_Simulator.SimulatedResourceManager(file_dir=file_dir, points=2 ** 16, emulator=emulator)
+        awg = rm.open_resource(Instrument_Simulator.AWG_NAME)
+        osc = rm.open_resource(Instrument_Simulator.OSC_NAME)
+        for channel, filename in enumerate(filenames):
+            awg.write(':TRAC%d:IMP 1, "%s", BIN, IONLY, ON, ALEN' % (channel + 1, os.path.basename(filename)))
+        [captures, points] = Instrument_Simulator.measureCaptureRate(osc, [1, 2, 3, 4], 20, binary=True)
+        print("through the simulated instruments: %.0f captures/hour, %.3e points/s" % (captures * 3600, points))
+
+    start = timer()
+    for i in range(20):
+        emulator.capture()
+    print("emulator alone: %.0f captures/hour" % (20 * 3600 / (timer() - start)))
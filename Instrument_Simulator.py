@@ -0,0 +1,410 @@
+"""
+Local stand-in for the VISA instruments used in Lab_Automation, so that the AWG -> oscilloscope flow can be run,
+regression tested and benchmarked without the lab bench.
+SimulatedResourceManager can be used wherever pyvisa.ResourceManager is, and speaks the SCPI subset that the project
+uses (:WAVeform:*, :wav:points?, :DIGitize, :TRAC<n>:IMP, *IDN?, *OPC?) over a link with configurable bandwidth and
+latency.
+The oscilloscope can capture the AWG's traces through a Hardware_Emulator.HardwareEmulator, which models the DAC, the
+analog bandwidth, the sample clocks and the ADC, rather than just repeating them.
+"""
+
+import os
+import time
+from timeit import default_timer as timer
+
+import numpy as np
+
+AWG_NAME = 'TCPIP0::inst1::INSTR'  # VISA name of the AWG, as used in Lab_Automation
+OSC_NAME = 'TCPIP0::inst0::INSTR'  # VISA name of the oscilloscope, as used in Lab_Automation
+
+
+def scpiMatches(header, long_form):
+    """
+    Checks if a SCPI command header matches a command given in long form, eg. ":wav:points?" matches ":WAVeform:POINts?"
+    Each mnemonic can be given in its short form (the upper case letters of the long form) or in full, in any case.
+    Numeric suffixes, such as the 1 in CHANnel1 or TRAC1, must be removed from header before matching
+    :param header: command header sent to the instrument
+    :param long_form: long form of the command, with the short form in upper case
+    :return: True if header is the command given by long_form
+    """
+    parts = header.strip(":").split(":")
+    long_parts = long_form.strip(":").split(":")
+    if len(parts) != len(long_parts):
+        return False
+    for part, long_part in zip(parts, long_parts):
+        query = long_part.endswith("?")
+        if part.endswith("?") != query:
+            return False
+        part = part.rstrip("?").upper()
+        long_part = long_part.rstrip("?")
+        short = "".join(c for c in long_part if not c.islower())
+        if part != short and part != long_part.upper():
+            return False
+    return True
+
+
+def splitSuffixes(header):
+    """
+    Removes numeric suffixes from each mnemonic of a SCPI header, eg. ":TRAC1:IMP" gives ":TRAC:IMP" and [1]
+    :return: [header, suffixes] where suffixes is a list of the numbers that were removed
+    """
+    parts = []
+    suffixes = []
+    for part in header.split(":"):
+        query = part.endswith("?")
+        part = part.rstrip("?")
+        stripped = part.rstrip("0123456789")
+        if stripped != part:
+            suffixes.append(int(part[len(stripped):]))
+        parts.append(stripped + ("?" if query else ""))
+    return [":".join(parts), suffixes]
+
+
+def ieeeBlock(data):
+    """
+    Wraps bytes in an IEEE 488.2 definite length block, ie. #<n digits><length><data>
+    """
+    length = str(len(data))
+    return b"#" + str(len(length)).encode() + length.encode() + data + b"\n"
+
+
+def parseIeeeBlock(block):
+    """
+    Gets the data from an IEEE 488.2 definite length block
+    """
+    if block[:1] != b"#":
+        raise ValueError("not an IEEE 488.2 block")
+    n_digits = int(block[1:2])
+    length = int(block[2:2 + n_digits])
+    start = 2 + n_digits
+    return block[start:start + length]
+
+
+class SimulatedLink:
+    """
+    Models the network link to an instrument: each transfer takes latency seconds plus its size divided by bandwidth
+    """
+
+    def __init__(self, bandwidth=None, latency=0.0):
+        """
+        :param bandwidth: link bandwidth in bytes/s, if None transfers are instant
+        :param latency: time taken by each transfer, regardless of its size, in seconds
+        """
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.bytes_sent = 0
+
+    def transfer(self, n_bytes):
+        self.bytes_sent += n_bytes
+        delay = self.latency
+        if self.bandwidth:
+            delay += n_bytes / self.bandwidth
+        if delay > 0:
+            time.sleep(delay)
+
+
+class SimulatedInstrument:
+    """
+    Base for simulated VISA resources, giving the write/read/query interface of a pyvisa resource.
+    Subclasses handle commands in handleCommand, which returns the response as bytes, or None if there is no response
+    """
+    idn = "SIMULATED,INSTRUMENT,0,1.0"
+
+    def __init__(self, name, link=None):
+        self.resource_name = name
+        self.link = link if link is not None else SimulatedLink()
+        self.timeout = 2000
+        self.errors = []  # SCPI error queue
+        self._response = b""
+        self.closed = False
+
+    def write(self, command):
+        self.link.transfer(len(command))
+        for cmd in command.strip().split(";"):  # SCPI allows several commands per message
+            if not cmd.strip():
+                continue
+            response = self.handleCommand(cmd.strip())
+            if response is not None:
+                self._response += response
+        return len(command)
+
+    def read_raw(self):
+        response, self._response = self._response, b""
+        self.link.transfer(len(response))
+        return response
+
+    def read(self):
+        return self.read_raw().decode()
+
+    def query(self, command):
+        self.write(command)
+        return self.read()
+
+    def query_binary_values(self, command, datatype="f", is_big_endian=False, container=list, data_points=None,
+                            header_fmt="ieee", expect_termination=True):
+        self.write(command)
+        data = parseIeeeBlock(self.read_raw())
+        values = np.frombuffer(data, dtype=np.dtype(datatype).newbyteorder(">" if is_big_endian else "<"))
+        if data_points is not None and len(values) != data_points:
+            raise ValueError("expected %d data points, got %d" % (data_points, len(values)))
+        if container is np.array or container is np.ndarray:
+            return values
+        return container(values)
+
+    def close(self):
+        self.closed = True
+
+    def handleCommand(self, command):
+        header, _, args = command.partition(" ")
+        if scpiMatches(header, "*IDN?"):
+            return (self.idn + "\n").encode()
+        if scpiMatches(header, "*OPC?"):
+            return b"1\n"  # commands are run as they arrive, so all have completed
+        if scpiMatches(header, ":SYSTem:ERRor?"):
+            if self.errors:
+                return ('-113,"Undefined header;%s"\n' % self.errors.pop(0)).encode()
+            return b'0,"No error"\n'
+        self.errors.append(command)
+        return None
+
+
+class SimulatedAWG(SimulatedInstrument):
+    """
+    Simulated AWG, which imports waveform files from file_dir with :TRAC<n>:IMP
+    Text files are in the format written by Lab_Automation.saveToFile and binary files are 16-bit words with the DAC
+    code in the upper bits and markers in the lowest 2 bits
+    """
+    idn = "SIMULATED,AWG,0,1.0"
+
+    def __init__(self, name=AWG_NAME, link=None, file_dir=".", dac_bits=14):
+        """
+        :param name: VISA name of the AWG
+        :param link: SimulatedLink to the AWG
+        :param file_dir: directory that imported files are read from, in place of the AWG's own drive
+        :param dac_bits: resolution of the DAC, used to scale binary files
+        """
+        super().__init__(name, link)
+        self.file_dir = file_dir
+        self.dac_bits = dac_bits
+        self.traces = {}  # imported waveform of each channel, scaled to +-1
+
+    def handleCommand(self, command):
+        header, _, args = command.partition(" ")
+        [base, suffixes] = splitSuffixes(header)
+        if scpiMatches(base, ":TRACe:IMPort"):
+            channel = suffixes[0] if suffixes else 1
+            self.importFile(channel, args)
+            return None
+        return super().handleCommand(command)
+
+    def importFile(self, channel, args):
+        """
+        Imports a waveform file given the arguments of :TRAC<n>:IMP, ie. segment, "filename", format, ...
+        """
+        fields = [field.strip() for field in args.split(",")]
+        filename = os.path.basename(fields[1].strip('"').replace("\\", "/"))  # the AWG's drive is file_dir
+        file_format = fields[2].upper() if len(fields) > 2 else "TXT"
+        path = os.path.join(self.file_dir, filename)
+        if file_format.startswith("BIN"):
+            words = np.fromfile(path, dtype="<i2")
+            self.traces[channel] = (words >> (16 - self.dac_bits)) / (2 ** (self.dac_bits - 1) - 1)
+        else:
+            self.traces[channel] = np.loadtxt(path, delimiter=",", usecols=0, ndmin=1)
+
+
+class SimulatedOscilloscope(SimulatedInstrument):
+    """
+    Simulated oscilloscope. Captures either come from waveforms, which can be an array of shape (n_channels, n_points)
+    in volts, or a function that returns such an array for each new capture, or if waveforms is None, from the traces
+    imported by awg, repeated to fill the capture like a looping AWG segment, or played through emulator if given
+    Captures are quantized to 16-bit codes, and returned in the ASCii, WORD or BYTE formats
+    """
+    idn = "SIMULATED,OSCILLOSCOPE,0,1.0"
+
+    def __init__(self, name=OSC_NAME, link=None, waveforms=None, fs=None, awg=None, points=2 ** 16, emulator=None):
+        """
+        :param name: VISA name of the oscilloscope
+        :param link: SimulatedLink to the oscilloscope
+        :param waveforms: array or function giving the waveform of each channel in volts
+        :param fs: sample rate of the oscilloscope. If None, the emulator's fosc, or 80e9 if there is no emulator. If an
+        emulator is given, it must match its fosc
+        :param awg: SimulatedAWG whose traces are captured when waveforms is None
+        :param points: number of points in a capture of the AWG traces
+        :param emulator: Hardware_Emulator.HardwareEmulator that the AWG traces are captured through, if None they are
+        repeated as they are
+        """
+        super().__init__(name, link)
+        if fs is None:
+            fs = 80e9 if emulator is None else emulator.fosc
+        elif emulator is not None and fs != emulator.fosc:
+            raise ValueError("oscilloscope sample rate %g does not match the emulator's fosc %g" % (fs, emulator.fosc))
+        self.waveforms = waveforms
+        self.fs = fs
+        self.awg = awg
+        self.points = points
+        self.emulator = emulator
+        self.format = "ASC"
+        self.byte_order = "LSBF"
+        self.source = 1
+        self.captures = 0
+        self._capture = None  # [codes, yInc, yOrg] of each channel of the current capture
+
+    def digitize(self):
+        """
+        Takes a new capture and quantizes each channel to 16-bit codes
+        """
+        if callable(self.waveforms):
+            volts = self.waveforms()
+        elif self.waveforms is not None:
+            volts = self.waveforms
+        elif self.awg is not None and self.awg.traces and self.emulator is not None:
+            volts = self.emulator.loadTraces(self.awg.traces).capture(self.points)
+        elif self.awg is not None and self.awg.traces:
+            n_channels = max(self.awg.traces)
+            volts = np.zeros((n_channels, self.points))
+            for channel, trace in self.awg.traces.items():
+                volts[channel - 1] = np.resize(trace, self.points)  # AWG repeats its segment
+        else:
+            volts = np.zeros((1, self.points))
+        volts = np.atleast_2d(volts)
+
+        self._capture = []
+        for channel in volts:
+            lo = np.min(channel)
+            hi = np.max(channel)
+            y_inc = (hi - lo) / 65000 if hi > lo else 1e-6  # leaves some headroom either side of the waveform
+            y_org = (hi + lo) / 2
+            codes = np.rint((channel - y_org) / y_inc).astype(np.int16)
+            self._capture.append([codes, y_inc, y_org])
+        self.captures += 1
+
+    def currentChannel(self):
+        if self._capture is None:
+            self.digitize()
+        if self.source > len(self._capture):
+            raise ValueError("channel %d has no data" % self.source)
+        return self._capture[self.source - 1]
+
+    def handleCommand(self, command):
+        header, _, args = command.partition(" ")
+        args = args.strip()
+        [base, suffixes] = splitSuffixes(header)
+        if scpiMatches(base, ":WAVeform:FORMat"):
+            self.format = args.upper()[:4] if args.upper().startswith("WORD") else args.upper()[:3]
+        elif scpiMatches(base, ":WAVeform:FORMat?"):
+            return (self.format + "\n").encode()
+        elif scpiMatches(base, ":WAVeform:BYTeorder"):
+            self.byte_order = args.upper()[:4]
+        elif scpiMatches(base, ":WAVeform:STReaming") or scpiMatches(base, ":SYSTem:HEADer"):
+            pass  # no effect on the simulated data
+        elif scpiMatches(base, ":WAVeform:SOURce"):
+            [_, channel] = splitSuffixes(args)
+            self.source = channel[0]
+        elif scpiMatches(base, ":DIGitize") or scpiMatches(base, ":SINGle"):
+            self.digitize()
+        elif scpiMatches(base, ":WAVeform:XINCrement?"):
+            return ("%.10E\n" % (1 / self.fs)).encode()
+        elif scpiMatches(base, ":WAVeform:XORigin?"):
+            return b"0.0000000000E+00\n"
+        elif scpiMatches(base, ":WAVeform:YINCrement?"):
+            y_inc = self.currentChannel()[1]
+            if self.format == "BYT":
+                y_inc *= 256
+            return ("%.10E\n" % y_inc).encode()
+        elif scpiMatches(base, ":WAVeform:YORigin?"):
+            return ("%.10E\n" % self.currentChannel()[2]).encode()
+        elif scpiMatches(base, ":WAVeform:POINts?"):
+            return ("%d\n" % len(self.currentChannel()[0])).encode()
+        elif scpiMatches(base, ":WAVeform:DATA?"):
+            return self.waveformData(args)
+        else:
+            return super().handleCommand(command)
+        return None
+
+    def waveformData(self, args):
+        """
+        Gets the response to :WAVeform:DATA? [start,size], where start is the 1-based index of the first point
+        """
+        [codes, y_inc, y_org] = self.currentChannel()
+        if args:
+            [start, size] = [int(float(arg)) for arg in args.split(",")]
+            codes = codes[start - 1:start - 1 + size]
+        if self.format == "ASC":
+            volts = codes * y_inc + y_org
+            return (("%.6E," * len(volts)) % tuple(volts) + "\n").encode()
+        if self.format == "BYT":
+            codes = (codes >> 8).astype(np.int8)
+        order = "<" if self.byte_order == "LSBF" else ">"
+        return ieeeBlock(codes.astype(codes.dtype.newbyteorder(order)).tobytes())
+
+
+class SimulatedResourceManager:
+    """
+    Replacement for pyvisa.ResourceManager giving a simulated AWG and oscilloscope
+    """
+
+    def __init__(self, waveforms=None, fs=None, bandwidth=None, latency=0.0, file_dir=".", points=2 ** 16,
+                 awg_name=AWG_NAME, osc_name=OSC_NAME, emulator=None):
+        """
+        :param waveforms: waveform of each oscilloscope channel, see SimulatedOscilloscope
+        :param fs: sample rate of the oscilloscope, see SimulatedOscilloscope
+        :param bandwidth: bandwidth of the link to each instrument in bytes/s, if None transfers are instant
+        :param latency: latency of each transfer to or from an instrument in seconds
+        :param file_dir: directory that the AWG imports files from
+        :param points: number of points in a capture of the AWG traces
+        :param emulator: Hardware_Emulator.HardwareEmulator that the oscilloscope captures the AWG traces through
+        """
+        self.awg = SimulatedAWG(awg_name, SimulatedLink(bandwidth, latency), file_dir)
+        self.osc = SimulatedOscilloscope(osc_name, SimulatedLink(bandwidth, latency), waveforms, fs, self.awg, points,
+                                         emulator)
+
+    def list_resources(self):
+        return (self.awg.resource_name, self.osc.resource_name)
+
+    def open_resource(self, name):
+        for instrument in [self.awg, self.osc]:
+            if instrument.resource_name == name:
+                instrument.closed = False
+                return instrument
+        raise ValueError("no simulated instrument called %s" % name)
+
+    def close(self):
+        return
+
+
+def measureCaptureRate(osc, channels=None, n_captures=10, acquire=None, **kwargs):
+    """
+    Measures how many captures per second can be taken from an oscilloscope
+    :param osc: oscilloscope VISA resource, usually a SimulatedOscilloscope
+    :param channels: list of all channels to be read
+    :param n_captures: number of captures to be timed
+    :param acquire: function used to get the data, called as acquire(osc, channels, **kwargs). Default is
+    Lab_Automation.getDataFromOsc
+    :return: [captures per second, points per second]
+    """
+    if channels is None:
+        channels = [1]
+    if acquire is None:
+        from Lab_Automation import getDataFromOsc as acquire
+    n_points = 0
+    start = timer()
+    for i in range(n_captures):
+        osc.write(":DIGitize")
+        data = acquire(osc, channels, **kwargs)
+        n_points += sum(len(channel) for channel in data)
+    elapsed = timer() - start
+    return [n_captures / elapsed, n_points / elapsed]
+
+
+if __name__ == "__main__":
+    import Lab_Automation
+
+    # replays a noisy QAMpy signal through a 1 GB/s link with 1 ms latency
+    sig = Lab_Automation.qampy_sig(2 ** 16, 10e9, 60e9, 64, 2, 6, snr=20)
+    rm = SimulatedResourceManager(waveforms=sig, bandwidth=1e9, latency=1e-3)
+    osc = rm.open_resource(OSC_NAME)
+    print(osc.query('*IDN?'))
+    for binary in [False, True]:
+        [captures, points] = measureCaptureRate(osc, [1, 2, 3, 4], 5, binary=binary)
+        print("binary: %s, %.2f captures/s, %.3e points/s" % (binary, captures, points))
+    osc.close()
@@ -14,18 +14,32 @@ import math
 import pyvisa
 
 import os
+import sys
 import socket
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from server import FILE_MAGIC, FILE_HEADER, FILE_ACK
+from Waveform_Format import writeBinaryChannel, writeCompactChannel, validateWaveformFile
+import Waveform_Synthesis
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "files"))
+import Signal_Cache
+import Random_Streams
 
 
 def sin(sig_len, freq, sample_rate, amp, phase):
+    """
+    Generates a sine wave, see Waveform_Synthesis for other test waveforms
+    :return: [sin_sig, t]: the sine wave and the time of each sample
+    """
     t = np.linspace(0, sig_len / sample_rate, num=sig_len, endpoint=False)
-    sin_sig = np.zeros(len(t))
-    for i in range(len(t)):
-        sin_sig[i] = amp * math.sin(2 * math.pi * t[i] * 2 * 10 ** 9 + phase)
+    sin_sig = Waveform_Synthesis.sine(sig_len, freq, sample_rate, amp, phase)
     return [sin_sig, t]
 
 
-def qampy_sig(sig_len=2 ** 17, freq=40.e9, fs=40.e9, m_qam=16, n_modes=2, os=1, snr=0):
+def qampy_sig(sig_len=2 ** 17, freq=40.e9, fs=40.e9, m_qam=16, n_modes=2, os=1, snr=0, seed=None, rng=None):
     """
     Generates a QAMpy signal and converts it into a format that can be easily saved to be read in to the AWG
     :param: sig_len: gives how many data points there are in the signal
@@ -34,13 +48,22 @@ def qampy_sig(sig_len=2 ** 17, freq=40.e9, fs=40.e9, m_qam=16, n_modes=2, os=1,
     :param: n_modes: if 1, then only use X polarisation, if 2, use both X and Y polarisations
     :param: os: freq*os = sampling rate of the signal
     :param: snr: gives the SNR of the signal, if snr=0, then no noise is applied to the signal
+    :param: seed: if given, the signal is generated from this random seed and cached (see Signal_Cache), so repeated
+    runs with the same parameters skip generating and resampling it. Noise is still added on every call
+    :param: rng: numpy Generator (see Random_Streams) that the signal, unless seed is given, and the noise are drawn
+    from. If None, numpy's global random state is used
     :return: sig: the signal generated by QAMpy converted into an array with each row corresponding to 1 channel in the AWG
     """
     # qam_sig = signals.SignalQAMGrayCoded(m_qam, sig_len, nmodes=n_modes, fb=freq)
-    qam_sig = signals.ResampledQAM(m_qam, sig_len, nmodes=2, fb=freq, fs=fs,
-                                   resamplekwargs={"beta": 0.01, "renormalise": True})
+    if seed is None:
+        qam_sig = signals.ResampledQAM(m_qam, sig_len, nmodes=2, fb=freq, fs=fs, seed=Random_Streams.int_seed(rng),
+                                       resamplekwargs={"beta": 0.01, "renormalise": True})
+    else:
+        qam_sig = Signal_Cache.get_signal(signals.SignalQAMGrayCoded, m_qam, sig_len, nmodes=2, fb=freq, fs=fs,
+                                          beta=0.01, renormalise=True, seed=seed)
     if snr != 0:
-        qam_sig = impairments.change_snr(qam_sig, snr)
+        with Random_Streams.seeded_global(rng):
+            qam_sig = impairments.change_snr(qam_sig, snr)
 
     # convert qam_signal to an easily readable format, ie. arr(4, sig_len)
     sig = np.zeros(shape=(n_modes * 2, len(qam_sig[0])))
@@ -50,7 +73,8 @@ def qampy_sig(sig_len=2 ** 17, freq=40.e9, fs=40.e9, m_qam=16, n_modes=2, os=1,
     return sig
 
 
-def saveToFile(arr, seg_len, n_modes=1, complex=False, filename="test_sig.txt"):
+def saveToFile(arr, seg_len, n_modes=1, complex=False, filename="test_sig.txt", file_format="txt", dac_bits=14,
+               compress=False):
     """
     Saves an array for use in AWG to a file to be uploaded
     :param: arr: an array of waveform data that is to be run on an AWG
@@ -58,6 +82,11 @@ def saveToFile(arr, seg_len, n_modes=1, complex=False, filename="test_sig.txt"):
     :param: n_modes: gives the number of polarisations of the signal, ie. 1 if only X component, 2 if both X and Y components
     :param: complex: if True, the signal has both real and complex components, else it only has real components
     :param: filename: The name of the file that the data is to be saved to
+    :param: file_format: "txt" for the AWG's text import format, "bin" for its binary import format, or "qwf" for the
+    compact transfer format that server.py expands for the AWG (see Waveform_Format). Binary and compact files are
+    written with one thread per channel and the waveform length must be a multiple of seg_len
+    :param: dac_bits: resolution of the DAC, only used for the binary and compact formats
+    :param: compress: if True, compact files are also compressed
     :return: filenames: a list of all of the filenames that were saved to
     """
 
@@ -66,6 +95,11 @@ def saveToFile(arr, seg_len, n_modes=1, complex=False, filename="test_sig.txt"):
     elif n_modes != 1 and n_modes != 2:
         n_modes = 1
 
+    if file_format in ["bin", "qwf"]:
+        return saveToBinaryFiles(arr, seg_len, n_modes, complex, filename, dac_bits, file_format, compress)
+    elif file_format != "txt":
+        raise ValueError("unknown file format '%s', should be 'txt', 'bin' or 'qwf'" % file_format)
+
     file_append = ['XI.txt', 'XQ.txt', 'YI.txt',
                    'YQ.txt']  # to be added to end of filename if there is more than 1 file
     filename = filename.rstrip(".txt")  # removes .txt from end of file so that subheadings can be added
@@ -99,83 +133,268 @@ def saveToFile(arr, seg_len, n_modes=1, complex=False, filename="test_sig.txt"):
         return filenames
 
 
-def checkFile(filename):
-    count1 = 0
-    count = 0
-    with open(filename, "r") as file:
-        for line in file:
-            end_str = line.rstrip()[-1:]
-            if end_str == "1":
-                print("1 at line %d" % count)
-                count1 += 1
-            count += 1
-    ratio = count1 / count
-    print("ratio is %.6f" % ratio)
-    print("num of 1's is %d" % count1)
-    return [count, count1, ratio]
+def saveToBinaryFiles(arr, seg_len, n_modes=1, complex=False, filename="test_sig.bin", dac_bits=14, file_format="bin",
+                      compress=False):
+    """
+    Saves an array for use in AWG to binary files, writing each channel concurrently
+    All channels share the same DAC scaling so that the relative amplitude of I and Q is kept
+    :param: arr: an array of waveform data that is to be run on an AWG
+    :param: seg_len: The length of a segment in the waveform. The waveform length must be a multiple of this value
+    :param: n_modes: gives the number of polarisations of the signal, ie. 1 if only X component, 2 if both X and Y components
+    :param: complex: if True, the signal has both real and complex components, else it only has real components
+    :param: filename: The name of the file that the data is to be saved to
+    :param: dac_bits: resolution of the DAC in bits
+    :param: file_format: "bin" for the AWG's binary import format, or "qwf" for the compact transfer format
+    :param: compress: if True, compact files are also compressed
+    :return: filenames: a list of all of the filenames that were saved to
+    """
+    arr = np.atleast_2d(arr)
+    if arr.shape[1] % seg_len != 0:
+        raise ValueError("waveform length %d is not a multiple of the segment length %d" % (arr.shape[1], seg_len))
+
+    ext = "." + file_format
+    file_append = ['XI' + ext, 'XQ' + ext, 'YI' + ext, 'YQ' + ext]
+    filename = os.path.splitext(filename)[0]  # removes extension so that subheadings can be added
+
+    n_files = n_modes * (int(complex) + 1)  # gets number of files to be built from signal
+    if n_files == 1:
+        filenames = [filename + ext]
+    elif n_modes == 1:  # only X components
+        filenames = [filename + file_append[i * 2] for i in range(n_files)]
+    else:  # both X and Y components
+        filenames = [filename + file_append[i] for i in range(n_files)]
+
+    full_scale = np.max(np.abs(arr[:n_files]))  # common scale for all channels
+    with ThreadPoolExecutor(max_workers=n_files) as pool:
+        if file_format == "qwf":
+            jobs = [pool.submit(writeCompactChannel, filenames[i], arr[i], seg_len, dac_bits, full_scale, compress)
+                    for i in range(n_files)]
+        else:
+            jobs = [pool.submit(writeBinaryChannel, filenames[i], arr[i], seg_len, dac_bits, full_scale)
+                    for i in range(n_files)]
+        return [job.result() for job in jobs]
+
+
+def checkFile(filename, seg_len=None):
+    """
+    Checks the markers of a waveform file in any of the AWG formats, see Waveform_Format.validateWaveformFile
+    :param filename: name of the waveform file
+    :param seg_len: length of a segment of the waveform. If None, the spacing of the first two markers is used
+    :return: [number of samples, number of markers, ratio of markers to samples]
+    """
+    summary = validateWaveformFile(filename, seg_len)
+    print("ratio is %.6f" % summary.ratio)
+    print("num of 1's is %d" % summary.n_markers)
+    if not summary.valid:
+        print("%d misplaced and %d missing markers, first error at sample %d, length is %sa multiple of %d" % (
+            summary.misplaced, summary.missing, summary.first_error, "" if summary.length_ok else "not ",
+            summary.seg_len))
+    return [summary.n_samples, summary.n_markers, summary.ratio]
 
 
-def getDataFromOsc(osc, channels=None, MAX_LENGTH=1e4):
+def getWaveformScaling(osc):
+    """
+    Gets the time and voltage conversion factors of the current waveform source
+    :param osc: oscilloscope VISA resource
+    :return: [xInc, xOrg, yInc, yOrg]
+    """
+    xInc = float(osc.query(":WAVeform:XINCrement?"))
+    xOrg = float(osc.query(":WAVeform:XORigin?"))
+    yInc = float(osc.query(":WAVeform:YINCrement?"))
+    yOrg = float(osc.query(":WAVeform:YORigin?"))
+    return [xInc, xOrg, yInc, yOrg]
+
+
+def getDataFromOsc(osc, channels=None, MAX_LENGTH=1e4, binary=False, word=True):
     """
     Gets the waveform data from the oscilloscope and stores it in a 2D list
     :param osc: oscilloscope VISA resource
     :param channels: list of all channels to be read
     :param MAX_LENGTH: Maximum length of data to be read from the oscilloscope for each channel
+    :param binary: if True, the data is transferred as binary integers rather than ASCII text, see getDataFromOscBinary
+    :param word: if True, binary transfers use 16-bit words, else 8-bit bytes
     :return:
     """
     if channels is None:
         channels = [1]
+    if binary:
+        return getDataFromOscBinary(osc, channels, word)
     data = []
 
+    # each channel is preallocated once its length is known, and filled in block by block
+    channel_data = None
+    for [channel, offset, block, wave_points] in streamDataFromOsc(osc, channels, MAX_LENGTH, binary=False):
+        if offset == 0:  # first block of a new channel
+            print("number of points: %d" % wave_points)
+            channel_data = np.empty(wave_points)
+            data.append(channel_data[1:])
+        channel_data[offset:offset + len(block)] = block
+
+    # osc.write(":SYSTem:HEADer ON")      # turns system headers back on
+    return data
+
+
+def streamDataFromOsc(osc, channels=None, block_size=1e4, n_buffers=4, binary=True, word=True, prefetch=False):
+    """
+    Streams waveform data from the oscilloscope one fixed-size block at a time. Each block is converted to volts into a
+    ring of n_buffers preallocated arrays, so memory stays bounded for any number of wave points
+    Blocks are views into the ring. Without prefetch a block stays valid until n_buffers more blocks have been yielded.
+    With prefetch, later blocks are read in a background thread while earlier ones are processed, and a block is only
+    valid until the next one is requested
+    :param osc: oscilloscope VISA resource
+    :param channels: list of all channels to be read
+    :param block_size: number of points in each block
+    :param n_buffers: number of block buffers in the ring, should be at least 3 when prefetch is used
+    :param binary: if True, blocks are transferred as binary integers, else as ASCII text
+    :param word: if True, binary transfers use 16-bit words, else 8-bit bytes
+    :param prefetch: if True, blocks are read from the oscilloscope in a background thread
+    :return: generator of [channel, offset, block, wave_points], where offset is the index of the first point of block
+    """
+    if channels is None:
+        channels = [1]
+    block_size = int(block_size)
+    ring = np.empty(shape=(n_buffers, block_size))
+    blocks = readBlocksFromOsc(osc, channels, block_size, ring, binary, word)
+    if not prefetch:
+        yield from blocks
+        return
+
+    if n_buffers < 3:
+        raise ValueError("prefetching needs at least 3 buffers, got %d" % n_buffers)
+    # the consumer holds 1 block and the reader fills 1 block, so at most n_buffers-2 blocks can wait in the queue
+    block_queue = queue.Queue(maxsize=n_buffers - 2)
+    stop = threading.Event()
+
+    def put(item):
+        # waits for space in the queue unless the consumer has stopped, returns False if it has
+        while not stop.is_set():
+            try:
+                block_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def reader():
+        try:
+            for item in blocks:
+                if not put(item):
+                    return
+        except Exception as err:  # passes errors on to the consumer
+            put(err)
+            return
+        put(None)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = block_queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def readBlocksFromOsc(osc, channels, block_size, ring, binary=True, word=True):
+    """
+    Reads the given channels from the oscilloscope in blocks of block_size points, converting each block to volts into
+    the next row of ring. Used by streamDataFromOsc
+    :return: generator of [channel, offset, block, wave_points]
+    """
     # sets transfer formats
-    osc.write(":WAVeform:FORMat ASCii")  # sends data as 16-bit signed ints
+    if not binary:
+        osc.write(":WAVeform:FORMat ASCii")  # sends data as comma separated text
+    elif word:
+        osc.write(":WAVeform:FORMat WORD")  # sends data as 16-bit signed ints
+    else:
+        osc.write(":WAVeform:FORMat BYTE")  # sends data as 8-bit signed ints
+    datatype = "h" if word else "b"
     osc.write(":WAVeform:BYTeorder LSBFirst")  # sends LSB first
-    osc.write(":WAVeform:STReaming 0")  # turns on waveform streaming of data
+    osc.write(":WAVeform:STReaming 0")  # turns off waveform streaming of data
     osc.write(":SYSTem:HEADer OFF")  # turns off system headers to allow numeric data to be read correctly
 
+    n_buffers = len(ring)
+    slot = 0
     for i in range(len(channels)):
         osc.write(":WAVeform:SOURce CHANnel%d" % channels[i])  # defines which channel is to be read from
-        # osc.write(":DIGitize CHANnel%d" % channels[i])                  # digitizes channel to make it easier to read
-        # osc.write(":CHANnel%d:DISPlay ON" % channels[i])                # turns channel display back on, as digitize turns it off automatically
 
         # get voltage and time conversion factors
-        xInc = osc.query(":WAVeform:XINCrement?")
-        xOrg = osc.query(":WAVeform:XORigin?")
-        yInc = osc.query(":WAVeform:YINCrement?")
-        yOrg = osc.query(":WAVeform:YORigin?")
+        [xInc, xOrg, yInc, yOrg] = getWaveformScaling(osc)
 
         # get waveform info
         wave_points = int(osc.query(":wav:points?"))
-        print("number of points: %d" % wave_points)
-        # block_size = int(min(math.pow(math.ceil(math.log(wave_points, 2)), 2), MAX_LENGTH))
-        block_size = MAX_LENGTH
-        block_count = int(max(1, wave_points / block_size))
-        print("block count: %d" % block_count)
-        tmp_data = np.zeros(shape=(wave_points + 1, 1))
-        x_list = []
+        block_count = int(max(1, math.ceil(wave_points / block_size)))
         for block_num in range(block_count):
-            # print("block %d" % block_num)
-            start_point = int(block_num * block_size + 1)  # start point of current block
-            # print("start: %d" % start_point)
-            end_point = int(min(start_point + block_size - 1, wave_points))  # end point of current block
-            # print("end : %d" % end_point)
+            start_point = block_num * block_size + 1  # start point of current block
+            end_point = min(start_point + block_size - 1, wave_points)  # end point of current block
             size = end_point - start_point + 1
-            # print("block size: %d" % size)
-            x = osc.query(":WAVeform:DATA? %d,%d" % (start_point, size))
-            x_list.extend(x.split(","))
-            # print(x)
-            # tmp_data[start_point:end_point] = osc.query(":WAVeform:DATA? %d,%d" % (start_point, size))   # requests data from the oscilloscope
-        tmp_data = convertToFloat(x_list)
-        data.append(tmp_data[1:])
-
-        # find # and 0 chars
-        # start_found = False
-        # curr_char = 0
-        # while not start_found:
-        # read a byte, and check that it is the current byte to be found, if it is move onto next char to be found
-        # once all chars have been found, move on to reading data
+            block = ring[slot, :size]
+            if binary:
+                raw = osc.query_binary_values(":WAVeform:DATA? %d,%d" % (start_point, size), datatype=datatype,
+                                              is_big_endian=False, container=np.array, data_points=size)
+                np.multiply(raw, yInc, out=block)
+                block += yOrg
+            else:
+                x = osc.query(":WAVeform:DATA? %d,%d" % (start_point, size))
+                block[:] = [value for value in x.split(",") if value.strip()]  # values are already in volts
+            yield [channels[i], start_point - 1, block, wave_points]
+            slot = (slot + 1) % n_buffers
 
-    # osc.write(":SYSTem:HEADer ON")      # turns system headers back on
+
+def getDataFromOscBinary(osc, channels=None, word=True, return_time=False):
+    """
+    Gets the waveform data from the oscilloscope using binary block transfers and stores it in a 2D list
+    Each channel is read in a single transfer and converted to volts in one vectorized operation, giving the same
+    arrays as the ASCII transfer in getDataFromOsc
+    :param osc: oscilloscope VISA resource
+    :param channels: list of all channels to be read
+    :param word: if True, data is sent as 16-bit signed ints (WORD), else as 8-bit signed ints (BYTE)
+    :param return_time: if True, also returns the time of each sample, built from XINCrement and XORigin
+    :return: data: list with the waveform of each channel in volts, and if return_time is True, a list of sample times
+    """
+    if channels is None:
+        channels = [1]
+    data = []
+    times = []
+
+    # sets transfer formats
+    if word:
+        osc.write(":WAVeform:FORMat WORD")  # sends data as 16-bit signed ints
+        datatype = "h"
+    else:
+        osc.write(":WAVeform:FORMat BYTE")  # sends data as 8-bit signed ints
+        datatype = "b"
+    osc.write(":WAVeform:BYTeorder LSBFirst")  # sends LSB first
+    osc.write(":WAVeform:STReaming 0")  # turns off waveform streaming of data
+    osc.write(":SYSTem:HEADer OFF")  # turns off system headers to allow numeric data to be read correctly
+
+    for i in range(len(channels)):
+        osc.write(":WAVeform:SOURce CHANnel%d" % channels[i])  # defines which channel is to be read from
+
+        # get voltage and time conversion factors
+        [xInc, xOrg, yInc, yOrg] = getWaveformScaling(osc)
+
+        # get waveform info
+        wave_points = int(osc.query(":wav:points?"))
+
+        # reads the whole channel as one binary block and converts it to volts
+        raw = osc.query_binary_values(":WAVeform:DATA?", datatype=datatype, is_big_endian=False,
+                                      container=np.array, data_points=wave_points)
+        volts = np.empty(len(raw))
+        np.multiply(raw, yInc, out=volts)
+        volts += yOrg
+        data.append(volts[1:])  # first point is dropped, as in the ASCII transfer
+
+        if return_time:
+            times.append(xOrg + xInc * np.arange(1, len(raw)))
+
+    if return_time:
+        return [data, times]
     return data
 
 
@@ -224,40 +443,155 @@ def convertToQAMpyWaveform(data, freq, fs, m_qam=16, n_modes=2):
 
 def sendFile(filename, server_ip, server_port, BUFFER_SIZE=4096):
     """
-    Sends a file to a remote server
+    Sends a file to a remote server, using a pooled connection (see sendFiles)
     :param filename: the name of the file that is to be sent
     :param server_ip: the IP address of the server
     :param server_port: server port to send file to
-    :param BUFFER_SIZE: Maximum number of bytes that can be sent at once
+    :param BUFFER_SIZE: no longer used, as the file is sent with socket.sendfile
     :return:
     """
-    # gets the size of the file that is to be sent
-    filesize = os.path.getsize(filename)
-    SEPARATOR = "<SEPARATOR>"
-
-    # attempt to connect to remote server
-    remote = socket.socket()
-    print(f"[+] Connecting to {server_ip}:{server_port}")
-    remote.connect((server_ip, server_port))
-    print("[+] Connected.")
+    sendFiles([filename], server_ip, server_port)
+    return
 
-    # send file details to server
-    remote.send(f"{filename}{SEPARATOR}{filesize}".encode())
 
-    # send file to server
-    with open(filename, 'rb') as file:
-        while True:
-            # read the bytes from the file
-            bytes_read = file.read(BUFFER_SIZE)
-            if not bytes_read:
-                # file transmitting is done
-                break
-            remote.sendall(bytes_read)
-    # close socket
-    remote.close()
+def sendFiles(filenames, server_ip, server_port):
+    """
+    Sends a batch of files to a remote server over a single session, eg. the XI/XQ/YI/YQ files from one saveToFile call
+    The connection is kept open in a pool so that later uploads to the same server don't need to reconnect
+    :param filenames: list of the names of the files that are to be sent
+    :param server_ip: the IP address of the server
+    :param server_port: server port to send files to
+    :return:
+    """
+    session = getUploadSession(server_ip, server_port)
+    try:
+        session.sendMany(filenames)
+    except (BrokenPipeError, ConnectionResetError):
+        # pooled connection may have been dropped by the server since it was last used, so retries on a new one
+        closeUploadSessions()
+        session = getUploadSession(server_ip, server_port)
+        session.sendMany(filenames)
+    except Exception:
+        # eg. a file the server did not confirm, which is passed on, but the session can't be trusted to be reused
+        closeUploadSessions()
+        raise
     return
 
 
+class UploadSession:
+    """
+    Persistent connection to the file server in server.py that can carry any number of files
+    Files are sent with socket.sendfile, so the kernel copies them from disk to the network without passing them
+    through Python
+    """
+
+    def __init__(self, server_ip, server_port, timeout=None):
+        """
+        :param server_ip: the IP address of the server
+        :param server_port: server port to send files to
+        :param timeout: socket timeout in seconds, or None to block
+        """
+        self.address = (server_ip, int(server_port))
+        print(f"[+] Connecting to {server_ip}:{server_port}")
+        self.remote = socket.create_connection(self.address, timeout)
+        self.remote.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # headers are sent without waiting
+        print("[+] Connected.")
+
+    def send(self, filename):
+        """
+        Sends one file and waits for the server to confirm that it was written
+        """
+        self.sendMany([filename])
+
+    def sendMany(self, filenames):
+        """
+        Sends several files back to back, then waits for the server to confirm each of them
+        """
+        filesizes = []
+        for filename in filenames:
+            # send file details to server
+            filesize = os.path.getsize(filename)
+            name = os.path.basename(filename).encode()
+            self.remote.sendall(FILE_HEADER.pack(FILE_MAGIC, len(name), filesize) + name)
+            # send file to server
+            with open(filename, 'rb') as file:
+                self.remote.sendfile(file)
+            filesizes.append(filesize)
+
+        # wait for server to confirm that the whole of each file was written
+        for i, [filename, filesize] in enumerate(zip(filenames, filesizes)):
+            try:
+                ack = recvExactly(self.remote, FILE_ACK.size)
+            except ConnectionResetError:
+                if i == 0:
+                    raise   # nothing was confirmed, so the connection was dropped before the batch
+                raise ConnectionError("connection closed by server after %d of %d files were confirmed"
+                                      % (i, len(filenames)))
+            if FILE_ACK.unpack(ack)[0] != filesize:
+                raise ConnectionError("server did not confirm that %s was received" % filename)
+
+    def close(self):
+        self.remote.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+upload_sessions = {}  # pool of open upload sessions, keyed by server address
+
+
+def getUploadSession(server_ip, server_port):
+    """
+    Gets an open UploadSession to the given server from the pool, connecting if there isn't one yet
+    """
+    address = (server_ip, int(server_port))
+    if address not in upload_sessions:
+        upload_sessions[address] = UploadSession(server_ip, server_port)
+    return upload_sessions[address]
+
+
+def closeUploadSessions():
+    """
+    Closes all pooled upload sessions
+    """
+    for session in upload_sessions.values():
+        session.close()
+    upload_sessions.clear()
+
+
+def recvExactly(remote, n_bytes):
+    """
+    Receives exactly n_bytes from a socket
+    Raises ConnectionResetError if the connection is closed before any of them arrive, or ConnectionError if it is
+    closed part way through
+    """
+    data = bytearray()
+    while len(data) < n_bytes:
+        chunk = remote.recv(n_bytes - len(data))
+        if not chunk:
+            if data:
+                raise ConnectionError("connection closed by server part way through a reply")
+            raise ConnectionResetError("connection closed by server")
+        data += chunk
+    return bytes(data)
+
+
+def openResourceManager(simulate=False, **kwargs):
+    """
+    Gets the VISA resource manager used to access the AWG and oscilloscope
+    :param simulate: if True, gives an Instrument_Simulator.SimulatedResourceManager so that no lab equipment is needed
+    :param kwargs: passed on to SimulatedResourceManager, eg. waveforms, bandwidth and latency
+    :return: resource manager
+    """
+    if simulate:
+        import Instrument_Simulator
+        return Instrument_Simulator.SimulatedResourceManager(**kwargs)
+    return pyvisa.ResourceManager()
+
+
 def plot_constellation(E, title="QPSK signal constellation"):
     """
     Plots signal in a constellation diagram
@@ -279,6 +613,7 @@ if __name__ == "__main__":
     receive_from_oscilloscope = True
     recover_signal = True
     output_results = False
+    simulate = False  # if True, the AWG and oscilloscope are replaced by Instrument_Simulator
 
     awg_name = 'TCPIP0::inst1::INSTR'  # gives the VISA name of the AWG
     osc_name = 'TCPIP0::inst0::INSTR'  # gives the VISA name of the oscilloscope
@@ -328,15 +663,16 @@ if __name__ == "__main__":
 
     if send_to_awg:
         # access AWG
-        rm = pyvisa.ResourceManager()
+        rm = openResourceManager(simulate)
         available_instruments = rm.list_resources()
         # check if awg is reachable
         if awg_name in available_instruments:
             awg = rm.open_resource(awg_name)  # open connection to AWG
             print(awg.query('*IDN?'))  # confirm that communication is possible
 
-            # upload files to computer (use sockets)
-            sendFile("qam_sigXI.txt", server_ip, server_port)
+            # upload files to computer (use sockets), the simulated AWG reads them from the local directory
+            if not simulate:
+                sendFiles(["qam_sigXI.txt", "qam_sigXQ.txt", "qam_sigYI.txt", "qam_sigYQ.txt"], server_ip, server_port)
 
             # run file
             # awg.write(':TRAC1:IMP 1, "C:\Sin10MHzAt64GHz.bin", BIN, IONLY, ON, ALEN')
@@ -350,7 +686,7 @@ if __name__ == "__main__":
 
     if receive_from_oscilloscope:
         if not send_to_awg:
-            rm = pyvisa.ResourceManager()
+            rm = openResourceManager(simulate)
             available_instruments = rm.list_resources()
 
         if osc_name in available_instruments:
@@ -360,7 +696,7 @@ if __name__ == "__main__":
 
             # get data file from oscilloscope
             try:
-                sig = getDataFromOsc(osc, channels=[1, 2, 3, 4])
+                sig = getDataFromOsc(osc, channels=[1, 2, 3, 4], binary=True)
                 # convert sig data to QAMpy signal
                 print(sig)
                 print("signal length: %d" % len(sig[0]))
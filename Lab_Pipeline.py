@@ -0,0 +1,272 @@
+"""
+Runs the lab flow as a pipeline, so that the instruments and the CPU are kept busy at the same time.
+Each stage runs in its own thread with bounded queues between stages, so while waveform k is being captured, waveform
+k+1 is generated and uploaded and waveform k-1 is recovered.
+Importing a waveform into the AWG and capturing it are done in the same stage, as the AWG has to keep playing waveform k
+until its capture is finished.
+"""
+
+import os
+import queue
+import sys
+import threading
+from timeit import default_timer as timer
+
+import numpy as np
+
+import Lab_Automation
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "files"))
+import Capture_Archive
+
+STOP = object()  # passed down the pipeline once there are no more items
+
+
+class StageStats:
+    """
+    Throughput of one pipeline stage
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0  # number of items processed
+        self.busy = 0.0  # time spent processing items, in seconds
+        self.wall = 0.0  # time the pipeline ran for, in seconds
+
+    def throughput(self):
+        """
+        Items processed per second of the pipeline's run
+        """
+        return self.items / self.wall if self.wall else 0.0
+
+    def utilisation(self):
+        """
+        Fraction of the pipeline's run that the stage spent processing items
+        """
+        return self.busy / self.wall if self.wall else 0.0
+
+    def __repr__(self):
+        return "%s: %d items, %.3f items/s, %.1f%% busy, %.3f s per item" % (
+            self.name, self.items, self.throughput(), 100 * self.utilisation(),
+            self.busy / self.items if self.items else 0.0)
+
+
+class Pipeline:
+    """
+    Runs items through a list of stages, with each stage in its own thread
+    """
+
+    def __init__(self, stages, queue_size=1):
+        """
+        :param stages: list of [name, function] pairs. Each function takes the output of the previous stage
+        :param queue_size: maximum number of items waiting between 2 stages, which bounds the memory used
+        """
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats = [StageStats(name) for [name, function] in stages]
+
+    def run(self, items):
+        """
+        Runs each of items through every stage
+        :param items: iterable of inputs to the first stage
+        :return: results: list of the outputs of the last stage, in the same order as items
+        """
+        self.stats = [StageStats(name) for [name, function] in self.stages]
+        queues = [queue.Queue(maxsize=self.queue_size) for i in range(len(self.stages))]
+        results = queue.Queue()
+        queues.append(results)
+        stop = threading.Event()
+        errors = []
+
+        def feed():
+            try:
+                for item in items:
+                    if not put(queues[0], item, stop):
+                        return
+            except Exception as err:
+                # eg. a generator of items that fails part way, which would otherwise leave the stages waiting
+                errors.append(err)
+                stop.set()
+                return
+            put(queues[0], STOP, stop)
+
+        def work(i, function):
+            stats = self.stats[i]
+            while True:
+                item = get(queues[i], stop)
+                if item is STOP:
+                    break
+                start = timer()
+                try:
+                    item = function(item)
+                except Exception as err:
+                    errors.append(err)
+                    stop.set()
+                    break
+                stats.busy += timer() - start
+                stats.items += 1
+                if not put(queues[i + 1], item, stop):
+                    break
+            put(queues[i + 1], STOP, stop)
+
+        start = timer()
+        threads = [threading.Thread(target=feed, daemon=True)]
+        threads += [threading.Thread(target=work, args=(i, function), daemon=True)
+                    for i, [name, function] in enumerate(self.stages)]
+        for thread in threads:
+            thread.start()
+
+        output = []
+        while True:
+            item = get(results, stop)
+            if item is STOP:
+                break
+            output.append(item)
+        for thread in threads:
+            thread.join()
+
+        for stats in self.stats:
+            stats.wall = timer() - start
+        if errors:
+            raise errors[0]
+        return output
+
+    def printStats(self):
+        for stats in self.stats:
+            print(stats)
+
+
+def put(item_queue, item, stop):
+    """
+    Puts item in item_queue, giving up if stop is set while waiting for space
+    :return: True if the item was added
+    """
+    while not stop.is_set():
+        try:
+            item_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def get(item_queue, stop):
+    """
+    Gets the next item from item_queue, or STOP if stop is set while waiting for one
+    """
+    while not stop.is_set():
+        try:
+            return item_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return STOP
+
+
+def captureModes(capture):
+    """
+    Combines the channels of a capture into the complex modes stored by Capture_Archive, taking pairs of channels as
+    the I and Q of a mode as in Lab_Automation.convertToQAMpyWaveform. An odd number of channels are each stored as a
+    real mode
+    :param capture: list of the waveform of each channel, as from Lab_Automation.getDataFromOsc
+    :return: modes: complex array of shape (nmodes, number of points)
+    """
+    data = np.asarray(capture, dtype=np.float64)
+    if len(data) % 2:
+        return data.astype(np.complex128)
+    return data[0::2] + 1j * data[1::2]
+
+
+def labPipeline(awg, osc, server_ip, server_port, seg_len=64, channels=None, fb=15e9, fosc=80e9, m_qam=16,
+                file_format="txt", awg_dir="C:\\", queue_size=1, recover=None, archive=None):
+    """
+    Builds a pipeline for a measurement campaign, in which each item is a dictionary of arguments for
+    Lab_Automation.qampy_sig, and each result is a dictionary holding the captured data and recovered signal
+        generate: builds the waveform with qampy_sig
+        upload: saves the waveform with saveToFile and sends it to the AWG's file server with sendFiles
+        acquire: imports the waveform into the AWG, triggers a new capture and reads it with getDataFromOsc, then
+            appends it to archive if one is given
+        recover: converts the capture to a QAMpy signal with convertToQAMpyWaveform, or runs recover on it
+    :param awg: AWG VISA resource
+    :param osc: oscilloscope VISA resource
+    :param server_ip: the IP address of the AWG's file server
+    :param server_port: port of the AWG's file server
+    :param seg_len: length of a segment of the signal
+    :param channels: list of the oscilloscope channels to be read
+    :param fb: symbol rate of the signal
+    :param fosc: sample rate of the oscilloscope
+    :param m_qam: QAM order of the signal
+    :param file_format: format of the uploaded files, "txt", "bin" or "qwf" (which the server expands to txt)
+    :param awg_dir: directory on the AWG's computer that the server saves files to
+    :param queue_size: maximum number of waveforms waiting between 2 stages
+    :param recover: function called with the capture, if None convertToQAMpyWaveform is used
+    :param archive: Capture_Archive.CaptureArchive, or its path, that every capture is appended to with its QAM order
+        and SNR, so the campaign can be reprocessed offline. The id of each capture is stored in its result. If None,
+        captures are only kept in the results
+    :return: pipeline: Pipeline of the 4 stages
+    """
+    if channels is None:
+        channels = [1, 2, 3, 4]
+    if isinstance(archive, str):
+        archive = Capture_Archive.CaptureArchive(archive)
+    counter = iter(range(2 ** 63))
+    import_format = "BIN" if file_format == "bin" else "TXT"
+
+    def generate(params):
+        k = next(counter)
+        return {"index": k, "params": params, "wave": Lab_Automation.qampy_sig(**params)}
+
+    def upload(item):
+        # each waveform gets its own files, so they can be uploaded while the previous ones are playing
+        filename = "wave%d" % item["index"]
+        filenames = Lab_Automation.saveToFile(item.pop("wave"), seg_len, n_modes=2, complex=True, filename=filename,
+                                              file_format=file_format)
+        Lab_Automation.sendFiles(filenames, server_ip, server_port)
+        for filename in filenames:
+            os.remove(filename)
+        if file_format == "qwf":  # server expands files into the text format
+            filenames = [os.path.splitext(filename)[0] + ".txt" for filename in filenames]
+        item["files"] = filenames
+        return item
+
+    def acquire(item):
+        for channel, filename in enumerate(item["files"]):
+            awg.write(':TRAC%d:IMP 1, "%s", %s, IONLY, ON, ALEN' % (channel + 1, awg_dir + filename, import_format))
+        # captures the new waveform, waiting for the acquisition to finish so that the previous one isn't read
+        osc.write(":DIGitize")
+        osc.query("*OPC?")
+        item["capture"] = Lab_Automation.getDataFromOsc(osc, channels, binary=True)
+        if archive is not None:
+            item["capture_id"] = archive.append(captureModes(item["capture"]), item["params"].get("m_qam", m_qam),
+                                                item["params"].get("snr", 0), fosc)
+        return item
+
+    def recover_stage(item):
+        if recover is None:
+            item["sig"] = Lab_Automation.convertToQAMpyWaveform(item["capture"], fb, fosc, m_qam, n_modes=2)
+        else:
+            item["sig"] = recover(item["capture"])
+        return item
+
+    stages = [["generate", generate], ["upload", upload], ["acquire", acquire], ["recover", recover_stage]]
+    return Pipeline(stages, queue_size)
+
+
+if __name__ == "__main__":
+    awg_name = 'TCPIP0::inst1::INSTR'  # gives the VISA name of the AWG
+    osc_name = 'TCPIP0::inst0::INSTR'  # gives the VISA name of the oscilloscope
+    server_ip = "192.168.0.1"
+    server_port = 5001
+    seg_len = 64  # length of a segment of the signal
+    snrs = [14, 16, 18, 20, 22, 24]  # SNR of each waveform in the campaign
+
+    rm = Lab_Automation.openResourceManager()
+    awg = rm.open_resource(awg_name)
+    osc = rm.open_resource(osc_name)
+    archive_path = os.path.join("captures", "campaign")   # captures are kept here for offline reprocessing
+    pipeline = labPipeline(awg, osc, server_ip, server_port, seg_len, archive=archive_path)
+    params = [{"sig_len": 100 * seg_len, "freq": 10e9, "fs": 60e9, "m_qam": 64, "n_modes": 2, "os": 6, "snr": snr}
+              for snr in snrs]
+    results = pipeline.run(params)
+    pipeline.printStats()
+    awg.close()
+    osc.close()
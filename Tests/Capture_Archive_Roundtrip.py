@@ -0,0 +1,58 @@
+"""
+Checks that captures appended to a capture archive are read back unchanged by load and iter_captures, that find picks
+out captures by their parameters, and that an archive can be reopened and appended to
+"""
+
+import numpy as np
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "files"))
+import Capture_Archive
+
+
+if __name__ == "__main__":
+    nmodes = 2              # number of polarisations
+    n_samples = 5000        # samples per mode of the first capture
+    M = [4, 16, 64]         # QAM orders of the captures
+    snrs = [14, 18, 22]     # SNR of the captures
+    fs = 80e9               # sample rate of the scope
+    rng = np.random.default_rng(1)
+    path = os.path.join(tempfile.mkdtemp(), "archive", "captures")
+
+    # captures of different lengths, appended in one session
+    archive = Capture_Archive.CaptureArchive(path)
+    captures = {}
+    for i, [M_i, snr] in enumerate([(M_i, snr) for M_i in M for snr in snrs]):
+        data = rng.standard_normal((nmodes, 2 * (n_samples + i))).view(np.complex128)
+        capture_id = archive.append(data, M_i, snr, fs, timestamp=1000.0 + i)
+        captures[capture_id] = [data, M_i, snr]
+    assert len(archive) == len(captures), "archive holds %d captures, not %d" % (len(archive), len(captures))
+
+    for capture_id, [data, M_i, snr] in captures.items():
+        [loaded, record] = archive.load(capture_id)
+        assert loaded.dtype == Capture_Archive.DATA_DTYPE, "capture read back as %s" % loaded.dtype
+        assert np.array_equal(loaded, data), "capture %d changed in the archive" % capture_id
+        assert record["M"] == M_i and record["snr"] == snr and record["fs"] == fs and record["nmodes"] == nmodes
+
+    # find searches the index only, and iter_captures gives the captures it finds in order
+    found = archive.find(M=16)
+    assert sorted(found) == [k for k, capture in captures.items() if capture[1] == 16], "find(M=16) gave %s" % found
+    found = archive.find(snr=22, since=1003.0, until=1008.0)
+    assert sorted(found) == [5, 8], "find(snr=22, since, until) gave %s" % found
+    assert len(archive.find(M=256)) == 0, "find matched a QAM order that isn't in the archive"
+    for capture_id, [data, record] in zip(found, archive.iter_captures(found)):
+        assert record["id"] == capture_id and np.array_equal(data, captures[capture_id][0])
+    assert sum(1 for capture in archive.iter_captures()) == len(captures), "iter_captures skipped captures"
+
+    # reopening finds the same captures, and appends after them
+    archive = Capture_Archive.CaptureArchive(path)
+    assert len(archive) == len(captures), "reopened archive holds %d captures" % len(archive)
+    data = rng.standard_normal((1, 2 * n_samples)).view(np.complex128)
+    capture_id = archive.append(data[0], 16, 30, fs)    # 1D data is stored as one mode
+    assert capture_id == len(captures), "appended capture got id %d, not %d" % (capture_id, len(captures))
+    assert np.array_equal(archive.load(capture_id)[0], data), "capture appended after reopening changed"
+    assert np.array_equal(archive.load(0)[0], captures[0][0]), "appending changed an earlier capture"
+    assert list(archive.find(snr=30)) == [capture_id], "find missed the capture appended after reopening"
+    print("Captures round trip through the archive, including after reopening it")
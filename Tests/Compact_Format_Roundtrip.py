@@ -0,0 +1,52 @@
+"""
+Checks that a waveform sent in the compact .qwf format and expanded by the server gives the same AWG file as the text
+format written by saveToFile, and compares the size of the files that are transferred
+"""
+
+import numpy as np
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import Lab_Automation
+import Waveform_Format
+
+
+if __name__ == "__main__":
+    seg_len = 64            # length of a segment of the signal
+    sig_len = 1000*seg_len  # number of samples in each channel
+    dac_bits = 8            # resolution of the AWG's DAC
+    arr = np.random.randn(4, sig_len)   # XI, XQ, YI, YQ channels
+    out_dir = tempfile.mkdtemp()
+
+    # text path, with samples already quantized to the DAC as the AWG would do
+    full_scale = np.max(np.abs(arr))
+    step = Waveform_Format.codeStep(dac_bits, full_scale)
+    quantized = Waveform_Format.toDACCodes(arr, dac_bits, full_scale) * step
+    txt_files = Lab_Automation.saveToFile(quantized, seg_len, n_modes=2, complex=True,
+                                          filename=os.path.join(out_dir, "text_sig"))
+
+    for compress in [False, True]:
+        # compact path, expanded to text as done by server.py
+        qwf_files = Lab_Automation.saveToFile(arr, seg_len, n_modes=2, complex=True,
+                                              filename=os.path.join(out_dir, "compact_sig"), file_format="qwf",
+                                              dac_bits=dac_bits, compress=compress)
+        for txt_file, qwf_file in zip(txt_files, qwf_files):
+            expanded_file = Waveform_Format.expandCompactFile(qwf_file, "txt")
+            with open(txt_file, "rb") as txt, open(expanded_file, "rb") as expanded:
+                assert txt.read() == expanded.read(), "%s does not match %s" % (expanded_file, txt_file)
+
+        txt_size = sum(os.path.getsize(f) for f in txt_files)
+        qwf_size = sum(os.path.getsize(f) for f in qwf_files)
+        print("compress: %s, text: %d bytes, compact: %d bytes, %.1fx smaller" % (compress, txt_size, qwf_size,
+                                                                               txt_size / qwf_size))
+
+    # binary expansion matches the binary format written on the host
+    bin_files = Lab_Automation.saveToFile(arr, seg_len, n_modes=2, complex=True,
+                                          filename=os.path.join(out_dir, "binary_sig"), file_format="bin",
+                                          dac_bits=dac_bits)
+    for bin_file, qwf_file in zip(bin_files, qwf_files):
+        expanded_file = Waveform_Format.expandCompactFile(qwf_file, "bin")
+        assert np.array_equal(np.fromfile(bin_file, "<i2"), np.fromfile(expanded_file, "<i2"))
+    print("Expanded files match")
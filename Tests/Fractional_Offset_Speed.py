@@ -0,0 +1,51 @@
+"""
+Checks that frac_offset with method "fft", which resamples once to the scope rate and delays there, is faster than
+method "roll", which upsamples by upsample_mult, shifts and resamples again, and that the two agree for shifts of a
+whole number of upsampled samples
+"""
+
+from qampy import signals
+import numpy as np
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "files"))
+import Impairments
+import Resampling
+
+
+if __name__ == "__main__":
+    M = 16              # QAM order
+    N = 2**16           # number of symbols
+    fb = 40*10**9       # baud rate (symbols / s)
+    f_scope = 80*10**9  # scope sample frequency
+    nmodes = 2          # number of polarisations
+    upsample_mult = 8   # upsampling of the roll method
+    repeats = 5         # number of timed runs of each method
+    edges = 1000        # samples dumped from either end, where the filters of the two paths see different padding
+
+    sig = signals.SignalQAMGrayCoded(M, N, nmodes=nmodes, fb=fb, seed=1)
+
+    # timing, with the same seed for each method so both see the same draws
+    times = {}
+    for method in ["roll", "fft"]:
+        start = time.perf_counter()
+        for i in range(repeats):
+            out = Impairments.frac_offset(sig, f_scope, upsample_mult, nmodes, rng=i, method=method)
+        times[method] = (time.perf_counter() - start) / repeats
+        assert out.fs == f_scope, "%s path gives a sample rate of %g, not the scope rate" % (method, out.fs)
+        print("%s: %.3f s" % (method, times[method]))
+    assert times["fft"] < times["roll"], "fft path is slower than roll"
+
+    # agreement for whole-sample shifts, both starting from the same upsampled signal. A delay commutes with the
+    # resampling, so the roll then resample matches the resample then fft delay away from the ends
+    upsampled = Resampling.resample_signal(sig, fb*upsample_mult, beta=0.1, renormalise=True)
+    resampled = Resampling.resample_signal(upsampled, f_scope, beta=0.1, renormalise=True)
+    for shift in range(1, upsample_mult - 1):
+        rolled = Resampling.resample_signal(Impairments.delay(upsampled, shift, nmodes), f_scope, beta=0.1,
+                                            renormalise=True)
+        delayed = Impairments.fractional_delay(resampled, shift / upsample_mult, "fft")
+        error = np.max(np.abs(rolled[:, edges:-edges] - delayed[:, edges:-edges])) / np.max(np.abs(rolled))
+        assert error < 1e-3, "fft delay differs from roll by %g for a shift of %d samples" % (error, shift)
+    print("fft path is %.1f times faster than roll and agrees with it" % (times["roll"] / times["fft"]))
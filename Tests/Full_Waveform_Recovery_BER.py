@@ -11,7 +11,7 @@ import math
 from bokeh.io import output_notebook
 from bokeh.plotting import figure, show
 import os
-import random
+import Random_Streams
 import Generate_Signal
 import Receive_Signal
 import Impairments
@@ -38,33 +38,17 @@ def copy_sig(sig, n):
     sig : SignalQAMGrayCoded
         Signal to have its data copied and then rebuilt
     n : float
-        number of times signal should be copied. For full waveform recovery, n>=2
+        number of times signal should be copied, any real n >= 1. For full waveform recovery, n>=2
 
     Output
     ---------------------------------------------
     rebuilt_sig : SignalQAMGrayCoded
         Signal that has the data of sig copied n times
     """
-    sig_temp = sig  # gets temporary signal 
+    return Generate_Signal.copy_sig(sig, n)
 
-    # checks if n is a whole number
-    if math.floor(n) == n:
-        sig_temp = np.tile(sig_temp, n)
 
-    # not currently working, to be fixed
-    else:       # if n is a fraction
-        slice = math.floor((n % 1) * len(sig_temp))   # gets how many array elements are in fractional part of n
-        frac_temp = sig_temp[:slice]    # gets copy of signal of length equal to fractional part of n
-        sig_temp = np.tile(sig_temp, math.floor(n)) # gets floor(n) copies of original signal
-        sig_temp = np.append(sig_temp, frac_temp)   # combines fractional and whole copies of signal
-        print(sig[0])
-        print(frac_temp[0])
-
-    rebuilt_sig = sig.recreate_from_np_array(sig_temp)  # gets rebuilt signal
-    return rebuilt_sig
-
-
-def frac_offset(sig, scope_f, upsample_mult=8, nmodes=2):
+def frac_offset(sig, scope_f, upsample_mult=8, nmodes=2, rng=None):
     """
     This function takes a signal, then offsets its data by a fraction of a step
 
@@ -76,6 +60,8 @@ def frac_offset(sig, scope_f, upsample_mult=8, nmodes=2):
         frequency of the scope
     upsample_mult : float
         How many times the signal is being upsamples from the baud rate
+    rng : numpy Generator
+        Source of the random offset (see Random_Streams)
 
     Output
     ---------------------------------------------
@@ -86,8 +72,9 @@ def frac_offset(sig, scope_f, upsample_mult=8, nmodes=2):
     sig = sig.resample(sig.fb*upsample_mult, beta=0.1, renormalise=True)
 
     # random small delay
-    shift = random.randint(1,upsample_mult-1)  # shift by shift spaces
-    if random.random() < 0.5:     # 50% chance to shift in -ve direction
+    rng = Random_Streams.as_generator(rng)
+    shift = int(rng.integers(1,upsample_mult-1))  # shift by shift spaces
+    if rng.random() < 0.5:     # 50% chance to shift in -ve direction
         shift *= -1 
     print("Fractional shift: %.3f" % (shift / upsample_mult))
     if nmodes == 1:
@@ -189,12 +176,7 @@ def add_edges(sig, edge_size, nmodes=2):
     sig : SignalQAMGrayCoded
         Signal that has had edges added
     """
-    sig_temp = sig      # gets temporary signal
-    arr_0 = np.zeros((nmodes, edge_size))    # gets array of zeros
-    sig_temp = np.concatenate((sig_temp, arr_0), axis=1)   # adds 0's to end of signal
-    sig_temp = np.concatenate((arr_0, sig_temp), axis=1)   # adds 0's to start of signal
-    out_sig = sig.recreate_from_np_array(sig_temp)  # gets rebuilt signal
-    return out_sig
+    return Impairments.add_edges(sig, edge_size, nmodes)
 
 
 if __name__ == "__main__": # if this is the main file
@@ -208,8 +190,10 @@ if __name__ == "__main__": # if this is the main file
     Ntaps = 11       # number of taps for equalisation
     dumped_edges = 15 # number of edges dumped
     snr = 21        # signal to noise ratio
+    master_seed = 2021  # seed of the run, so that it can be repeated
+    rng = Random_Streams.point_rng(master_seed, 0)
     upsample_mult=4     # how many times the signal is upsampled to get fractional delay
-    orig_sig = signals.SignalQAMGrayCoded(M, N, fb=fb, nmodes=nmodes) # create signal
+    orig_sig = signals.SignalQAMGrayCoded(M, N, fb=fb, nmodes=nmodes, seed=Random_Streams.int_seed(rng)) # create signal
     print("%d-QAM signal with %d SNR" % (M, snr))
 
     # copy sig
@@ -218,7 +202,7 @@ if __name__ == "__main__": # if this is the main file
     # Large Delay
     # max_shift = math.floor(fb/copied_sig.fs*N)  # gets maximum possible delay, ie. length of original signal
     max_shift = N  # gets maximum possible delay, ie. length of original signal
-    shift = random.randint(-max_shift, max_shift)   # gets a random shift within the range of -max_shift to +max_shift
+    shift = int(rng.integers(-max_shift, max_shift, endpoint=True))   # gets a random shift within the range of -max_shift to +max_shift
     print("Max shift: ", end="")
     print(max_shift)
     print("Actual shift", end=": ")
@@ -226,8 +210,8 @@ if __name__ == "__main__": # if this is the main file
     delayed_sig = Impairments.delay(copied_sig, shift=shift, nmodes=2)  # applies shift
 
     # fractional offset
-    frac_delay_sig = frac_offset(delayed_sig, f_scope, upsample_mult, nmodes=2)
-    frac_delay_sig = Impairments.add_noise(frac_delay_sig, snr)
+    frac_delay_sig = frac_offset(delayed_sig, f_scope, upsample_mult, nmodes=2, rng=rng)
+    frac_delay_sig = Impairments.add_noise(frac_delay_sig, snr, rng=rng)
     # Output.Square_Wave(frac_delay_sig, nmodes)
     # delayed_sig = frac_delay_sig.resample(fb)
 
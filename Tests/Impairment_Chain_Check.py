@@ -0,0 +1,81 @@
+"""
+Checks that the fused passes of an impairment chain give the same signal as applying the impairments one at a time,
+and that applying a chain again allocates no new buffers
+    - delay, fractional delay and dgd in one FFT pass, against Fractional_Delay.fft_delay
+    - delays folded into the filter of a resample, against delaying then resampling
+"""
+
+from qampy import signals
+import numpy as np
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "files"))
+import Fractional_Delay
+import Impairment_Chain
+import Resampling
+
+
+def dgd(x, tau, theta, fs, delay=0):
+    """
+    Differential group delay of tau seconds between 2 modes, rotated by theta radians first, one step at a time, with
+    both modes also delayed by delay samples. The delays are applied together, as splitting them changes the Nyquist bin
+    """
+    c = np.cos(theta)
+    s = np.sin(theta)
+    rotated = np.array([c*x[0] - s*x[1], s*x[0] + c*x[1]])
+    rotated[0] = Fractional_Delay.fft_delay(rotated[0], delay + tau * fs / 2)
+    rotated[1] = Fractional_Delay.fft_delay(rotated[1], delay - tau * fs / 2)
+    return np.array([c*rotated[0] + s*rotated[1], -s*rotated[0] + c*rotated[1]])
+
+
+if __name__ == "__main__":
+    M = 16          # QAM order
+    N = 2**14       # number of symbols
+    fb = 40*10**9   # baud rate (symbols / s)
+    fs = 92*10**9   # sample rate of the signal (for AWG)
+    f_scope = 80*10**9  # scope sample frequency, which the signal is resampled to
+    nmodes = 2      # number of polarisations
+    shift = 1000    # whole sample delay
+    frac = 0.37     # fractional delay in symbols
+    tau = 10e-12    # differential group delay (s)
+    theta = 0.3     # rotation onto the principal states (rad)
+    repeats = 5     # number of times each chain is applied again
+
+    sig = signals.SignalQAMGrayCoded(M, N, nmodes=nmodes, fb=fb, seed=1)
+    sig = Resampling.resample_signal(sig, fs, beta=0.1, renormalise=True)
+    x = np.asarray(sig)
+
+    # delays and dgd in one filter pass
+    chain = Impairment_Chain.ImpairmentChain([("delay", {"shift": shift}), ("fractional_delay", {"delay": frac}),
+                                              ("dgd", {"tau": tau, "theta": theta})])
+    assert len(chain.passes) == 1, "delays and dgd are applied in %d passes" % len(chain.passes)
+    fused = np.array(chain.apply(sig))
+    unfused = dgd(x, tau, theta, fs, shift + frac * fs / fb)
+    error = np.max(np.abs(fused - unfused)) / np.max(np.abs(unfused))
+    assert error < 1e-9, "fused delay and dgd differ from fft_delay by %g" % error
+
+    # delays folded into the resample
+    chain = Impairment_Chain.ImpairmentChain([("delay", {"shift": shift}), ("fractional_delay", {"delay": frac}),
+                                              ("resample", {"fnew": f_scope, "beta": 0.1})])
+    assert len(chain.passes) == 1, "delays and resample are applied in %d passes" % len(chain.passes)
+    fused = np.array(chain.apply(sig))
+    delayed = Fractional_Delay.fft_delay(x, shift + frac * fs / fb)
+    unfused = Resampling.poly_resample(delayed, fs, f_scope, circular=True, Ts=1 / fb, beta=0.1)
+    error = np.max(np.abs(fused - unfused)) / np.max(np.abs(unfused))
+    assert error < 1e-3, "delay folded into the resample differs from delay then resample by %g" % error
+
+    # the pool allocates on the first run of each chain only
+    for stages in [Impairment_Chain.noise_stages(20, 2*fb) + [("delay", {"shift": shift}),
+                                                              ("padding", {"edge_size": 100})],
+                   [("frequency_offset", {"foff": 50e6}), ("fractional_delay", {"delay": frac}),
+                    ("resample", {"fnew": f_scope, "beta": 0.1, "renormalise": True})]]:
+        chain = Impairment_Chain.ImpairmentChain(stages)
+        chain.apply(sig, rng=0)
+        allocations = chain.pool.allocations
+        for i in range(repeats):
+            chain.apply(sig, rng=i)
+        assert chain.pool.allocations == allocations, "%s allocated %d more buffers when applied again" % (
+            Impairment_Chain.ImpairmentChain._label(stages), chain.pool.allocations - allocations)
+        chain.report()
+    print("Fused impairment chains match the unfused functions")
@@ -20,6 +20,9 @@ import random
 import Generate_Signal
 import Receive_Signal
 import Impairments
+import Batch_Impairments
+import Buffer_Pool
+import Impairment_Chain
 import Output
 
 
@@ -47,17 +50,24 @@ if __name__ == "__main__":
     test_sig = signals.SignalWithPilots(M,N,pilot_seq_len,pilot_ins_ratio,nmodes=npols,Mpilots=4,nframes=nframes,fb=fb)
     orig_data = test_sig.get_data()
 
-    # Apply noise
-    for i in range(len(snr)):
-        impaired_sig = impairments.simulate_transmission(test_sig,snr=snr[i],dgd=0, freq_off=0,lwdth=0,roll_frame_sync=True)
-
-        # large delay
+    # Apply noise, with the noise of every SNR point drawn in batches (see Batch_Impairments). The random frame roll of
+    # simulate_transmission isn't needed, as the signal is given a random large delay below
+    pool = Buffer_Pool.BufferPool()     # shared by the chain of every point, so the sweep only allocates once
+    for [snr_i, impaired_sig] in Batch_Impairments.iter_signals(test_sig, snr):
+        # large delay, by a random whole number of symbols
         shift = np.random.randint(-N/2, N/2)
         print("Shift amount: %d" % shift)
-        impaired_sig = Impairments.delay(impaired_sig, shift, npols)   # shifts signal by a random whole integer amount
 
-        # Frac delay
-        impaired_sig = Impairments.frac_offset(impaired_sig, f_scope)   # also resamples to scope frequency
+        # Frac delay, over the same range as Impairments.frac_offset
+        frac_shift = np.random.uniform(1, 6) / 8 * np.random.choice([-1, 1])
+        print("Shift: %.3f" % frac_shift)
+
+        # both delays are folded into the resampling to the scope frequency, in one pass (see Impairment_Chain)
+        chain = Impairment_Chain.ImpairmentChain([("delay", {"shift": shift}),
+                                                  ("fractional_delay", {"delay": frac_shift}),
+                                                  ("resample", {"fnew": f_scope, "beta": 0.1, "renormalise": True})],
+                                                 pool)
+        impaired_sig = chain.apply(impaired_sig)
 
         # Receiver side --------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
         # equalise signal
@@ -69,13 +79,13 @@ if __name__ == "__main__":
         ber = recovered_pilot_sig[0].get_data().cal_ber()[0]
         ser = recovered_pilot_sig[0].get_data().cal_ser()[0]
         e_snr = recovered_pilot_sig[0].est_snr()[0]
-        print("Current results for %d-Qam with %d snr" % (M, snr[i]))
+        print("Current results for %d-Qam with %d snr" % (M, snr_i))
         print("Theory BER:", end="")
-        print(theory.ber_vs_es_over_n0_qam(10**((snr[i])/10), M))
+        print(theory.ber_vs_es_over_n0_qam(10**((snr_i)/10), M))
         print("Actual BER: ", end="")
         print(ber)
         print("BER correction:", end="")
-        print(ber/theory.ber_vs_es_over_n0_qam(10**((snr[i])/10), M))
+        print(ber/theory.ber_vs_es_over_n0_qam(10**((snr_i)/10), M))
         print("SER: ", end="")
         print(ser)
         print("estimated SNR")
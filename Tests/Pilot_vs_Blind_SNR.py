@@ -16,6 +16,7 @@ import random
 import Generate_Signal
 import Receive_Signal
 import Impairments
+import Batch_Impairments
 import Output
 
 
@@ -59,6 +60,8 @@ if __name__ == "__main__":
         pilot_sig = signals.SignalWithPilots(M[j],N,pilot_seq_len,pilot_ins_ratio,nmodes=npols,Mpilots=4,nframes=nframes,fb=fb)
         pilot_sig_orig_data = pilot_sig.get_data()
         upsampled_pilot_sig = pilot_sig.resample(fb*2, beta=0.1)    # resamples pilot signal to AWG sampling frequency
+        # noisy blind signals for every snr, made in batches and taken one at a time below
+        blind_rows = Batch_Impairments.iter_signals(upsampled_blind_sig, snr)
 
         for i in range(len(snr)):
             print("SNR: ", end="")
@@ -66,7 +69,7 @@ if __name__ == "__main__":
 
             # Add noise
             # impaired_blind_sig = impairments.simulate_transmission(upsampled_blind_sig,snr=snr[i],dgd=0, freq_off=0,lwdth=0)
-            impaired_blind_sig = impairments.change_snr(upsampled_blind_sig, snr[i])
+            [blind_snr, impaired_blind_sig] = next(blind_rows)
             impaired_pilot_sig = impairments.simulate_transmission(upsampled_pilot_sig,snr=snr[i],dgd=0, freq_off=freq_off,lwdth=linewidth,roll_frame_sync=True)
 
             # Receiver side -------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
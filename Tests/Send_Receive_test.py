@@ -7,6 +7,7 @@ import numpy as np
 from bokeh.io import output_notebook
 from bokeh.plotting import figure, show
 import os
+from timeit import default_timer as timer
 import Generate_Signal
 import Receive_Signal
 import Impairments
@@ -72,3 +73,17 @@ if __name__ == "__main__":
     print(recovered_signal.shape)
     print("SER = ",recovered_signal.cal_ser())
     print("BER = ",recovered_signal.cal_ber())
+
+    #---------------------------------------------------------------------
+    # compares per-capture setup cost of rebuilding the received signal with a generated template and from symbols
+    start = timer()
+    template_sig = Receive_Signal.recreate_signal(read_sig_data, fs, M, N, fb, nmodes)
+    template_time = timer() - start
+    start = timer()
+    rehydrated_sig = Receive_Signal.rehydrate_signal(read_sig_data, sig.symbols, M, fb, fs)
+    rehydrate_time = timer() - start
+    start = timer()
+    rehydrated_sig = Receive_Signal.rehydrate_signal(read_sig_data, sig.symbols, M, fb, fs)   # later captures
+    reuse_time = timer() - start
+    print("Setup with generated template: %.4f s, from symbols: %.4f s (first capture), %.4f s (later captures)"
+          % (template_time, rehydrate_time, reuse_time))
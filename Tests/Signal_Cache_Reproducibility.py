@@ -0,0 +1,78 @@
+"""
+Checks that seeded transmitter signals are reproducible without the cache, so that a cache miss (eg. on another
+machine or after the cache is cleared) gives back the same signal as a cache hit, and that the receiver rebuilds
+signals from the same cached transmitted signal or symbols
+"""
+
+from qampy import signals
+import numpy as np
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "files"))
+import Generate_Signal
+import Receive_Signal
+import Signal_Cache
+
+
+if __name__ == "__main__":
+    M = 16          # QAM order
+    N = 2**12       # number of symbols
+    fb = 40*10**9   # baud rate (symbols / s)
+    fs = 92*10**9   # sampling frequency (for AWG)
+    nmodes = 2      # number of polarisations
+    seed = 5
+
+    # two uncached generations with the same seed
+    sig1 = Signal_Cache.generate_signal(signals.SignalQAMGrayCoded, M, N, nmodes=nmodes, fb=fb, seed=seed)
+    sig2 = Signal_Cache.generate_signal(signals.SignalQAMGrayCoded, M, N, nmodes=nmodes, fb=fb, seed=seed)
+    assert np.array_equal(sig1.symbols, sig2.symbols), "seeded generations have different symbols"
+    assert np.array_equal(sig1, sig2), "seeded generations have different samples"
+    other = Signal_Cache.generate_signal(signals.SignalQAMGrayCoded, M, N, nmodes=nmodes, fb=fb, seed=seed + 1)
+    assert not np.array_equal(sig1.symbols, other.symbols), "different seeds give the same symbols"
+
+    # cache misses in two empty caches, then a hit, all give the same resampled signal
+    sigs = []
+    for i in range(2):
+        Signal_Cache.clear()
+        sigs.append(Signal_Cache.get_signal(signals.SignalQAMGrayCoded, M, N, nmodes=nmodes, fb=fb, fs=fs, seed=seed,
+                                            cache_dir=tempfile.mkdtemp()))
+    sigs.append(Signal_Cache.get_signal(signals.SignalQAMGrayCoded, M, N, nmodes=nmodes, fb=fb, fs=fs, seed=seed,
+                                        cache_dir=None))
+    for sig in sigs[1:]:
+        assert np.array_equal(sigs[0].symbols, sig.symbols), "cached signal has different symbols"
+        assert np.allclose(sigs[0], sig), "cached signal has different samples"
+
+    # the receiver finds the transmitted signal of Lab_Automation.qampy_sig under the same key
+    Signal_Cache.clear()
+    tx_sig = Signal_Cache.get_signal(signals.SignalQAMGrayCoded, M, N, nmodes=nmodes, fb=fb, fs=fs, beta=0.01,
+                                     renormalise=True, seed=seed, cache_dir=None)
+    n_cached = len(Signal_Cache._memory)
+    rx_sig = Receive_Signal.recreate_signal(np.asarray(tx_sig), fs, M, N, fb, nmodes, seed=seed, beta=0.01,
+                                            renormalise=True, cache_dir=None)
+    assert len(Signal_Cache._memory) == n_cached, "receiver generated a new signal rather than reusing the cached one"
+    assert np.array_equal(tx_sig.symbols, rx_sig.symbols), "receiver has different symbols from the transmitter"
+
+    # and that of Generate_Signal.generate_AWG_signal, which resamples with beta=0.1 and without renormalising
+    Signal_Cache.clear()
+    tx_sig = Generate_Signal.generate_AWG_signal(M, N, nmodes=nmodes, fs=fs, fb=fb, seed=seed)
+    n_cached = len(Signal_Cache._memory)
+    rx_sig = Receive_Signal.recreate_signal(np.asarray(tx_sig), fs, M, N, fb, nmodes, seed=seed, beta=0.1,
+                                            renormalise=False)
+    assert len(Signal_Cache._memory) == n_cached, "receiver generated a new signal rather than reusing the cached one"
+    assert np.array_equal(tx_sig.symbols, rx_sig.symbols), "receiver has different symbols from the transmitter"
+
+    # without the transmitter's resampling parameters, the seed alone can't find the signal
+    try:
+        Receive_Signal.recreate_signal(np.asarray(tx_sig), fs, M, N, fb, nmodes, seed=seed)
+        raise AssertionError("receiver accepted a seed without beta and renormalise")
+    except ValueError:
+        pass
+
+    # signals rebuilt from symbols share one template
+    rx1 = Receive_Signal.rehydrate_signal(np.asarray(tx_sig), tx_sig.symbols, M, fb, fs)
+    rx2 = Receive_Signal.rehydrate_signal(np.asarray(tx_sig), tx_sig.symbols.copy(), M, fb, fs)
+    assert Signal_Cache.symbol_template(tx_sig.symbols, M, fb) is Signal_Cache.symbol_template(rx2.symbols, M, fb)
+    assert np.array_equal(rx1.symbols, tx_sig.symbols) and np.array_equal(rx2.symbols, tx_sig.symbols)
+    print("Seeded signals are reproducible with and without the cache")
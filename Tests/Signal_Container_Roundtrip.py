@@ -0,0 +1,45 @@
+"""
+Checks that signal data, symbols and metadata written to a signal container are read back unchanged, both through a
+memory map and read into memory, and that each array keeps its dtype
+"""
+
+import numpy as np
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "files"))
+import Signal_Container
+
+
+if __name__ == "__main__":
+    nmodes = 2              # number of polarisations
+    n_samples = 10000       # samples per mode
+    meta = {"fs": 92e9, "fb": 40e9, "M": 16, "nmodes": nmodes}
+    rng = np.random.default_rng(1)
+    out_dir = tempfile.mkdtemp()
+
+    for dtype in [np.complex128, np.complex64, np.float32]:
+        data = rng.standard_normal((nmodes, 2 * n_samples)).view(np.complex128)
+        data = data.astype(dtype) if np.iscomplexobj(np.zeros(0, dtype)) else data.real.astype(dtype)
+        for symbols in [None, rng.integers(-3, 4, (nmodes, n_samples // 2)).astype(np.int8)]:
+            file_path = os.path.join(out_dir, "sig_%s.qsig" % np.dtype(dtype).name)
+            Signal_Container.write_container(file_path, data, meta, symbols)
+            for mmap in [True, False]:
+                [read_data, read_symbols, read_meta] = Signal_Container.read_container(file_path, mmap)
+                assert isinstance(read_data, np.memmap) == mmap, "data is %s when mmap is %s" % (type(read_data), mmap)
+                assert read_data.dtype == data.dtype, "%s data read back as %s" % (data.dtype, read_data.dtype)
+                assert np.array_equal(read_data, data), "%s data changed in the container" % data.dtype
+                assert read_meta == meta, "metadata changed in the container: %s" % read_meta
+                if symbols is None:
+                    assert read_symbols is None, "symbols read back from a container without them"
+                else:
+                    assert read_symbols.dtype == symbols.dtype, "symbols read back as %s" % read_symbols.dtype
+                    assert np.array_equal(read_symbols, symbols), "symbols changed in the container"
+
+            # the memory map is copy-on-write, so changing it leaves the file alone
+            [read_data, read_symbols, read_meta] = Signal_Container.read_container(file_path)
+            read_data[...] = 0
+            del read_data
+            assert np.array_equal(Signal_Container.read_container(file_path)[0], data), "memory map wrote to the file"
+    print("Signal containers round trip through the memory map")
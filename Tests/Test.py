@@ -33,12 +33,7 @@ def add_edges(sig, edge_size, nmodes=2):
     sig : SignalQAMGrayCoded
         Signal that has had edges added
     """
-    sig_temp = sig      # gets temporary signal
-    arr_0 = np.zeros((nmodes, edge_size))    # gets array of zeros
-    sig_temp = np.concatenate((sig_temp, arr_0), axis=1)   # adds 0's to end of signal
-    sig_temp = np.concatenate((arr_0, sig_temp), axis=1)   # adds 0's to start of signal
-    out_sig = sig.recreate_from_np_array(sig_temp)  # gets rebuilt signal
-    return out_sig
+    return Impairments.add_edges(sig, edge_size, nmodes)
 
 
 if __name__ == "__main__":
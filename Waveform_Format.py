@@ -0,0 +1,245 @@
+"""
+Waveform file formats shared by the host (Lab_Automation) and the AWG's file server (server.py)
+    txt: the AWG's text import format, one "sample,marker,marker" line per sample
+    bin: the AWG's binary import format, 16-bit words with the DAC code in the upper bits and the markers in bits 0 and 1
+    qwf: compact transfer format, samples quantized to the DAC's resolution on the host, optionally compressed, and
+         expanded to txt or bin by the server. Markers are not stored, as they are rebuilt from the segment length
+Only numpy is needed, so that this can run on the AWG's computer.
+"""
+
+import os
+import struct
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+MARKER_BITS = 0b11  # sample marker (bit 0) and sync marker (bit 1) of the AWG's 16-bit binary format
+
+COMPACT_MAGIC = b"QWF1"
+# magic, DAC bits, bytes per code, compressed, segment length, number of samples, volts per DAC code
+COMPACT_HEADER = struct.Struct("<4sBBBxIQd")
+
+# result of validateWaveformFile
+#   n_samples: number of samples (lines for text files), n_markers: number of samples with markers set,
+#   ratio: n_markers / n_samples, seg_len: segment length that was checked, misplaced: markers not at a multiple of
+#   seg_len, missing: segment starts without a marker, first_error: index of the first bad sample, or -1,
+#   length_ok: if n_samples is a multiple of seg_len, valid: if there are no marker errors and length_ok
+MarkerSummary = namedtuple("MarkerSummary", ["n_samples", "n_markers", "ratio", "seg_len", "misplaced", "missing",
+                                             "first_error", "length_ok", "valid"])
+
+
+def toDACCodes(arr, dac_bits=14, full_scale=None):
+    """
+    Quantizes waveform data to the signed integer codes of the AWG's DAC
+    :param: arr: an array of waveform data, either a single channel or one channel per row
+    :param: dac_bits: resolution of the DAC in bits
+    :param: full_scale: value that is mapped to the largest DAC code. If None, the peak absolute value of arr is used
+    :return: codes: int16 array of DAC codes with the same shape as arr
+    """
+    arr = np.asarray(arr)
+    if full_scale is None:
+        full_scale = np.max(np.abs(arr))
+    if full_scale == 0:  # all zero waveform, any scale works
+        full_scale = 1
+    max_code = 2 ** (dac_bits - 1) - 1
+    codes = np.rint(arr * (max_code / full_scale))
+    np.clip(codes, -max_code - 1, max_code, out=codes)
+    return codes.astype(np.int16)
+
+
+def codeStep(dac_bits=14, full_scale=1):
+    """
+    Gets the value of one DAC code step, so that codes * codeStep(dac_bits, full_scale) gives back quantized samples
+    """
+    if full_scale == 0:
+        full_scale = 1
+    return full_scale / (2 ** (dac_bits - 1) - 1)
+
+
+def buildBinaryChannel(data, seg_len, dac_bits=14, full_scale=None, quantized=False):
+    """
+    Builds one channel of the AWG's binary import format, which is made of little-endian 16-bit words with the DAC code
+    left aligned in the upper bits and the sample and sync markers in bits 0 and 1
+    :param: data: waveform data for a single channel
+    :param: seg_len: The length of a segment in the waveform, markers are set at the start of each segment
+    :param: dac_bits: resolution of the DAC in bits, at most 14 so that there is room for the marker bits
+    :param: full_scale: value that is mapped to the largest DAC code. If None, the peak absolute value of data is used
+    :param: quantized: if True, data is already made of DAC codes
+    :return: words: int16 array in the AWG binary format
+    """
+    if dac_bits > 14:
+        raise ValueError("binary format only has room for 14 DAC bits, got %d" % dac_bits)
+    if quantized:
+        words = np.array(data, dtype=np.int16)
+    else:
+        words = toDACCodes(data, dac_bits, full_scale)
+    words <<= 16 - dac_bits  # left aligns DAC code, leaving the lowest bits free for markers
+    words[::seg_len] |= MARKER_BITS  # sets sample and sync markers at the start of each segment
+    return words
+
+
+def writeBinaryChannel(filename, data, seg_len, dac_bits=14, full_scale=None):
+    """
+    Writes one channel of waveform data to filename in the AWG binary format in a single call
+    :return: filename: the name of the file that was written
+    """
+    words = buildBinaryChannel(data, seg_len, dac_bits, full_scale)
+    words.astype("<i2", copy=False).tofile(filename)
+    return filename
+
+
+def writeCompactChannel(filename, data, seg_len, dac_bits=14, full_scale=None, compress=False):
+    """
+    Writes one channel of waveform data to filename in the compact transfer format. Samples are stored as 1 byte DAC
+    codes for DACs of up to 8 bits, and 2 bytes otherwise
+    :param: filename: The name of the file that the data is to be saved to
+    :param: data: waveform data for a single channel
+    :param: seg_len: The length of a segment in the waveform, used to rebuild the markers
+    :param: dac_bits: resolution of the DAC in bits
+    :param: full_scale: value that is mapped to the largest DAC code. If None, the peak absolute value of data is used
+    :param: compress: if True, the codes are compressed with zlib
+    :return: filename: the name of the file that was written
+    """
+    if full_scale is None:
+        full_scale = np.max(np.abs(data))
+    codes = toDACCodes(data, dac_bits, full_scale)
+    code_bytes = 1 if dac_bits <= 8 else 2
+    payload = codes.astype("<i%d" % code_bytes).tobytes()
+    if compress:
+        payload = zlib.compress(payload, 1)
+    header = COMPACT_HEADER.pack(COMPACT_MAGIC, dac_bits, code_bytes, int(compress), seg_len, len(codes),
+                                 codeStep(dac_bits, full_scale))
+    with open(filename, "wb") as file:
+        file.write(header)
+        file.write(payload)
+    return filename
+
+
+def readCompactChannel(filename):
+    """
+    Reads a file in the compact transfer format
+    :return: [codes, info] where codes are the DAC codes as int16 and info is a dictionary of the header fields
+    """
+    with open(filename, "rb") as file:
+        header = file.read(COMPACT_HEADER.size)
+        payload = file.read()
+    [magic, dac_bits, code_bytes, compressed, seg_len, n_samples, step] = COMPACT_HEADER.unpack(header)
+    if magic != COMPACT_MAGIC:
+        raise ValueError("%s is not a compact waveform file" % filename)
+    if compressed:
+        payload = zlib.decompress(payload)
+    codes = np.frombuffer(payload, dtype="<i%d" % code_bytes, count=n_samples).astype(np.int16)
+    info = {"dac_bits": dac_bits, "seg_len": seg_len, "n_samples": n_samples, "step": step}
+    return [codes, info]
+
+
+def formatTextLines(codes, step, seg_len, dac_bits=14):
+    """
+    Builds the AWG text format for DAC codes, with markers at the start of each segment, matching the lines written by
+    Lab_Automation.saveToFile for the samples codes * step
+    As there are only 2^dac_bits possible samples, each line is formatted once and looked up rather than formatted
+    for every sample
+    """
+    min_code = -2 ** (dac_bits - 1)
+    levels = np.arange(min_code, -min_code) * step  # every sample value the DAC can output
+    plain = np.array(["%.16f,0,0\n" % level for level in levels], dtype=object)
+    marked = np.array(["%.16f,1,1\n" % level for level in levels], dtype=object)
+    index = codes.astype(np.intp) - min_code
+    lines = plain[index]
+    lines[::seg_len] = marked[index[::seg_len]]
+    return "".join(lines)
+
+
+def expandCompactFile(filename, file_format="txt", out_filename=None):
+    """
+    Expands a compact waveform file into the format imported by the AWG's :TRAC:IMP command
+    :param: filename: name of the compact file
+    :param: file_format: "txt" for the AWG's text format, or "bin" for its binary format
+    :param: out_filename: name of the expanded file. If None, the extension of filename is replaced by file_format
+    :return: out_filename: the name of the file that was written
+    """
+    [codes, info] = readCompactChannel(filename)
+    if out_filename is None:
+        out_filename = os.path.splitext(filename)[0] + "." + file_format
+    if file_format == "bin":
+        words = buildBinaryChannel(codes, info["seg_len"], info["dac_bits"], quantized=True)
+        words.astype("<i2", copy=False).tofile(out_filename)
+    elif file_format == "txt":
+        with open(out_filename, "w") as file:
+            file.write(formatTextLines(codes, info["step"], info["seg_len"], info["dac_bits"]))
+    else:
+        raise ValueError("unknown file format '%s', should be 'txt' or 'bin'" % file_format)
+    return out_filename
+
+
+def guessFormat(filename):
+    """
+    Gets the format of a waveform file from its extension, "bin", "qwf" or "txt"
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in [".bin", ".qwf"]:
+        return ext[1:]
+    return "txt"
+
+
+def findMarkers(filename, file_format=None):
+    """
+    Memory-maps a waveform file and finds which samples have their markers set, without reading it line by line
+    :param: filename: name of the waveform file
+    :param: file_format: "txt", "bin" or "qwf". If None, it is found from the extension of filename
+    :return: [n_samples, positions] where positions are the indexes of the samples with markers
+    """
+    if file_format is None:
+        file_format = guessFormat(filename)
+    if os.path.getsize(filename) == 0:
+        return [0, np.zeros(0, dtype=np.intp)]
+
+    if file_format == "qwf":  # markers are rebuilt from the segment length, so only the header is needed
+        with open(filename, "rb") as file:
+            header = COMPACT_HEADER.unpack(file.read(COMPACT_HEADER.size))
+        [seg_len, n_samples] = header[4:6]
+        return [n_samples, np.arange(0, n_samples, seg_len)]
+
+    if file_format == "bin":
+        words = np.memmap(filename, dtype="<i2", mode="r")
+        return [len(words), np.flatnonzero(words & MARKER_BITS)]
+
+    # text format, the marker is the last character of each line
+    data = np.memmap(filename, dtype=np.uint8, mode="r")
+    line_ends = np.flatnonzero(data == ord("\n"))
+    if data[-1] != ord("\n"):  # last line has no newline
+        line_ends = np.append(line_ends, len(data))
+    last_chars = data[line_ends - 1]
+    carriage = last_chars == ord("\r")  # lines ending in \r\n
+    if np.any(carriage):
+        last_chars = last_chars.copy()
+        last_chars[carriage] = data[line_ends[carriage] - 2]
+    return [len(line_ends), np.flatnonzero(last_chars == ord("1"))]
+
+
+def validateWaveformFile(filename, seg_len=None, file_format=None):
+    """
+    Checks that the markers of a waveform file are set on exactly the samples at multiples of seg_len
+    :param: filename: name of the waveform file
+    :param: seg_len: length of a segment of the waveform. If None, the spacing of the first two markers is used
+    :param: file_format: "txt", "bin" or "qwf". If None, it is found from the extension of filename
+    :return: summary: MarkerSummary of the markers in the file
+    """
+    [n_samples, positions] = findMarkers(filename, file_format)
+    n_markers = len(positions)
+    if seg_len is None:
+        seg_len = int(positions[1] - positions[0]) if n_markers > 1 else max(n_samples, 1)
+
+    bad = positions[positions % seg_len != 0]
+    n_segments = -(-n_samples // seg_len)  # number of segment starts in the file
+    marked = np.zeros(n_segments, dtype=bool)
+    marked[positions[positions % seg_len == 0] // seg_len] = True
+    unmarked = np.flatnonzero(~marked) * seg_len
+
+    errors = np.concatenate((bad, unmarked))
+    first_error = int(np.min(errors)) if len(errors) else -1
+    length_ok = n_samples % seg_len == 0
+    ratio = n_markers / n_samples if n_samples else 0
+    return MarkerSummary(n_samples, n_markers, ratio, seg_len, len(bad), len(unmarked), first_error, length_ok,
+                         first_error == -1 and length_ok)
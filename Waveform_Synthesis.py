@@ -0,0 +1,206 @@
+"""
+Test waveforms for calibrating the AWG and oscilloscope: sine, multitone, chirp, impulse train and PRBS
+Waveforms are generated in chunks of CHUNK_SIZE samples, with the phase at the start of each chunk worked out exactly
+from the sample index, so long records can be written straight into a preallocated (or memory-mapped) array without
+building a time vector for the whole record. The output can be passed straight to Lab_Automation.saveToFile.
+Only numpy is needed.
+"""
+
+from fractions import Fraction
+
+import numpy as np
+
+CHUNK_SIZE = 2 ** 18  # number of samples generated at a time
+
+# PRBS taps [n, m], for the sequence b[k] = b[k - n] xor b[k - m]
+PRBS_TAPS = {7: [7, 6], 9: [9, 5], 11: [11, 9], 15: [15, 14], 20: [20, 3], 23: [23, 18], 31: [31, 28]}
+
+
+def _output(n, dtype, out):
+    """
+    Gets the array that a waveform of n samples is written to
+    """
+    if out is None:
+        return np.empty(n, dtype=dtype)
+    if len(out) != n:
+        raise ValueError("out has %d samples, expected %d" % (len(out), n))
+    return out
+
+
+def _cycles(rate, start):
+    """
+    Gets the fractional part of rate * start exactly, where rate is a Fraction and start an integer
+    """
+    return float((rate * start) % 1)
+
+
+def sine(sig_len, freq, sample_rate, amp=1, phase=0, dtype=np.float64, out=None, chunk_size=CHUNK_SIZE):
+    """
+    Generates a sine wave, amp * sin(2 * pi * freq * t + phase)
+    :param: sig_len: number of samples
+    :param: freq: frequency of the sine wave
+    :param: sample_rate: sample rate of the AWG
+    :param: amp: amplitude of the sine wave
+    :param: phase: phase of the first sample, in radians
+    :param: dtype: data type of the output
+    :param: out: array of sig_len samples to write the waveform to, eg. a row of a channel array or a memmap
+    :param: chunk_size: number of samples generated at a time
+    :return: sig: the sine wave
+    """
+    return multitone(sig_len, [freq], sample_rate, [amp], [phase], dtype, out, chunk_size)
+
+
+def multitone(sig_len, freqs, sample_rate, amps=None, phases=None, dtype=np.float64, out=None, chunk_size=CHUNK_SIZE):
+    """
+    Generates the sum of sine waves at each of freqs
+    :param: sig_len: number of samples
+    :param: freqs: list of the frequencies of the tones
+    :param: sample_rate: sample rate of the AWG
+    :param: amps: list of the amplitudes of the tones, if None all tones have amplitude 1 / len(freqs)
+    :param: phases: list of the phases of the tones in radians. If None, Schroeder phases are used, which keeps the
+    peak to average power ratio low so that more of the DAC's range is used
+    :param: dtype: data type of the output
+    :param: out: array of sig_len samples to write the waveform to
+    :param: chunk_size: number of samples generated at a time
+    :return: sig: the multitone waveform
+    """
+    n_tones = len(freqs)
+    if amps is None:
+        amps = [1 / n_tones] * n_tones
+    if phases is None:
+        phases = [np.pi * k * (k - 1) / n_tones for k in range(1, n_tones + 1)]
+    rates = [Fraction(freq) / Fraction(sample_rate) for freq in freqs]  # cycles per sample
+    sig = _output(sig_len, dtype, out)
+
+    idx = np.arange(min(chunk_size, sig_len), dtype=np.float64)
+    acc = np.empty(len(idx))
+    tone = np.empty(len(idx))
+    for start in range(0, sig_len, chunk_size):
+        n = min(chunk_size, sig_len - start)
+        acc[:n] = 0
+        for rate, amp, phase in zip(rates, amps, phases):
+            # phase of the tone in cycles, relative to the start of the chunk
+            np.multiply(idx[:n], float(rate % 1), out=tone[:n])
+            tone[:n] += _cycles(rate, start) + phase / (2 * np.pi)
+            tone[:n] *= 2 * np.pi
+            np.sin(tone[:n], out=tone[:n])
+            tone[:n] *= amp
+            acc[:n] += tone[:n]
+        sig[start:start + n] = acc[:n]
+    return sig
+
+
+def chirp(sig_len, f0, f1, sample_rate, amp=1, phase=0, dtype=np.float64, out=None, chunk_size=CHUNK_SIZE):
+    """
+    Generates a linear chirp, sweeping from f0 at the first sample to f1 at the end of the waveform
+    :param: sig_len: number of samples
+    :param: f0: start frequency
+    :param: f1: end frequency
+    :param: sample_rate: sample rate of the AWG
+    :param: amp: amplitude of the chirp
+    :param: phase: phase of the first sample, in radians
+    :param: dtype: data type of the output
+    :param: out: array of sig_len samples to write the waveform to
+    :param: chunk_size: number of samples generated at a time
+    :return: sig: the chirp
+    """
+    c0 = Fraction(f0) / Fraction(sample_rate)  # cycles per sample at the start
+    slope = (Fraction(f1) / Fraction(sample_rate) - c0) / sig_len  # change in cycles per sample, per sample
+    sig = _output(sig_len, dtype, out)
+
+    idx = np.arange(min(chunk_size, sig_len), dtype=np.float64)
+    quad = 0.5 * float(slope) * idx ** 2
+    cycles = np.empty(len(idx))
+    for start in range(0, sig_len, chunk_size):
+        n = min(chunk_size, sig_len - start)
+        # phase(start + j) = phase(start) + (c0 + slope * start) * j + slope * j^2 / 2, with the first 2 terms exact
+        start_cycles = (c0 * start + slope * start * start / 2) % 1
+        rate = (c0 + slope * start) % 1
+        np.multiply(idx[:n], float(rate), out=cycles[:n])
+        cycles[:n] += quad[:n]
+        cycles[:n] += float(start_cycles) + phase / (2 * np.pi)
+        cycles[:n] *= 2 * np.pi
+        np.sin(cycles[:n], out=cycles[:n])
+        cycles[:n] *= amp
+        sig[start:start + n] = cycles[:n]
+    return sig
+
+
+def impulseTrain(sig_len, period, amp=1, offset=0, width=1, dtype=np.float64, out=None):
+    """
+    Generates a train of rectangular pulses, one every period samples
+    :param: sig_len: number of samples
+    :param: period: number of samples between the start of each pulse
+    :param: amp: height of the pulses
+    :param: offset: index of the first pulse
+    :param: width: number of samples in each pulse
+    :param: dtype: data type of the output
+    :param: out: array of sig_len samples to write the waveform to
+    :return: sig: the impulse train
+    """
+    sig = _output(sig_len, dtype, out)
+    sig[:] = 0
+    for i in range(width):
+        sig[offset + i::period] = amp
+    return sig
+
+
+def prbsBits(n_bits, order=7, seed=1):
+    """
+    Generates the bits of a pseudo-random binary sequence
+    Uses the LFSR recurrence b[k] = b[k - n] xor b[k - m], and since squaring its polynomial over GF(2) gives the same
+    recurrence with taps 2n and 2m, bits can be generated in blocks of m * 2^j from bits 2^j * n back, so the block size
+    doubles as the sequence grows
+    :param: n_bits: number of bits
+    :param: order: order of the sequence, one of the keys of PRBS_TAPS. The sequence repeats every 2^order - 1 bits
+    :param: seed: non-zero starting state of the LFSR, whose lowest order bits are the first bits of the sequence
+    :return: bits: uint8 array of 0s and 1s
+    """
+    if order not in PRBS_TAPS:
+        raise ValueError("no taps for PRBS%d, should be one of %s" % (order, sorted(PRBS_TAPS)))
+    [n, m] = PRBS_TAPS[order]
+    seed = seed % (2 ** n)
+    if seed == 0:
+        raise ValueError("PRBS seed must not be a multiple of 2^%d" % n)
+
+    bits = np.empty(max(n_bits, n), dtype=np.uint8)
+    bits[:n] = (seed >> np.arange(n)) & 1
+    length = n
+    while length < n_bits:
+        stride = 1
+        while 2 * stride * n <= length:
+            stride *= 2
+        block = min(m * stride, n_bits - length)
+        np.bitwise_xor(bits[length - n * stride:length - n * stride + block],
+                       bits[length - m * stride:length - m * stride + block], out=bits[length:length + block])
+        length += block
+    return bits[:n_bits]
+
+
+def prbs(sig_len, order=7, samples_per_bit=1, amp=1, seed=1, dtype=np.float64, out=None, chunk_size=CHUNK_SIZE):
+    """
+    Generates an NRZ pseudo-random binary sequence, with bits mapped to -amp and amp
+    :param: sig_len: number of samples
+    :param: order: order of the sequence, see prbsBits
+    :param: samples_per_bit: number of samples each bit is held for
+    :param: amp: amplitude of the sequence
+    :param: seed: non-zero starting state of the LFSR
+    :param: dtype: data type of the output
+    :param: out: array of sig_len samples to write the waveform to
+    :param: chunk_size: number of samples generated at a time
+    :return: sig: the PRBS waveform
+    """
+    n_bits = -(-sig_len // samples_per_bit)
+    period = 2 ** order - 1
+    bits = prbsBits(min(n_bits, period), order, seed)  # sequence is repeated rather than generated past its period
+    levels = np.array([-amp, amp], dtype=dtype)
+    sig = _output(sig_len, dtype, out)
+
+    bits_per_chunk = max(chunk_size // samples_per_bit, 1)
+    for first_bit in range(0, n_bits, bits_per_chunk):
+        idx = np.arange(first_bit, min(first_bit + bits_per_chunk, n_bits)) % len(bits)
+        chunk = np.repeat(levels[bits[idx]], samples_per_bit)
+        start = first_bit * samples_per_bit
+        n = min(len(chunk), sig_len - start)
+        sig[start:start + n] = chunk[:n]
+    return sig
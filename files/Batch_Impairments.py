@@ -0,0 +1,202 @@
+"""
+Monte Carlo impairments over a batch of noise realisations
+Rather than adding noise to one signal at a time in a loop over SNRs and trials, the noise for a whole batch of shape
+(SNR points * trials, nmodes, samples) is drawn in one call, straight into the output array, and scaled per row.
+Row r of a batch is trial r % trials at SNR snrs[r // trials].
+iter_batches splits the batch into chunks that fit in memory_budget bytes, reusing one set of buffers, so a sweep of
+any size runs in bounded memory. The noise and the phase noise come from their own streams, drawn in row order, so the
+rows are the same whatever the memory budget. Rows can be rebuilt as signals (iter_signals) to feed recovery such as
+Receive_Signal.recover_signal, a whole batch or chunk can be recovered with recover_batch, or the rows can be measured
+together with est_snr_batch.
+"""
+
+import numpy as np
+
+import Random_Streams
+
+MEMORY_BUDGET = 2 ** 30     # default number of bytes of buffers used by iter_batches
+
+
+def row_bytes(shape, phase=False):
+    """
+    Gets the number of bytes of buffers needed per row of a batch, for signals of shape (nmodes, samples)
+    phase is True if phase noise or a frequency offset is added, which needs a phase and a rotation per row
+    """
+    n = shape[-1]
+    nbytes = int(np.prod(shape)) * np.dtype(np.complex128).itemsize
+    if phase:
+        nbytes += n * (np.dtype(np.float64).itemsize + np.dtype(np.complex128).itemsize)
+    return nbytes
+
+
+def _streams(rng):
+    """
+    Gets separate Generators for the noise and the phase noise, from rng (see Random_Streams.as_generator)
+    """
+    rng = Random_Streams.as_generator(rng)
+    return [np.random.default_rng(int(rng.integers(2 ** Random_Streams.SEED_BITS))) for i in range(2)]
+
+
+def _fill(sig, power, snr_rows, fs, fb, df, foff, noise_rng, phase_rng, out, phase, rotation):
+    """
+    Writes one chunk of rows of the batch to out, see impair_batch
+    """
+    strength = np.sqrt(power * fs / fb / 10 ** (snr_rows[:, None, None] / 10) / 2)    # std of real and imag parts
+    real = out.view(np.float64)     # real and imaginary parts are interleaved
+    noise_rng.standard_normal(out=real)
+    real *= strength
+    out += sig
+    if df or foff:
+        n = sig.shape[-1]
+        if df:
+            # Wiener phase noise, the sum of steps of variance 2*pi*df/fs, independent for each row
+            phase_rng.standard_normal(out=phase)
+            phase *= np.sqrt(2 * np.pi * df / fs)
+            np.cumsum(phase, axis=-1, out=phase)
+        else:
+            phase[...] = 0
+        if foff:
+            phase += np.arange(n) * (2 * np.pi * foff / fs)
+        np.multiply(phase, 1j, out=rotation)
+        np.exp(rotation, out=rotation)
+        out *= rotation[:, None, :]
+    return out
+
+
+def impair_batch(sig, snrs, trials=1, df=0, foff=0, rng=None, out=None):
+    """
+    Adds independent white Gaussian noise, and optionally phase noise and a frequency offset, to copies of a signal,
+    for every SNR and trial at once
+
+    Parameters
+    ---------------------------------------------
+    sig : SignalQAMGrayCoded
+        Signal to be impaired, of shape (nmodes, samples), which is left unchanged
+    snrs : float or numpy array
+        Signal to noise ratios in dB, within the signal bandwidth (fb), as Impairments.add_awgn
+    trials : integer
+        Number of noise realisations at each SNR
+    df : float
+        Combined linewidth of oscillators in the system. If 0, no phase noise is added
+    foff : float
+        Carrier frequency offset in Hz. If 0, no offset is added
+    rng : numpy Generator
+        Source of the noise (see Random_Streams). If None, a Generator is seeded from numpy's global random state
+    out : numpy array
+        Complex array of shape (len(snrs) * trials, nmodes, samples) that the batch is written to. If None, a new one is
+        made
+
+    Output
+    ---------------------------------------------
+    batch : numpy array
+        Impaired copies of the signal, of shape (len(snrs) * trials, nmodes, samples)
+    """
+    for [snr_rows, batch] in iter_batches(sig, snrs, trials, df, foff, rng, memory_budget=None, out=out):
+        return batch
+
+
+def iter_batches(sig, snrs, trials=1, df=0, foff=0, rng=None, memory_budget=MEMORY_BUDGET, out=None):
+    """
+    Generates the batch of impair_batch in chunks of rows that fit in memory_budget bytes
+
+    Parameters
+    ---------------------------------------------
+    sig, snrs, trials, df, foff, rng :
+        See impair_batch
+    memory_budget : integer
+        Most bytes of buffers to use (see row_bytes), at least one row is always made. If None, the whole batch is made
+        in one chunk
+    out : numpy array
+        Complex array to write the chunks to, with at least as many rows as a chunk. If None, a new one is made
+
+    Output
+    ---------------------------------------------
+    snr_rows : numpy array
+        SNR of each row of the chunk
+    batch : numpy array
+        Chunk of impaired copies of the signal, of shape (rows, nmodes, samples). Its buffer is reused for the next
+        chunk, so it is only valid until then
+    """
+    signal = np.asarray(sig)
+    power = np.mean(np.abs(signal)**2, axis=-1, keepdims=True)     # power of each mode
+    snr_rows = np.repeat(np.atleast_1d(np.asarray(snrs, dtype=np.float64)), trials)
+    n_rows = len(snr_rows)
+    phased = bool(df or foff)
+    if memory_budget is None:
+        chunk = n_rows
+    else:
+        chunk = int(min(n_rows, max(1, memory_budget // row_bytes(signal.shape, phased))))
+    if out is None:
+        out = np.empty((chunk,) + signal.shape, dtype=np.complex128)
+    phase = np.empty((chunk, signal.shape[-1]), dtype=np.float64) if phased else None
+    rotation = np.empty((chunk, signal.shape[-1]), dtype=np.complex128) if phased else None
+    [noise_rng, phase_rng] = _streams(rng)
+    for r0 in range(0, n_rows, chunk):
+        r1 = min(r0 + chunk, n_rows)
+        yield [snr_rows[r0:r1], _fill(signal, power, snr_rows[r0:r1], sig.fs, sig.fb, df, foff, noise_rng, phase_rng,
+                                      out[:r1 - r0], None if phase is None else phase[:r1 - r0],
+                                      None if rotation is None else rotation[:r1 - r0])]
+
+
+def iter_signals(sig, snrs, trials=1, df=0, foff=0, rng=None, memory_budget=MEMORY_BUDGET):
+    """
+    Generates the rows of the batch of impair_batch one at a time, rebuilt as signals, eg. for recovery
+    The batch is made in chunks as in iter_batches, so each signal is only valid until the next one is generated
+
+    Output
+    ---------------------------------------------
+    snr : float
+        SNR of the row
+    impaired_sig : SignalQAMGrayCoded
+        Impaired copy of the signal
+    """
+    for [snr_rows, batch] in iter_batches(sig, snrs, trials, df, foff, rng, memory_budget):
+        for i in range(len(snr_rows)):
+            yield [snr_rows[i], sig.recreate_from_np_array(batch[i])]
+
+
+def recover_batch(sig, batch, recover):
+    """
+    Runs recovery on every row of a batch, or of a chunk from iter_batches, each rebuilt as a signal
+    The rows are recovered one after another, as QAMpy's equalisers and phase recovery take one signal at a time
+
+    Parameters
+    ---------------------------------------------
+    sig : SignalQAMGrayCoded
+        Signal the batch was made from, which gives the rows their signal parameters and reference symbols
+    batch : numpy array
+        Impaired copies of the signal, of shape (rows, nmodes, samples)
+    recover : function
+        Recovery run on each row, taking a signal, eg. Receive_Signal.recover_signal
+
+    Output
+    ---------------------------------------------
+    results : list
+        Output of recover for each row
+    """
+    return [recover(sig.recreate_from_np_array(row)) for row in batch]
+
+
+def est_snr_batch(batch, reference):
+    """
+    Estimates the SNR of every row and mode of a batch from the reference it should match, in one pass
+    Each row is scaled by the complex gain that best fits it to the reference, and the SNR is the reference's power
+    over the power of what is left
+
+    Parameters
+    ---------------------------------------------
+    batch : numpy array
+        Received signals, of shape (rows, nmodes, samples)
+    reference : numpy array
+        Transmitted signal, of shape (nmodes, samples)
+
+    Output
+    ---------------------------------------------
+    snr : numpy array
+        Estimated SNR in dB, of shape (rows, nmodes)
+    """
+    reference = np.asarray(reference)
+    ref_power = np.sum(np.abs(reference)**2, axis=-1)
+    gain = np.einsum("rmn,mn->rm", batch, reference.conj()) / ref_power
+    error_power = np.sum(np.abs(batch)**2, axis=-1) - np.abs(gain)**2 * ref_power     # power not explained by reference
+    return 10 * np.log10(np.abs(gain)**2 * ref_power / error_power)
@@ -0,0 +1,135 @@
+"""
+Reusable buffers for the padding and shifting stages of a simulation
+A BufferPool keeps one buffer per tag and hands back a view of it with the requested shape and dtype, only allocating
+when a larger buffer is needed, so a sweep that pads and shifts signals of the same size at every point allocates once.
+A buffer is reused the next time its tag is requested, so results held from a previous call with the same tag are
+overwritten. Pools are not thread-safe, so each worker thread should have its own.
+padded and rolled write their output in one copy, into a pool buffer if a pool is given or a new array otherwise.
+"""
+
+import numpy as np
+
+import Signal_Views
+
+
+class BufferPool:
+    """
+    Pool of reusable buffers, see module docstring
+    """
+
+    def __init__(self):
+        self._buffers = {}
+        self.allocations = 0    # number of times a buffer has been allocated
+
+    def get(self, tag, shape, dtype):
+        """
+        Gets an uninitialised array of the given shape and dtype, backed by the buffer for tag
+
+        Parameters
+        ---------------------------------------------
+        tag : txt
+            Name of the buffer, eg. the stage using it
+        shape : tuple
+            Shape of the array
+        dtype : numpy dtype
+            Data type of the array
+
+        Output
+        ---------------------------------------------
+        arr : numpy array
+            Array backed by the buffer, valid until the next call with the same tag
+        """
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        buffer = self._buffers.get(tag)
+        if buffer is None or len(buffer) < nbytes:
+            buffer = np.empty(nbytes, dtype=np.uint8)
+            self._buffers[tag] = buffer
+            self.allocations += 1
+        return buffer[:nbytes].view(dtype).reshape(shape)
+
+    def release(self, tag=None):
+        """
+        Frees the buffer for tag, or every buffer if tag is None
+        """
+        if tag is None:
+            self._buffers.clear()
+        else:
+            self._buffers.pop(tag, None)
+
+    def nbytes(self):
+        """
+        Total size of the buffers held by the pool
+        """
+        return sum(len(buffer) for buffer in self._buffers.values())
+
+
+def _output(shape, dtype, pool, tag):
+    if pool is None:
+        return np.empty(shape, dtype=dtype)
+    return pool.get(tag, shape, dtype)
+
+
+def padded(data, before, after, pool=None, tag="padded"):
+    """
+    Pads data with zeros along its last axis, in one copy into a buffer of the same dtype as data
+
+    Parameters
+    ---------------------------------------------
+    data : numpy array
+        Data to pad, of shape (nmodes, number of samples). Can be a Signal_Views.PeriodicView, which is read straight
+        into the output
+    before, after : integer
+        Number of zeros added to the start and end of each mode
+    pool : BufferPool
+        Pool that the output buffer is taken from. If None, a new array is made
+    tag : txt
+        Tag of the pool buffer
+
+    Output
+    ---------------------------------------------
+    out : numpy array
+        Padded data, of shape (nmodes, before + number of samples + after)
+    """
+    if not isinstance(data, Signal_Views.PeriodicView):
+        data = np.asarray(data)
+    n = data.shape[-1]
+    out = _output(data.shape[:-1] + (before + n + after,), data.dtype, pool, tag)
+    out[..., :before] = 0
+    if isinstance(data, Signal_Views.PeriodicView):
+        data.read_into(out[..., before:before + n])
+    else:
+        out[..., before:before + n] = data
+    out[..., before + n:] = 0
+    return out
+
+
+def rolled(data, shift, axis=-1, pool=None, tag="rolled"):
+    """
+    Rolls data along axis as np.roll does, in one copy
+
+    Parameters
+    ---------------------------------------------
+    data : numpy array
+        Data to roll
+    shift : integer
+        Number of places the data is shifted by, elements shifted past the end wrap around to the start
+    axis : integer
+        Axis to roll along
+    pool : BufferPool
+        Pool that the output buffer is taken from. If None, a new array is made
+    tag : txt
+        Tag of the pool buffer
+
+    Output
+    ---------------------------------------------
+    out : numpy array
+        Rolled data
+    """
+    data = np.moveaxis(np.asarray(data), axis, -1)
+    n = data.shape[-1]
+    out = _output(data.shape, data.dtype, pool, tag)
+    shift = int(np.sum(shift)) % n if n else 0
+    out[..., shift:] = data[..., :n - shift]
+    out[..., :shift] = data[..., n - shift:]
+    return np.moveaxis(out, -1, axis)
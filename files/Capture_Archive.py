@@ -0,0 +1,169 @@
+"""
+Append-only archive for storing many captures in one file
+Captures are stored back to back in a data file (<path>.dat), and a fixed size record for each capture is appended to
+an index file (<path>.idx). As capture ids are their position in the index, any capture can be found and memory-mapped
+without reading the others, and the index can be searched by M, SNR, sample rate or time without opening the data.
+"""
+
+import numpy as np
+import os
+import time
+
+DATA_DTYPE = np.dtype(np.complex128)    # captures are stored as complex128
+# record stored in the index file for each capture
+INDEX_DTYPE = np.dtype([("id", "<u8"), ("timestamp", "<f8"), ("M", "<u4"), ("nmodes", "<u4"), ("snr", "<f8"),
+                        ("fs", "<f8"), ("offset", "<u8"), ("length", "<u8")])
+
+
+class CaptureArchive:
+    """
+    Archive of captures in a pair of files, see module docstring
+
+    Parameters
+    ---------------------------------------------
+    path : txt
+        Path of the archive, without extension. Files are created if they don't exist
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data_path = path + ".dat"
+        self.index_path = path + ".idx"
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        for file_path in [self.data_path, self.index_path]:
+            if not os.path.isfile(file_path):
+                open(file_path, "wb").close()
+        self._index = None
+        self._data = None
+
+    def __len__(self):
+        return os.path.getsize(self.index_path) // INDEX_DTYPE.itemsize
+
+    @property
+    def index(self):
+        """
+        Index records of all captures, as a numpy structured array with fields id, timestamp, M, nmodes, snr, fs,
+        offset and length (samples per mode)
+        """
+        if self._index is None or len(self._index) != len(self):
+            self._index = np.fromfile(self.index_path, dtype=INDEX_DTYPE)
+        return self._index
+
+    def _data_map(self):
+        """
+        Memory map of the whole data file, remapped if captures have been added since it was made
+        """
+        n_values = os.path.getsize(self.data_path) // DATA_DTYPE.itemsize
+        if self._data is None or len(self._data) != n_values:
+            self._data = np.memmap(self.data_path, dtype=DATA_DTYPE, mode="r") if n_values else np.zeros(0, DATA_DTYPE)
+        return self._data
+
+    def append(self, data, M, snr, fs, timestamp=None):
+        """
+        Adds a capture to the end of the archive
+
+        Parameters
+        ---------------------------------------------
+        data : numpy array
+            Capture data, of shape (nmodes, number of samples)
+        M : integer
+            QAM order
+        snr : float
+            Signal to noise ratio of the capture
+        fs : float
+            Sample rate of the capture
+        timestamp : float
+            Time of the capture in seconds since the epoch, if None the current time is used
+
+        Output
+        ---------------------------------------------
+        capture_id : integer
+            Id of the capture, used to load it
+        """
+        data = np.atleast_2d(np.asarray(data, dtype=DATA_DTYPE))
+        if timestamp is None:
+            timestamp = time.time()
+        capture_id = len(self)
+
+        # data is written before its index record, so a capture is only visible once it is complete
+        with open(self.data_path, "ab") as fid:
+            offset = fid.tell()
+            np.ascontiguousarray(data).tofile(fid)
+        record = np.array([(capture_id, timestamp, M, data.shape[0], snr, fs, offset, data.shape[1])],
+                          dtype=INDEX_DTYPE)
+        with open(self.index_path, "ab") as fid:
+            record.tofile(fid)
+        return capture_id
+
+    def load(self, capture_id):
+        """
+        Gets a capture as a read-only array memory-mapped from the archive, without reading any other capture
+
+        Output
+        ---------------------------------------------
+        data : numpy array
+            Capture data, of shape (nmodes, number of samples)
+        record : numpy record
+            Index record of the capture
+        """
+        record = self.index[capture_id]
+        return [self._view(self._data_map(), record), record]
+
+    @staticmethod
+    def _view(data_map, record):
+        start = int(record["offset"]) // DATA_DTYPE.itemsize
+        size = int(record["nmodes"]) * int(record["length"])
+        return data_map[start:start + size].reshape(int(record["nmodes"]), int(record["length"]))
+
+    def find(self, M=None, snr=None, fs=None, since=None, until=None):
+        """
+        Finds the captures that match all of the given parameters, by searching the index only
+
+        Parameters
+        ---------------------------------------------
+        M, snr, fs : float
+            Values to match, ignored if None
+        since, until : float
+            Only captures taken in this range of time are matched, ignored if None
+
+        Output
+        ---------------------------------------------
+        capture_ids : numpy array
+            Ids of the matching captures
+        """
+        index = self.index
+        match = np.ones(len(index), dtype=bool)
+        if M is not None:
+            match &= index["M"] == M
+        if snr is not None:
+            match &= np.isclose(index["snr"], snr)
+        if fs is not None:
+            match &= np.isclose(index["fs"], fs)
+        if since is not None:
+            match &= index["timestamp"] >= since
+        if until is not None:
+            match &= index["timestamp"] <= until
+        return index["id"][match]
+
+    def iter_captures(self, capture_ids=None):
+        """
+        Iterates over captures for offline reprocessing, using a single memory map of the archive
+
+        Parameters
+        ---------------------------------------------
+        capture_ids : list
+            Ids of the captures to iterate over, eg. from find. If None, iterates over every capture
+
+        Output
+        ---------------------------------------------
+        Generator of [data, record] for each capture
+        """
+        index = self.index
+        data_map = self._data_map()
+        if capture_ids is None:
+            capture_ids = range(len(index))
+        for capture_id in capture_ids:
+            record = index[capture_id]
+            yield [self._view(data_map, record), record]
@@ -0,0 +1,150 @@
+"""
+Fractional delays by any real number of samples
+    fft_delay: multiplies the spectrum of the whole signal by a linear phase ramp, which is an exact circular delay of
+               a band-limited signal
+    farrow_delay / FarrowDelay: cubic Lagrange interpolation in Farrow form, where the delay can change from sample to
+               sample, for signals that are processed in blocks as they arrive
+    farrow_read: the same interpolation at any positions, eg. for sampling with another clock
+"""
+
+import numpy as np
+
+
+def fft_delay(x, delay, out=None):
+    """
+    Delays x circularly by delay samples along its last axis, using a phase ramp in the frequency domain
+
+    Parameters
+    ---------------------------------------------
+    x : numpy array
+        Signal, of shape (nmodes, number of samples)
+    delay : float
+        Delay in samples, can be any real number. Positive delays move the signal later in time
+    out : numpy array
+        Complex array that the output is written to, can be x itself. If None, a new one is made
+
+    Output
+    ---------------------------------------------
+    out : numpy array (complex)
+        Delayed signal
+    """
+    n = np.shape(x)[-1]
+    spectrum = np.fft.fft(x, axis=-1)
+    ramp = np.exp(-2j * np.pi * np.fft.fftfreq(n) * delay)
+    if n % 2 == 0:
+        # the Nyquist bin is shared by positive and negative frequencies, so it gets the real part of the ramp
+        ramp[n // 2] = np.cos(np.pi * delay)
+    spectrum *= ramp
+    if out is None:
+        return np.fft.ifft(spectrum, axis=-1)
+    out[...] = np.fft.ifft(spectrum, axis=-1)
+    return out
+
+
+def _farrow(x0, x1, x2, x3, t):
+    """
+    Cubic Lagrange interpolation between x1 and x2 at fraction t, from the 4 samples x0 to x3, in Farrow form
+    """
+    c1 = -x0 / 3 - x1 / 2 + x2 - x3 / 6
+    c2 = (x0 + x2) / 2 - x1
+    c3 = (x3 - x0) / 6 + (x1 - x2) / 2
+    return ((c3 * t + c2) * t + c1) * t + x1
+
+
+def farrow_read(x, position):
+    """
+    Reads x circularly at any real positions along its last axis, using cubic interpolation, eg. to sample a signal
+    with a different or uneven clock
+
+    Parameters
+    ---------------------------------------------
+    x : numpy array
+        Signal, of shape (nmodes, number of samples), taken to repeat along its last axis
+    position : numpy array
+        Positions to read, in samples of x
+
+    Output
+    ---------------------------------------------
+    out : numpy array
+        x at each position, of shape (nmodes, number of positions)
+    """
+    x = np.asarray(x)
+    n = x.shape[-1]
+    m = np.floor(position)
+    t = position - m
+    m = m.astype(np.int64)
+    return _farrow(x[..., (m - 1) % n], x[..., m % n], x[..., (m + 1) % n], x[..., (m + 2) % n], t)
+
+
+def farrow_delay(x, delay):
+    """
+    Delays x circularly by delay samples along its last axis, using cubic interpolation
+    Less accurate than fft_delay close to the Nyquist frequency, but the delay can be different for every sample
+
+    Parameters
+    ---------------------------------------------
+    x : numpy array
+        Signal, of shape (nmodes, number of samples)
+    delay : float or numpy array
+        Delay in samples, either one value or one value per sample
+
+    Output
+    ---------------------------------------------
+    out : numpy array
+        Delayed signal
+    """
+    x = np.asarray(x)
+    position = np.arange(x.shape[-1]) - np.asarray(delay, dtype=np.float64)  # where each output sample is read from
+    return farrow_read(x, position)
+
+
+class FarrowDelay:
+    """
+    Streaming fractional delay, for signals processed in blocks
+    Keeps the last samples of the previous block so that the output is continuous across blocks. Each output sample n
+    is x(n - delay), which needs x up to 2 samples after the one being read, so the delay must be at least MIN_DELAY.
+
+    Parameters
+    ---------------------------------------------
+    max_delay : float
+        Largest delay, in samples, that will be applied
+    nmodes : integer
+        Number of modes of the signal
+    dtype : numpy dtype
+        Data type of the signal
+    """
+    MIN_DELAY = 2
+
+    def __init__(self, max_delay, nmodes=1, dtype=np.complex128):
+        self.history = np.zeros((nmodes, int(np.ceil(max_delay)) + 2), dtype=dtype)
+        self.max_delay = max_delay
+
+    def process(self, block, delay):
+        """
+        Delays the next block of the signal
+
+        Parameters
+        ---------------------------------------------
+        block : numpy array
+            Next samples of the signal, of shape (nmodes, number of samples)
+        delay : float or numpy array
+            Delay in samples, either one value or one value per sample of the block, between MIN_DELAY and max_delay
+
+        Output
+        ---------------------------------------------
+        out : numpy array
+            Delayed block, of the same shape as block
+        """
+        delay = np.asarray(delay, dtype=np.float64)
+        if np.any(delay < self.MIN_DELAY) or np.any(delay > self.max_delay):
+            raise ValueError("delay must be between %d and %g samples" % (self.MIN_DELAY, self.max_delay))
+        block = np.atleast_2d(block)
+        h = self.history.shape[-1]
+        ext = np.concatenate((self.history, block), axis=-1)
+        position = h + np.arange(block.shape[-1]) - delay
+        m = np.floor(position)
+        t = position - m
+        m = m.astype(np.int64)
+        out = _farrow(ext[..., m - 1], ext[..., m], ext[..., m + 1], ext[..., m + 2], t)
+        self.history = ext[..., -h:].copy()
+        return out
@@ -4,11 +4,18 @@ Code for generating a QAM signal and saving it to a file
 
 from qampy import signals, impairments, equalisation, phaserec, helpers
 import numpy as np
+import math
 from bokeh.io import output_notebook
 from bokeh.plotting import figure, show
 import os
-
-def add_edges(sig, edge_size, nmodes=2):
+import Signal_Container
+import Signal_Cache
+import Payload
+import Resampling
+import Signal_Views
+import Buffer_Pool
+
+def add_edges(sig, edge_size, nmodes=2, pool=None):
     """
     Adds edges to either side of signal filled with 0's of length edge_size
 
@@ -18,27 +25,30 @@ def add_edges(sig, edge_size, nmodes=2):
         Signal that is to have edges added to
     edge_size : integer
         length of edges to be added to each side of signal. Edges are made of 0's
+    pool : Buffer_Pool.BufferPool
+        Pool that the padded signal's buffer is taken from, eg. in a sweep. If None, a new array is made
 
     Output
     ---------------------------------------------
     sig : SignalQAMGrayCoded
         Signal that has had edges added
     """
-    sig_temp = sig      # gets temporary signal
-    arr_0 = np.zeros((nmodes, edge_size))    # gets array of zeros
-    sig_temp = np.concatenate((sig_temp, arr_0), axis=1)   # adds 0's to end of signal
-    sig_temp = np.concatenate((arr_0, sig_temp), axis=1)   # adds 0's to start of signal
+    # signal is copied once into a zeroed buffer of its own dtype
+    sig_temp = Buffer_Pool.padded(sig, edge_size, edge_size, pool, "add_edges")
     out_sig = sig.recreate_from_np_array(sig_temp)  # gets rebuilt signal
     return out_sig
 
-def generate_random_data(length):
+def generate_random_data(length, packed=False, rng=None):
     """
     Generates a random array of bits of size length
+    If packed is True, the bits are returned packed 8 to a byte (see Payload), otherwise as a uint8 array of 0s and 1s
+    Bits are drawn from rng (a numpy Generator, see Random_Streams), or from numpy's global random state if it is None
     To be implemented: given a set of symbols, only generate sets of bits that map to symbols in that set
     """
-    sample_data = [0,1]
-    data = np.random.choice(sample_data, size=length)
-    return data
+    data = Payload.random_payload(length, 2, rng=rng)[0]  # 1 bit per symbol of 2-QAM gives length bits
+    if packed:
+        return data
+    return np.unpackbits(data, count=length)
 
 
 def encode_data(sig, data, data2=[]):
@@ -46,17 +56,19 @@ def encode_data(sig, data, data2=[]):
     Encodes the given data onto the given signal
     If 2 sets of data are given, and the given signal has dual polarisation, will encode the each set of data to a separate polarisation.
     Note that if a 2nd set of data is included, but the signal only has a single polarisation, the 2nd set of data will be ignored.
+    Both polarisations are encoded in one call, straight into the signal, and its reference symbols and bits are updated
+    to match (see Payload.encode_payload). Only as many symbols as the shorter set of data (and the signal) holds are
+    encoded.
     """
-    # encodes data onto 1st polarisation
-    encoded_signal = sig.modulate(data)
-    #sig[0] = encoded_signal
-
-    # encodes data2 to 2nd polarisation if given
-    if data2 != [] and sig.nmodes==2:
-        encoded_signal2 = sig.modulate(data2)
-        #sig[1] = encoded_signal2       # fix size mismatch issue
-        return [sig, encoded_signal, encoded_signal2]
-    return [sig, encoded_signal]
+    if len(data2) != 0 and sig.nmodes == 2:
+        mode_data = [data, data2]
+    else:
+        mode_data = [data]
+    nbits = Payload.bits_per_symbol(sig.M)
+    n_symbols = min(min(len(d) for d in mode_data) // nbits, sig.shape[1])
+    payload = np.array([np.packbits(np.asarray(d[:n_symbols * nbits], dtype=np.uint8)) for d in mode_data])
+    Payload.encode_payload(sig, payload, n_symbols)
+    return [sig] + [sig[i, :n_symbols] for i in range(len(mode_data))]
 
 
 def save_sig_data_to_file(sig, path="C:/Users/wamcc1/Documents/QAM_sig", filename="sig_data.txt"):  # TO DO: save original signal data + noisy signal E as pickle
@@ -105,6 +117,40 @@ def save_sig_data_to_file(sig, path="C:/Users/wamcc1/Documents/QAM_sig", filenam
     os.close(fid)   # closes file
     return
 
+def save_sig_to_container(sig, path="C:/Users/wamcc1/Documents/QAM_sig", filename="sig_data.qsig", symbols=None):
+    """
+    Saves sig to a binary container file with given path and filename, along with its parameters (fs, fb, M, nmodes)
+    and reference symbols, so that it can be loaded without parsing text. If path does not exist, creates it.
+
+    Parameters
+    ---------------------------------------------
+    sig : SignalQAMGrayCoded
+        Signal that is to be saved to a file
+    path : txt
+        Path of where file is to be saved
+    filename : txt
+        Name of file where data is to be saved. If file already exists, overwrites it.
+    symbols : numpy array
+        Reference symbols to be saved with the signal. If None, the symbols of sig are used
+
+    Output
+    ---------------------------------------------
+    file_path : txt
+        Path of the saved file
+    """
+    # checks if path exists
+    if not os.path.isdir(path):
+        # creates path if it doesn't exist
+        os.makedirs(path)
+    file_path = os.path.join(path, filename)
+
+    if symbols is None:
+        symbols = sig.symbols
+    meta = {"fs": float(sig.fs), "fb": float(sig.fb), "M": int(sig.M), "nmodes": int(sig.shape[0]),
+            "N": int(np.shape(symbols)[-1])}
+    Signal_Container.write_container(file_path, sig, meta, symbols)
+    return file_path
+
 def generate_AWG_signal(M, N, nmodes=2, fs=1, fb=1, shift=0, **kwargs):
     """
     Generates a signal that gets resampled at the output DAC
@@ -122,6 +168,12 @@ def generate_AWG_signal(M, N, nmodes=2, fs=1, fb=1, shift=0, **kwargs):
     fb : Integer
         Baud rate of AWG (symbols/s)
     shift : 
+    seed : Integer
+        Optional keyword argument. If given, the signal is generated from this random seed and cached (see
+        Signal_Cache), so that runs with the same parameters and seed reuse it rather than generating it again
+    rng : numpy Generator
+        Optional keyword argument. If given (and seed is not), the signal is generated from this Generator without
+        being cached, eg. for a sweep point (see Random_Streams)
 
     Output
     ---------------------------------------------
@@ -132,16 +184,25 @@ def generate_AWG_signal(M, N, nmodes=2, fs=1, fb=1, shift=0, **kwargs):
         beta = kwargs.pop("beta")
     else:
         beta = 0.1
+    seed = kwargs.pop("seed", None)
+    rng = kwargs.pop("rng", None)
 
-    sig = signals.SignalQAMGrayCoded(M, N, fb=fb, nmodes=nmodes)
+    if seed is None:
+        sig = Signal_Cache.generate_signal(signals.SignalQAMGrayCoded, M, N, fb=fb, nmodes=nmodes, seed=rng)
+    else:
+        sig = Signal_Cache.get_signal(signals.SignalQAMGrayCoded, M, N, fb=fb, nmodes=nmodes, seed=seed)
     plot_constellation(sig, "Initial signal")
 
     # resample signal at output DAC
-    signal_to_be_transmitted = sig.resample(fs, beta=beta)
+    if seed is None:
+        signal_to_be_transmitted = Resampling.resample_signal(sig, fs, beta=beta)
+    else:
+        signal_to_be_transmitted = Signal_Cache.get_signal(signals.SignalQAMGrayCoded, M, N, fb=fb, nmodes=nmodes,
+                                                           fs=fs, beta=beta, seed=seed)
 
     return signal_to_be_transmitted 
 
-def copy_sig(sig, n):
+def copy_sig(sig, n, view=False):
     """
     Copies a signal n times and returns the rebuilt signal
 
@@ -150,28 +211,24 @@ def copy_sig(sig, n):
     sig : SignalQAMGrayCoded
         Signal to have its data copied and then rebuilt
     n : float
-        number of times signal should be copied. For full waveform recovery, n>=2
+        number of times signal should be copied, any real n >= 1. For full waveform recovery, n>=2
+    view : bool
+        If True, returns a read-only Signal_Views.PeriodicView of the copies instead, which doesn't copy the data
 
     Output
     ---------------------------------------------
     rebuilt_sig : SignalQAMGrayCoded
-        Signal that has the data of sig copied n times
+        Signal that has the data of sig copied n times, with the last copy cut short if n is a fraction
     """
-    sig_temp = sig  # gets temporary signal 
-
-    # checks if n is a whole number
-    if math.floor(n) == n:
-        sig_temp = np.tile(sig_temp, n)
-
-    # not currently working, to be fixed
-    else:       # if n is a fraction
-        slice = math.floor((n % 1) * len(sig_temp))   # gets how many array elements are in fractional part of n
-        frac_temp = sig_temp[:slice]    # gets copy of signal of length equal to fractional part of n
-        sig_temp = np.tile(sig_temp, math.floor(n)) # gets floor(n) copies of original signal
-        sig_temp = np.append(sig_temp, frac_temp)   # combines fractional and whole copies of signal
-        print(sig[0])
-        print(frac_temp[0])
-
+    if n < 1:
+        raise ValueError("n must be at least 1, got %s" % n)
+    length = int(math.floor(n * sig.shape[-1]))    # gets number of samples in n copies
+    if view:
+        return Signal_Views.PeriodicView(sig, length)
+
+    # copies are written once into a preallocated array, rather than tiled and appended
+    sig_temp = np.empty(sig.shape[:-1] + (length,), dtype=sig.dtype)
+    Signal_Views.periodic_extend(np.asarray(sig), length, sig_temp)
     rebuilt_sig = sig.recreate_from_np_array(sig_temp)  # gets rebuilt signal
     return rebuilt_sig
 
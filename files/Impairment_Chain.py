@@ -0,0 +1,255 @@
+"""
+Impairment chains, for applying a list of impairments to a signal in as few passes over it as possible
+A chain is declared as a list of stages, each a stage name and a dict of its parameters, eg.
+    [("awgn", {"snr": 20}), ("resample", {"fnew": 2*fb, "beta": 0.1, "renormalise": True}),
+     ("phase_noise", {"df": 100e3}), ("delay", {"shift": 1000}), ("fractional_delay", {"delay": 0.37}),
+     ("padding", {"edge_size": 5000})]
+The stages are applied in order to one working buffer, in place where the stage allows it:
+    awgn : adds white Gaussian noise, snr in dB within the signal bandwidth (as Impairments.add_awgn)
+    phase_noise : laser phase noise of linewidth df, the same for every mode (as QAMpy's apply_phase_noise)
+    frequency_offset : carrier frequency offset of foff Hz
+    dgd : differential group delay of tau seconds between the modes, with the modes rotated by theta radians first
+    delay : circular delay by shift samples (as Impairments.delay)
+    fractional_delay : circular delay by delay symbol periods, any real number (as Impairments.fractional_delay)
+    padding : edge_size zeros added to each side (as Impairments.add_edges)
+    resample : resampling to fnew in one polyphase pass (see Resampling.poly_resample), with beta, taps, renormalise
+               and circular (True by default, so the signal wraps as in QAMpy's FFT resampling)
+Consecutive stages that can share a pass are fused:
+    phase_noise and frequency_offset add up to one phase, applied with one complex multiply
+    delay, fractional_delay and dgd are all filters, applied between one FFT and one inverse FFT. Delays on their own
+    are applied with one roll if they are whole samples, or folded into the filter of a resample straight after them
+Scratch space and the buffers of stages that change the length of the signal come from a Buffer_Pool.BufferPool, so
+applying the same chain again (eg. at every point of a sweep) allocates nothing new, and the output of apply is only
+valid until the next call. The time taken by each pass is added up in timings, one entry per pass, see report.
+"""
+
+import time
+
+import numpy as np
+import scipy.fft
+
+import Buffer_Pool
+import Random_Streams
+import Resampling
+import Signal_Views
+
+STAGES = ("awgn", "phase_noise", "frequency_offset", "dgd", "delay", "fractional_delay", "padding", "resample")
+PHASE_STAGES = ("phase_noise", "frequency_offset")
+FILTER_STAGES = ("delay", "fractional_delay", "dgd")
+
+
+def noise_stages(snr, fnew, df=100e3):
+    """
+    Gets the stages that Impairments.add_noise applies: noise, oversampling to fnew and phase noise
+    """
+    return [("awgn", {"snr": snr}), ("resample", {"fnew": fnew, "beta": 0.1, "renormalise": True}),
+            ("phase_noise", {"df": df})]
+
+
+def _plan(stages):
+    """
+    Groups the stages into the passes that apply them, see module docstring
+    """
+    passes = []
+    for [name, params] in stages:
+        if name not in STAGES:
+            raise ValueError("unknown stage '%s', should be one of %s" % (name, ", ".join(STAGES)))
+        last = passes[-1] if passes else None
+        if last is not None and name in PHASE_STAGES and last[0] == "phase":
+            last[1].append((name, params))
+        elif last is not None and name in FILTER_STAGES and last[0] == "filter":
+            last[1].append((name, params))
+        elif last is not None and name == "resample" and last[0] == "filter" and params.get("circular", True) and \
+                not any(stage[0] == "dgd" for stage in last[1]):
+            passes[-1] = ("resample", last[1] + [(name, params)])
+        elif name in PHASE_STAGES:
+            passes.append(("phase", [(name, params)]))
+        elif name in FILTER_STAGES:
+            passes.append(("filter", [(name, params)]))
+        else:
+            passes.append((name, [(name, params)]))
+    return passes
+
+
+def _delay_samples(stage, fs, fb):
+    """
+    Gets the delay of a delay or fractional_delay stage in samples
+    """
+    [name, params] = stage
+    if name == "delay":
+        return int(np.sum(params["shift"]))
+    return params["delay"] * fs / fb
+
+
+def _delay_ramp(freq, delay, out):
+    """
+    Writes the spectrum of a circular delay by delay samples to out, as Fractional_Delay.fft_delay
+    """
+    np.multiply(freq, -2j * np.pi * delay, out=out)
+    np.exp(out, out=out)
+    n = len(freq)
+    if n % 2 == 0:
+        out[n // 2] = np.cos(np.pi * delay)
+    return out
+
+
+class ImpairmentChain:
+    """
+    Declarative list of impairments applied to a signal in fused passes, see module docstring
+
+    Parameters
+    ---------------------------------------------
+    stages : list
+        Stages of the chain, each a tuple of stage name and dict of parameters, applied in order
+    pool : Buffer_Pool.BufferPool
+        Pool that the working buffers are taken from. If None, the chain makes its own
+    """
+
+    def __init__(self, stages, pool=None):
+        self.stages = list(stages)
+        self.passes = _plan(self.stages)
+        self.pool = Buffer_Pool.BufferPool() if pool is None else pool
+        self.timings = [0.0] * len(self.passes)     # total time taken by each pass, in the order of passes
+        self.runs = 0
+
+    @staticmethod
+    def _label(stages):
+        return "+".join(name for [name, params] in stages)
+
+    def _awgn(self, buf, params, fs, fb, rng):
+        power = np.mean(np.abs(buf)**2, axis=-1, keepdims=True)     # power of each mode
+        strength = np.sqrt(power * fs / fb / 10**(params["snr"]/10) / 2)   # standard deviation of real and imaginary parts
+        noise = self.pool.get("chain_noise", buf.shape[:-1] + (2 * buf.shape[-1],), np.float64)
+        rng.standard_normal(out=noise)
+        noise *= strength
+        buf.view(np.float64)[...] += noise     # real and imaginary parts are interleaved
+        return buf
+
+    def _phase(self, buf, stages, fs, rng):
+        n = buf.shape[-1]
+        phase = self.pool.get("chain_phase", (n,), np.float64)
+        phase[...] = 0
+        for [name, params] in stages:
+            if name == "phase_noise":
+                # Wiener phase noise, the sum of steps of variance 2*pi*df/fs
+                steps = self.pool.get("chain_noise", (n,), np.float64)
+                rng.standard_normal(out=steps)
+                steps *= np.sqrt(2 * np.pi * params["df"] / fs)
+                phase += np.cumsum(steps, out=steps)
+            else:
+                phase += np.arange(n) * (2 * np.pi * params["foff"] / fs)
+        rotation = self.pool.get("chain_rotation", (n,), np.complex128)
+        np.multiply(phase, 1j, out=rotation)
+        np.exp(rotation, out=rotation)
+        buf *= rotation
+        return buf
+
+    def _filter(self, buf, stages, fs, fb):
+        delays = [_delay_samples(stage, fs, fb) for stage in stages if stage[0] != "dgd"]
+        total = sum(delays)
+        dgds = [params for [name, params] in stages if name == "dgd"]
+        if not dgds and all(float(d).is_integer() for d in delays):
+            # whole sample delays are one roll, with no FFT
+            return Buffer_Pool.rolled(buf, int(total), -1, self.pool, "chain%d" % self._next())
+        n = buf.shape[-1]
+        spectrum = scipy.fft.fft(buf, axis=-1, overwrite_x=True)
+        freq = np.fft.fftfreq(n)
+        ramp = self.pool.get("chain_rotation", (n,), np.complex128)
+        if not dgds:
+            spectrum *= _delay_ramp(freq, total, ramp)
+        for params in dgds:
+            if spectrum.shape[0] != 2:
+                raise ValueError("dgd needs a signal with 2 modes, got %d" % spectrum.shape[0])
+            c = np.cos(params.get("theta", 0))
+            s = np.sin(params.get("theta", 0))
+            # rotates onto the principal states, delays them by +-tau/2, rotates back. The delays of the other
+            # stages are added to both modes of the first dgd
+            x = self.pool.get("chain_mode", (n,), np.complex128)
+            x[...] = spectrum[0]
+            y = spectrum[1]
+            spectrum[0] *= c
+            spectrum[0] -= s * y
+            y *= c
+            y += s * x
+            half = params["tau"] * fs / 2
+            spectrum[0] *= _delay_ramp(freq, total + half, ramp)
+            spectrum[1] *= _delay_ramp(freq, total - half, ramp)
+            total = 0
+            x[...] = spectrum[0]
+            spectrum[0] *= c
+            spectrum[0] += s * y
+            y *= c
+            y -= s * x
+        out = scipy.fft.ifft(spectrum, axis=-1, overwrite_x=True)
+        if not np.shares_memory(out, buf):
+            buf[...] = out
+        return buf
+
+    def _next(self):
+        # the working buffer alternates between 2 pool buffers, for stages that read one and write the other
+        self._current = 1 - self._current
+        return self._current
+
+    def _resample(self, buf, stages, fs, fb):
+        params = stages[-1][1]
+        delay = sum(_delay_samples(stage, fs, fb) for stage in stages[:-1])
+        [up, down] = Resampling.resampling_factors(fs, params["fnew"])
+        out = self.pool.get("chain%d" % self._next(), buf.shape[:-1] + (-(-buf.shape[-1] * up // down),),
+                            np.complex128)
+        return Resampling.poly_resample(buf, fs, params["fnew"], delay, params.get("circular", True), 1 / fb,
+                                        params.get("beta"), params.get("taps", 4001), params.get("renormalise", False),
+                                        out=out)
+
+    def apply(self, sig, rng=None):
+        """
+        Applies the chain to a signal
+
+        Parameters
+        ---------------------------------------------
+        sig : SignalQAMGrayCoded
+            Signal to apply the impairments to, which is left unchanged. Can be a Signal_Views.PeriodicView
+        rng : numpy Generator
+            Source of the noise (see Random_Streams). If None, a Generator is seeded from numpy's global random state
+
+        Output
+        ---------------------------------------------
+        impaired_sig : SignalQAMGrayCoded
+            Signal with the impairments applied, at the sample rate of the last resample stage. Its data is a pool
+            buffer that is overwritten the next time the chain is applied
+        """
+        rng = Random_Streams.as_generator(rng)
+        fs = sig.fs
+        fb = sig.fb
+        self._current = 0
+        buf = self.pool.get("chain0", sig.shape, np.complex128)
+        if isinstance(sig, Signal_Views.PeriodicView):
+            sig.read_into(buf)
+        else:
+            buf[...] = sig
+        for i, [kind, stages] in enumerate(self.passes):
+            t = time.perf_counter()
+            if kind == "awgn":
+                buf = self._awgn(buf, stages[0][1], fs, fb, rng)
+            elif kind == "phase":
+                buf = self._phase(buf, stages, fs, rng)
+            elif kind == "filter":
+                buf = self._filter(buf, stages, fs, fb)
+            elif kind == "padding":
+                edge_size = stages[0][1]["edge_size"]
+                buf = Buffer_Pool.padded(buf, edge_size, edge_size, self.pool, "chain%d" % self._next())
+            else:
+                buf = self._resample(buf, stages, fs, fb)
+                fs = stages[-1][1]["fnew"]
+            self.timings[i] += time.perf_counter() - t
+        self.runs += 1
+        return sig.recreate_from_np_array(buf, fs=fs)
+
+    def report(self):
+        """
+        Prints the mean time taken by each pass of the chain, one line per pass numbered in order, and returns the text
+        """
+        runs = max(self.runs, 1)
+        text = "\n".join("pass %d, %s: %.2f ms" % (i, self._label(stages), 1e3 * total / runs)
+                         for i, [[kind, stages], total] in enumerate(zip(self.passes, self.timings)))
+        print(text)
+        return text
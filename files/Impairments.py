@@ -9,9 +9,14 @@ import numpy as np
 from bokeh.io import output_notebook
 from bokeh.plotting import figure, show
 import os
+import Resampling
+import Random_Streams
+import Buffer_Pool
+import Fractional_Delay
+import Signal_Views
 
 
-def add_noise(sig, snr, df=100e3):
+def add_noise(sig, snr, df=100e3, rng=None):
     """
     Adds noise to signal
 
@@ -23,20 +28,49 @@ def add_noise(sig, snr, df=100e3):
         Signal to noise ratio
     df : float
         Combined linewidth of oscillators in the system
+    rng : numpy Generator
+        Source of the noise (see Random_Streams). If None, numpy's global random state is used
 
     Output
     ---------------------------------------------
     noisy_signal : SignalQAMGrayCoded
         Signal that has had noise added to it
     """
-    noisy_signal = impairments.change_snr(sig, snr)     # adds noise to signal
-    noisy_signal = noisy_signal.resample(2*noisy_signal.fb, beta=0.1, renormalise=True) # oversample signal
-    noisy_signal = impairments.apply_phase_noise(noisy_signal, df)
+    with Random_Streams.seeded_global(rng):
+        noisy_signal = impairments.change_snr(sig, snr)     # adds noise to signal
+        noisy_signal = Resampling.resample_signal(noisy_signal, 2*noisy_signal.fb, beta=0.1, renormalise=True) # oversample signal
+        noisy_signal = impairments.apply_phase_noise(noisy_signal, df)
 
     return noisy_signal
 
 
-def delay(sig, shift, nmodes=2):
+def add_awgn(sig, snr, rng=None):
+    """
+    Adds white Gaussian noise to signal, drawn from rng
+
+    Parameters
+    ---------------------------------------------
+    sig : SignalQAMGrayCoded
+        Signal that is to have noise added to it
+    snr : float
+        Signal to noise ratio in dB, within the signal bandwidth (fb), so the noise power is scaled by fs/fb
+    rng : numpy Generator
+        Source of the noise (see Random_Streams). If None, a Generator is seeded from numpy's global random state
+
+    Output
+    ---------------------------------------------
+    noisy_signal : SignalQAMGrayCoded
+        Signal that has had noise added to it
+    """
+    rng = Random_Streams.as_generator(rng)
+    power = np.mean(np.abs(sig)**2, axis=-1, keepdims=True)     # power of each mode
+    strength = np.sqrt(power * sig.fs / sig.fb / 10**(snr/10) / 2)   # standard deviation of real and imaginary parts
+    noise = rng.standard_normal((2,) + sig.shape)
+    noisy_signal = sig + strength * (noise[0] + 1j*noise[1])
+    return sig.recreate_from_np_array(np.asarray(noisy_signal))
+
+
+def delay(sig, shift, nmodes=2, pool=None, lazy=False):
     """
     Shifts a given signal by an amount given by shift
 
@@ -48,20 +82,35 @@ def delay(sig, shift, nmodes=2):
         How much signal is to be shifted by and in which direction
     nmodes : integer
         Number of polarisations of signal
+    pool : Buffer_Pool.BufferPool
+        Pool that the shifted signal's buffer is taken from, eg. in a sweep. If None, a new array is made
+    lazy : bool
+        If True (and nmodes is 2), returns a Signal_Views.PeriodicView that only records the shift, so no samples are
+        copied until they are read. add_edges, resampling and recover_full_waveform read through it
 
     Output
     ---------------------------------------------
     sig : SignalQAMGrayCoded
         Signal that has been shifted
     """
+    if nmodes == 2:
+        if isinstance(sig, Signal_Views.PeriodicView):
+            view = sig.rolled(shift)    # adds to the view's shift
+            if view is not None:
+                return view if lazy else view.materialize(Buffer_Pool._output(view.shape, view.dtype, pool, "delay"))
+            sig = sig.materialize()
+        if lazy:
+            return Signal_Views.PeriodicView(sig, offset=shift)
+    elif isinstance(sig, Signal_Views.PeriodicView):
+        sig = sig.materialize()
     if nmodes == 1:
-        sig = np.roll(sig, shift, axis=0) #single polarization desynchronization
+        sig = sig.recreate_from_np_array(Buffer_Pool.rolled(sig, shift, 0, pool, "delay")) #single polarization desynchronization
     if nmodes == 2:
-        sig = np.roll(sig, shift, axis=1) #dual polarization desynchronization
+        sig = sig.recreate_from_np_array(Buffer_Pool.rolled(sig, shift, 1, pool, "delay")) #dual polarization desynchronization
 
     return sig
 
-def simulate_AWG(sig, upsample_multiplier=4, scope_rate=80e9, delay_max_offset=1):
+def simulate_AWG(sig, upsample_multiplier=4, scope_rate=80e9, delay_max_offset=1, rng=None, pool=None, method="fft"):
     """
     Simulates the AWG by upsampling the signal, delaying it by a random amount, then downsampling to scope sample rate
 
@@ -75,28 +124,45 @@ def simulate_AWG(sig, upsample_multiplier=4, scope_rate=80e9, delay_max_offset=1
         Sample rate of the oscilloscope, default 80GS/s
     delay_max_offset : float
         Maximum amount that signal is delayed, 1 means that signal can be delayed by up to 1 full signal length
+    rng : numpy Generator
+        Source of the random delay (see Random_Streams). If None, a Generator is seeded from numpy's global random state
+    pool : Buffer_Pool.BufferPool
+        Pool that the delayed signal's buffer is taken from, eg. in a sweep. If None, a new array is made
+    method : txt
+        "fft" to upsample, delay and downsample as separate steps, or "poly" to go straight to the scope rate in one
+        polyphase pass with the same random delay folded into the filter (see Resampling.poly_resample), which only
+        filters the signal once and never holds the upsampled signal
 
     Output
     ---------------------------------------------
     AWG_sig : SignalQAMGrayCoded
         Signal that has had AWG simulation applied to it
     """
+    if method == "poly":
+        [up, down] = Resampling.resampling_factors(sig.fs, sig.fs*upsample_multiplier)
+        N = 2 * -(-sig.shape[-1] * up // down)  # total number of symbols the upsampled signal would have
+        rng = Random_Streams.as_generator(rng)
+        shift = rng.integers(-int(delay_max_offset*N), int(delay_max_offset*N), 1)
+        return Resampling.poly_resample_signal(sig, scope_rate, shift[0] / upsample_multiplier, circular=True,
+                                               beta=0.1, renormalise=True)
+
     # upsample to AWG sample rate (92e9)
-    sig = sig.resample(sig.fs*upsample_multiplier, beta=0.1, renormalise=True)
+    sig = Resampling.resample_signal(sig, sig.fs*upsample_multiplier, beta=0.1, renormalise=True)
 
     # Delay by random amount
     N = len(sig[0]) + len(sig[1]) # total number of symbols in signal
-    shift = np.random.randint(-delay_max_offset*N, delay_max_offset*N, 1) # randomly shift to signal by up to 1/2 signal length in either direction
-    AWG_sig = delay(sig, shift, sig.nmodes)
+    rng = Random_Streams.as_generator(rng)
+    shift = rng.integers(-int(delay_max_offset*N), int(delay_max_offset*N), 1) # randomly shift to signal by up to 1/2 signal length in either direction
+    AWG_sig = delay(sig, shift, sig.nmodes, pool, lazy=True)     # read through by the resampling below
     # interpolate signal here
 
     # Downsample to oscilloscope sample rate
-    AWG_sig = AWG_sig.resample(scope_rate, beta=0.1, renormalise=True)
+    AWG_sig = Resampling.resample_signal(AWG_sig, scope_rate, beta=0.1, renormalise=True)
 
     return AWG_sig
 
 
-def add_edges(sig, edge_size, nmodes=2):
+def add_edges(sig, edge_size, nmodes=2, pool=None):
     """
     Adds edges to either side of signal filled with 0's of length edge_size
 
@@ -106,20 +172,48 @@ def add_edges(sig, edge_size, nmodes=2):
         Signal that is to have edges added to
     edge_size : integer
         length of edges to be added to each side of signal. Edges are made of 0's
+    pool : Buffer_Pool.BufferPool
+        Pool that the padded signal's buffer is taken from, eg. in a sweep. If None, a new array is made
 
     Output
     ---------------------------------------------
     sig : SignalQAMGrayCoded
         Signal that has had edges added
     """
-    sig_temp = sig      # gets temporary signal
-    arr_0 = np.zeros((nmodes, edge_size))    # gets array of zeros
-    sig_temp = np.concatenate((sig_temp, arr_0), axis=1)   # adds 0's to end of signal
-    sig_temp = np.concatenate((arr_0, sig_temp), axis=1)   # adds 0's to start of signal
+    # signal is copied once into a zeroed buffer of its own dtype
+    sig_temp = Buffer_Pool.padded(sig, edge_size, edge_size, pool, "add_edges")
     out_sig = sig.recreate_from_np_array(sig_temp)  # gets rebuilt signal
     return out_sig
 
-def frac_offset(sig, scope_f, upsample_mult=8, nmodes=2):
+def fractional_delay(sig, delay, method="fft"):
+    """
+    Delays a signal by any real number of symbols, at its own sample rate
+
+    Parameters
+    ---------------------------------------------
+    sig : SignalQAMGrayCoded
+        Signal to be delayed
+    delay : float
+        Delay in symbol periods (1/fb), eg. 0.37. Positive delays move the signal later in time, wrapping around
+    method : txt
+        "fft" for a phase ramp on the whole signal, or "farrow" for cubic interpolation (see Fractional_Delay)
+
+    Output
+    ---------------------------------------------
+    delayed_sig : SignalQAMGrayCoded
+        Signal that has been delayed
+    """
+    delay_samples = delay * sig.fs / sig.fb
+    if method == "fft":
+        delayed = Fractional_Delay.fft_delay(sig, delay_samples)
+    elif method == "farrow":
+        delayed = Fractional_Delay.farrow_delay(sig, delay_samples)
+    else:
+        raise ValueError("unknown method '%s', should be 'fft' or 'farrow'" % method)
+    return sig.recreate_from_np_array(delayed.astype(sig.dtype, copy=False))
+
+
+def frac_offset(sig, scope_f, upsample_mult=8, nmodes=2, rng=None, pool=None, method="roll"):
     """
     This function takes a signal, then offsets its data by a fraction of a step
 
@@ -128,29 +222,68 @@ def frac_offset(sig, scope_f, upsample_mult=8, nmodes=2):
     sig : SignalQAMGrayCoded
         Signal to have its data offset
     scope_f : float
-        frequency of the scope
+        frequency of the scope. If None, the offset signal is not resampled to a scope rate, so is left at
+        fb*upsample_mult for method "roll", and at its own sample rate for the other methods (or 2*fb for "fft" and
+        "farrow" if its rate is too low to hold the pulse shaping's bandwidth)
     upsample_mult : float
-        How many times the signal is being upsamples from the baud rate
+        How many times the signal is upsampled from the baud rate before it is offset. For method "roll" the offset is
+        a multiple of 1/upsample_mult symbols, for the other methods it is drawn from the same range,
+        1/upsample_mult to 1 - 2/upsample_mult symbols, but can take any value
+    rng : numpy Generator
+        Source of the random offset (see Random_Streams). If None, a Generator is seeded from numpy's global random state
+    pool : Buffer_Pool.BufferPool
+        Pool that the scratch space for the shift is taken from, eg. in a sweep. If None, a new array is made
+    method : txt
+        "roll" to upsample by upsample_mult, shift by a whole number of samples and resample, "fft" or "farrow" to
+        resample once to scope_f then delay by a continuous offset at that rate (see fractional_delay), or "poly" to
+        delay and resample to scope_f in one polyphase pass (see Resampling.poly_resample)
 
     Output
     ---------------------------------------------
     offset_sig : SignalQAMGrayCoded
         Signal that has the data of sig offset by a fractional amount
     """
-    # large upsample
-    sig = sig.resample(sig.fb*upsample_mult, beta=0.1, renormalise=True)
+    rng = Random_Streams.as_generator(rng)
+    if method == "roll":
+        # random small delay
+        shift = int(rng.integers(1,upsample_mult-1))  # shift by shift spaces
+    else:
+        # random small delay of any value
+        shift = rng.uniform(1, upsample_mult - 2) / upsample_mult
+    if rng.random() < 0.5:     # 50% chance to shift in -ve direction
+        shift *= -1
+
+    if method == "poly":
+        print("Shift: %.3f" % shift)
+        # without a new rate, the resample_poly filter is a plain interpolator, rather than pulse shaping again
+        if scope_f is None:
+            return Resampling.poly_resample_signal(sig, sig.fs, shift * sig.fs / sig.fb, circular=True)
+        return Resampling.poly_resample_signal(sig, scope_f, shift * sig.fs / sig.fb, circular=True, beta=0.1,
+                                               renormalise=True)
 
-    # random small delay
-    shift = np.random.randint(1,upsample_mult-1)  # shift by shift spaces
-    if np.random.random() < 0.5:     # 50% chance to shift in -ve direction
-        shift *= -1 
+    if method != "roll":
+        print("Shift: %.3f" % shift)
+        # a delay commutes with the pulse shaping once the rate holds its whole bandwidth, (1+beta)*fb, so the signal is
+        # only resampled once, to the scope rate, and delayed there. It is only delayed at 2*fb, then resampled, if
+        # the scope rate is lower than that
+        min_rate = (1 + 0.1) * sig.fb
+        if scope_f is None:
+            scope_f = sig.fs if sig.fs >= min_rate else 2*sig.fb
+        delay_rate = scope_f if scope_f >= min_rate else 2*sig.fb
+        if sig.fs != delay_rate:
+            sig = Resampling.resample_signal(sig, delay_rate, beta=0.1, renormalise=True)
+        offset_sig = fractional_delay(sig, shift, method)
+        if delay_rate != scope_f:
+            offset_sig = Resampling.resample_signal(offset_sig, scope_f, beta=0.1, renormalise=True)
+        return offset_sig
+
+    # large upsample
+    sig = Resampling.resample_signal(sig, sig.fb*upsample_mult, beta=0.1, renormalise=True)
     print("Shift: %.3f" % (shift / upsample_mult))
-    if nmodes == 1:
-        offset_sig = np.roll(sig, shift, axis=0) #single polarization desynchronization
-    if nmodes == 2:
-        offset_sig = np.roll(sig, shift, axis=1) #dual polarization desynchronization
+    offset_sig = delay(sig, shift, nmodes, pool)
 
     # downsample to scope
-    offset_sig = offset_sig.resample(scope_f, beta=0.1, renormalise=True)
+    if scope_f is not None:
+        offset_sig = Resampling.resample_signal(offset_sig, scope_f, beta=0.1, renormalise=True)
 
     return offset_sig
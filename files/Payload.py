@@ -0,0 +1,205 @@
+"""
+Bit-packed payloads for QAM signals
+Payload bits are generated and stored packed 8 to a byte (uint8), with one row of bytes per polarisation, and are only
+unpacked a chunk at a time when they are mapped to symbols. Symbols are looked up in a table of the constellation built
+with QAMpy's own modulate, so the mapping matches sig.modulate, and all polarisations are mapped in one batched call
+straight into the signal's buffer.
+"""
+
+from qampy import signals
+import numpy as np
+
+CHUNK_SYMBOLS = 2 ** 16     # number of symbols per polarisation mapped at a time, must be a multiple of 8
+
+_luts = {}      # constellation tables already built, by QAM order
+
+
+def bits_per_symbol(M):
+    return int(np.log2(M))
+
+
+def payload_bytes(n_symbols, M):
+    """
+    Gets the number of bytes needed to store n_symbols symbols of M-QAM
+    """
+    return -(-n_symbols * bits_per_symbol(M) // 8)
+
+
+def constellation_lut(M):
+    """
+    Gets the symbol of each bit pattern of M-QAM, where the bit pattern is read as an integer with its first bit as the
+    most significant bit
+
+    Parameters
+    ---------------------------------------------
+    M : integer
+        QAM order
+
+    Output
+    ---------------------------------------------
+    lut : numpy array (complex128)
+        Array of M symbols, indexed by bit pattern
+    """
+    if M not in _luts:
+        nbits = bits_per_symbol(M)
+        patterns = np.arange(M)[:, np.newaxis] >> np.arange(nbits - 1, -1, -1) & 1
+        sig = signals.SignalQAMGrayCoded(M, M, nmodes=1)
+        _luts[M] = np.asarray(sig.modulate(patterns.astype(bool).ravel()), dtype=np.complex128).ravel()
+    return _luts[M]
+
+
+def random_payload(n_symbols, M, nmodes=1, rng=None):
+    """
+    Generates random packed payload bits for n_symbols symbols on each polarisation
+
+    Parameters
+    ---------------------------------------------
+    n_symbols : integer
+        Number of symbols per polarisation
+    M : integer
+        QAM order
+    nmodes : integer
+        Number of polarisations
+    rng : numpy random generator
+        Source of the random bits, if None numpy's global random state is used
+
+    Output
+    ---------------------------------------------
+    payload : numpy array (uint8)
+        Packed bits, of shape (nmodes, payload_bytes(n_symbols, M))
+    """
+    if rng is None:
+        rng = np.random
+    n_bytes = payload_bytes(n_symbols, M)
+    payload = np.frombuffer(bytearray(rng.bytes(nmodes * n_bytes)), dtype=np.uint8).reshape(nmodes, n_bytes)
+    return payload
+
+
+def file_payload(filepath, n_symbols, M, nmodes=1, offset=0):
+    """
+    Gets a payload from a file of user data, memory-mapped so that it is only read as it is mapped to symbols
+
+    Parameters
+    ---------------------------------------------
+    filepath : txt
+        Path of the file of payload bytes
+    n_symbols : integer
+        Number of symbols per polarisation
+    M : integer
+        QAM order
+    nmodes : integer
+        Number of polarisations, each taking the next payload_bytes(n_symbols, M) bytes of the file
+    offset : integer
+        Byte of the file that the payload starts at
+
+    Output
+    ---------------------------------------------
+    payload : numpy memmap (uint8)
+        Packed bits, of shape (nmodes, payload_bytes(n_symbols, M))
+    """
+    n_bytes = payload_bytes(n_symbols, M)
+    return np.memmap(filepath, dtype=np.uint8, mode="r", offset=offset, shape=(nmodes, n_bytes))
+
+
+def iter_file_payloads(filepath, n_symbols, M, nmodes=1):
+    """
+    Streams a file of user data as successive payloads, for tests with more data than fits in one signal
+    The last partial payload of the file is dropped.
+
+    Output
+    ---------------------------------------------
+    Generator of payloads, see file_payload
+    """
+    frame_bytes = nmodes * payload_bytes(n_symbols, M)
+    data = np.memmap(filepath, dtype=np.uint8, mode="r")
+    for offset in range(0, len(data) - frame_bytes + 1, frame_bytes):
+        yield data[offset:offset + frame_bytes].reshape(nmodes, -1)
+
+
+def map_payload(payload, M, n_symbols=None, out=None, chunk_symbols=CHUNK_SYMBOLS):
+    """
+    Maps packed payload bits to M-QAM symbols on every polarisation at once
+
+    Parameters
+    ---------------------------------------------
+    payload : numpy array (uint8)
+        Packed bits, of shape (nmodes, number of bytes)
+    M : integer
+        QAM order
+    n_symbols : integer
+        Number of symbols per polarisation. If None, as many as fit in the payload
+    out : numpy array (complex128)
+        Array of shape (nmodes, n_symbols) that the symbols are written to, eg. a signal. If None, a new one is made
+    chunk_symbols : integer
+        Number of symbols per polarisation unpacked at a time, must be a multiple of 8
+
+    Output
+    ---------------------------------------------
+    symbols : numpy array (complex128)
+        Symbols, of shape (nmodes, n_symbols)
+    """
+    payload = np.atleast_2d(payload)
+    nbits = bits_per_symbol(M)
+    if n_symbols is None:
+        n_symbols = payload.shape[1] * 8 // nbits
+    if payload.shape[1] < payload_bytes(n_symbols, M):
+        raise ValueError("payload has %d bytes per polarisation, %d needed for %d symbols"
+                         % (payload.shape[1], payload_bytes(n_symbols, M), n_symbols))
+    if out is None:
+        out = np.empty((payload.shape[0], n_symbols), dtype=np.complex128)
+    lut = constellation_lut(M)
+    weights = 1 << np.arange(nbits - 1, -1, -1)
+
+    # chunks start on a byte boundary as chunk_symbols is a multiple of 8
+    for start in range(0, n_symbols, chunk_symbols):
+        n = min(chunk_symbols, n_symbols - start)
+        first_byte = start * nbits // 8
+        bits = np.unpackbits(payload[:, first_byte:first_byte + payload_bytes(n, M)], axis=1, count=n * nbits)
+        idx = bits.reshape(payload.shape[0], n, nbits) @ weights
+        np.take(lut, idx, out=out[:, start:start + n])
+    return out
+
+
+def encode_payload(sig, payload, n_symbols=None):
+    """
+    Encodes a payload onto a signal at the baud rate, writing the symbols straight into the signal's buffer
+    The signal's reference symbols and bits are updated to match, so that eg. cal_ser and cal_ber compare against the
+    payload. They are replaced rather than written in place, as copies of the signal share them
+
+    Parameters
+    ---------------------------------------------
+    sig : SignalQAMGrayCoded
+        Signal at the baud rate, of shape (nmodes, N)
+    payload : numpy array (uint8)
+        Packed bits, of shape (nmodes, number of bytes)
+    n_symbols : integer
+        Number of symbols per polarisation to encode, at most N. If None, as many as fit in the payload or in sig
+
+    Output
+    ---------------------------------------------
+    sig : SignalQAMGrayCoded
+        sig with its first n_symbols symbols on each polarisation replaced by the payload
+    """
+    payload = np.atleast_2d(payload)
+    nmodes = payload.shape[0]
+    nbits = bits_per_symbol(sig.M)
+    if n_symbols is None:
+        n_symbols = min(sig.shape[1], payload.shape[1] * 8 // nbits)
+    encoded = map_payload(payload, sig.M, n_symbols, out=sig[:nmodes, :n_symbols])
+
+    symbols = np.array(sig._symbols)
+    symbols[:nmodes, :n_symbols] = encoded
+    sig._symbols = symbols
+    bits = np.array(sig._bits)
+    bits[:nmodes, :n_symbols * nbits] = np.unpackbits(payload[:, :payload_bytes(n_symbols, sig.M)], axis=1,
+                                                      count=n_symbols * nbits)
+    sig._bits = bits
+    return sig
+
+
+def payload_signal(payload, M, n_symbols=None, fb=1):
+    """
+    Builds a signal that carries the payload, with the payload's symbols as its reference symbols
+    """
+    symbols = map_payload(payload, M, n_symbols)
+    return signals.SignalQAMGrayCoded.from_symbol_array(symbols, M=M, fb=fb)
@@ -0,0 +1,103 @@
+"""
+Reproducible random number streams for simulations and sweeps
+Every sweep point gets its own numpy Generator, derived from one master seed and the point's index with
+np.random.SeedSequence, so the streams are independent of each other and don't depend on which worker runs the point or
+in what order. A sweep run across worker processes therefore gives exactly the same results as a serial run.
+QAMpy's signal classes take an integer seed for their random symbols, which int_seed draws from a point's Generator.
+Its noise functions (eg. impairments.change_snr and apply_phase_noise) draw from numpy's global random state instead, so
+seeded_global is used to seed the global state from a point's Generator for those calls.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+SEED_BITS = 32  # size of the seeds drawn for numpy's global random state
+
+
+def point_rng(master_seed, index):
+    """
+    Gets the Generator for one sweep point, the same as the index-th of point_rngs(master_seed, n)
+    """
+    return np.random.default_rng(np.random.SeedSequence(master_seed, spawn_key=(index,)))
+
+
+def point_rngs(master_seed, n):
+    """
+    Gets independent Generators for n sweep points (or workers) from one master seed
+    """
+    return [np.random.default_rng(child) for child in np.random.SeedSequence(master_seed).spawn(n)]
+
+
+def as_generator(rng=None):
+    """
+    Gets a Generator from rng, which can be a Generator, an integer seed, or None
+    If None, the Generator is seeded from numpy's global random state, so np.random.seed still makes runs repeatable
+    """
+    if isinstance(rng, np.random.Generator):
+        return rng
+    if rng is None:
+        return np.random.default_rng(np.random.randint(2 ** SEED_BITS, dtype=np.uint64))
+    return np.random.default_rng(rng)
+
+
+def int_seed(rng):
+    """
+    Gets an integer seed from rng, for code that takes a seed rather than a Generator, eg. seed of QAMpy's signal classes
+    rng can be an integer seed, which is returned as it is, a Generator, which a seed is drawn from, or None
+    """
+    if isinstance(rng, np.random.Generator):
+        return int(rng.integers(2 ** SEED_BITS))
+    return rng
+
+
+@contextmanager
+def seeded_global(rng):
+    """
+    Seeds numpy's global random state for the duration of a with block, then restores it, for code such as QAMpy's
+    noise functions that only uses the global state
+    rng can be an integer seed or a Generator, which a seed is drawn from. If None, the global state is left alone
+    """
+    if rng is None:
+        yield
+        return
+    state = np.random.get_state()
+    np.random.seed(int_seed(rng))
+    try:
+        yield
+    finally:
+        np.random.set_state(state)
+
+
+def _run_point(args):
+    [function, point, master_seed, index] = args
+    return function(point, point_rng(master_seed, index))
+
+
+def run_sweep(function, points, master_seed, workers=None):
+    """
+    Runs function(point, rng) for each sweep point, with each point given its own Generator
+
+    Parameters
+    ---------------------------------------------
+    function : function
+        Function run for each point, taking the point and a Generator. Must be picklable (defined at module level) to
+        run on more than one worker
+    points : list
+        Parameters of each sweep point, eg. SNRs
+    master_seed : integer
+        Seed that the Generator of every point is derived from
+    workers : integer
+        Number of worker processes. If None or 1, points are run serially
+
+    Output
+    ---------------------------------------------
+    results : list
+        Output of function for each point, in the same order as points, and the same for any number of workers
+    """
+    jobs = [[function, point, master_seed, index] for index, point in enumerate(points)]
+    if workers is None or workers <= 1:
+        return [_run_point(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_run_point, jobs))
@@ -10,6 +10,10 @@ import numpy as np
 from bokeh.io import output_notebook
 from bokeh.plotting import figure, show
 import os
+import Signal_Container
+import Signal_Cache
+import Resampling
+import Signal_Views
 
 
 def load_base_signal(filename):
@@ -42,7 +46,73 @@ def read_sig_data_from_file(filepath="C:/Users/wamcc1/Documents/QAM_sig/sig_data
     return sig_data
 
 
-def recreate_signal(data, fs, M, N, fb, nmodes, **kwargs):
+def read_sig_from_container(filepath="C:/Users/wamcc1/Documents/QAM_sig/sig_data.qsig", mmap=True):
+    """
+    Reads signal data, reference symbols and signal parameters from a container saved by
+    Generate_Signal.save_sig_to_container
+
+    Parameters
+    ---------------------------------------------
+    filepath : txt
+        Path of the container file
+    mmap : bool
+        If True, the data is memory-mapped from the file rather than read into memory
+
+    Output
+    ---------------------------------------------
+    sig_data : numpy array (complex128)
+        Data of the saved signal
+    symbols : numpy array
+        Reference symbols of the signal
+    meta : dictionary
+        Signal parameters fs, fb, M, nmodes and N
+    """
+    [sig_data, symbols, meta] = Signal_Container.read_container(filepath, mmap)
+    return [sig_data, symbols, meta]
+
+
+def load_sig_from_container(filepath="C:/Users/wamcc1/Documents/QAM_sig/sig_data.qsig", mmap=True):
+    """
+    Rebuilds the signal saved in a container, using its stored parameters and reference symbols
+    """
+    [sig_data, symbols, meta] = read_sig_from_container(filepath, mmap)
+    return recreate_signal(sig_data, meta["fs"], meta["M"], meta["N"], meta["fb"], meta["nmodes"], symbols=symbols)
+
+
+def rehydrate_signal(data, symbols, M, fb, fs, **kwargs):
+    """
+    Attaches received signal data to a signal object built from the signal parameters and transmitted symbols alone,
+    without generating or resampling a template signal
+    The signal built from the symbols is kept in Signal_Cache (see Signal_Cache.symbol_template), so only the first
+    capture of a transmission pays for mapping its symbols to bits
+
+    Parameters
+    ---------------------------------------------
+    data : numpy array (complex128)
+        Data of received signal, of shape (nmodes, number of samples)
+    symbols : numpy array
+        Transmitted symbols, of shape (nmodes, N)
+    M : float
+        QAM order
+    fb : float
+        baud rate (symbols / s)
+    fs : float
+        Sampling frequency of data
+    kwargs :
+        Other signal attributes to set on the received signal
+
+    Output
+    ---------------------------------------------
+    received_sig : SignalQAMGrayCoded
+        signal received by synthesiser
+    """
+    sig = Signal_Cache.symbol_template(symbols, M, fb)
+    received_sig = sig.recreate_from_np_array(np.asarray(data), fs=fs, **kwargs)
+    return received_sig
+
+
+def recreate_signal(data, fs, M, N, fb, nmodes, symbols=None, seed=None, beta=None, renormalise=None,
+                    **kwargs):
     """
     Recreates signal by taking in received signal data and signal parameters
 
@@ -60,18 +130,47 @@ def recreate_signal(data, fs, M, N, fb, nmodes, **kwargs):
         baud rate (symbols / s)
     nmodes : float
         number of polarisations
+    symbols : numpy array
+        Transmitted symbols, eg. as stored in a signal container. If given, the signal is rebuilt with rehydrate_signal
+    seed : integer
+        Seed the transmitted signal was generated with. If given (and symbols is None), the transmitted signal is taken
+        from Signal_Cache, under the same key as when it was generated, and the data is applied to it
+    beta : float
+        Roll-off factor the transmitted signal was resampled to fs with, eg. 0.01 for Lab_Automation.qampy_sig or 0.1
+        for Generate_Signal.generate_AWG_signal. Must be given with seed, as it is part of the cache key. If None
+        without seed, 0.1 is used
+    renormalise : bool
+        If the transmitted signal was renormalised after resampling, eg. True for Lab_Automation.qampy_sig or False for
+        Generate_Signal.generate_AWG_signal. Must be given with seed, as it is part of the cache key. If None without
+        seed, True is used
 
     Output
     ---------------------------------------------
     received_sig : SignalQAMGrayCoded
         signal received by synthesiser
     """
+    # reuses the transmitted signal, which is found in the cache if it was generated with the same parameters
+    if symbols is None and seed is not None:
+        if beta is None or renormalise is None:
+            raise ValueError("beta and renormalise must be given with seed, to match the transmitted signal")
+        sig = Signal_Cache.get_signal(signals.SignalQAMGrayCoded, M, N, nmodes=nmodes, fb=fb, fs=fs, beta=beta,
+                                      renormalise=renormalise, seed=seed, **kwargs)
+        return sig.recreate_from_np_array(data)
+    # rebuilds from the known transmitted symbols, so no template signal has to be generated and resampled
+    if symbols is not None:
+        return rehydrate_signal(data, symbols, M, fb, fs)
+
+    if beta is None:
+        beta = 0.1
+    if renormalise is None:
+        renormalise = True
+
     # creates base carrier signal
     if len(kwargs) != 0:
         sig = signals.SignalQAMGrayCoded(M, N, nmodes, fb, kwargs)
     else:
         sig = signals.SignalQAMGrayCoded(M, N, nmodes, fb)
-    sig = sig.resample(fs, beta=0.1, renormalise=True)
+    sig = Resampling.resample_signal(sig, fs, beta=beta, renormalise=renormalise)
 
     # applies data to signal
     received_sig = sig.recreate_from_np_array(data)
@@ -80,8 +179,10 @@ def recreate_signal(data, fs, M, N, fb, nmodes, **kwargs):
 
 def fixed_recreate(sig, data):
     """
-
+    Applies data to sig. data can be an array, or the path of a signal container to read the data from
     """
+    if isinstance(data, str):
+        data = read_sig_from_container(data)[0]
     recreated_sig = sig.recreate_from_np_array(data)
     return recreated_sig
 
@@ -120,19 +221,22 @@ def recover_signal(sig):
     #print("BER = ", sig_out2.cal_ber())
     return sig_out2
 
-def recover_full_waveform(sig, orig_sig, frac_upscale=0):
+def recover_full_waveform(sig, orig_sig, frac_upscale=0, resample_method="fft"):
     """
     Takes in a signal with multiple copies of a data packet and a delay, and recovers the original waveform
 
     Parameters
     ---------------------------------------------
     sig : SignalQAMGrayCoded
-        Signal to have its data recovered
+        Signal to have its data recovered, can be a Signal_Views.PeriodicView such as a lazily delayed signal
     orig_sig : SignalQAMGrayCoded
         Original signal to synchronise sig with
     frac_upscale : int
         if 0, no fractional delay. Else, gives how much the signal should be upsampled from the baud rate to make the fractional delay an integer delay, and hence recoverable
         Note that signal data will be returned at the upsampled frequency
+    resample_method : txt
+        "fft" to resample with Resampling.resample_signal, or "poly" to resample each hop in one polyphase pass in
+        blocks with Resampling.poly_resample_signal
 
     Output
     ---------------------------------------------
@@ -141,6 +245,12 @@ def recover_full_waveform(sig, orig_sig, frac_upscale=0):
     rx_data : array
         Original waveform data
     """
+    if isinstance(sig, Signal_Views.PeriodicView):
+        sig = sig.materialize()     # syncing needs the whole signal
+    if resample_method == "poly":
+        resample = Resampling.poly_resample_signal
+    else:
+        resample = Resampling.resample_signal
     if frac_upscale == 0:   # if there is no fractional delay
          # syncs signals
         [tx_data, rx_data] = sig._sync_and_adjust(sig, orig_sig) 
@@ -150,9 +260,9 @@ def recover_full_waveform(sig, orig_sig, frac_upscale=0):
     else:                   # if there is a fractional delay
         # upscales signals accordingly
 
-        sig = sig.resample(orig_sig.fb*frac_upscale)
+        sig = resample(sig, orig_sig.fb*frac_upscale)
         print("signal fb: %d" % sig.fs)
-        upsampled_sig = orig_sig.resample(orig_sig.fb*frac_upscale)
+        upsampled_sig = resample(orig_sig, orig_sig.fb*frac_upscale)
         print("original signal fb: %d" % upsampled_sig.fs)
         # syncs signals for fractional delay
         [tx_data, rx_data] = sig._sync_and_adjust(sig, upsampled_sig) 
@@ -160,11 +270,11 @@ def recover_full_waveform(sig, orig_sig, frac_upscale=0):
         #upsampled_sig = orig_sig.resample(orig_sig.fb*frac_upscale)     # upsamples original signal to use as base to recover signal waveform from tx data
         recovered_sig  = upsampled_sig.recreate_from_np_array(tx_data)
         # lowers signal to baud rate
-        orig_sig = orig_sig.resample(orig_sig.fb*2, beta=0.1)
-        recovered_sig = recovered_sig.resample(orig_sig.fb*2, beta=0.1)
+        orig_sig = resample(orig_sig, orig_sig.fb*2, beta=0.1)
+        recovered_sig = resample(recovered_sig, orig_sig.fb*2, beta=0.1)
         # syncs signals for large delay
-        [tx_sig, rx_sig] = recover_full_waveform(recovered_sig, orig_sig, 0)
+        [tx_sig, rx_sig] = recover_full_waveform(recovered_sig, orig_sig, 0, resample_method)
         recovered_sig2  = orig_sig.recreate_from_np_array(tx_sig)
         orig_sig2  = orig_sig.recreate_from_np_array(rx_sig)
-        recovered_sig2 = recovered_sig2.resample(orig_sig.fb, beta=0.1)
+        recovered_sig2 = resample(recovered_sig2, orig_sig.fb, beta=0.1)
         return [recovered_sig2, orig_sig2]
\ No newline at end of file
@@ -0,0 +1,487 @@
+"""
+Chunked resampling for very long signals
+Resampling is an FIR filter on the zero-stuffed signal followed by decimation, so each block of output samples only
+needs the block of input samples under the filter. Blocks of output are worked out one at a time from their own
+overlapping block of input, so the working set is bounded by BLOCK_SIZE rather than by the length of the signal.
+    beta None: same filter and alignment as scipy.signal.resample_poly, done with upfirdn on each block, which gives
+               exactly the same samples as the one-shot resample_poly
+    beta given: root raised cosine pulse shaping and resampling, as done by QAMpy's resample, done with an FFT
+                convolution on each block (overlap-save), which matches the one-shot FFT convolution to rounding error
+resample_signal uses the one-shot sig.resample for signals below CHUNK_THRESHOLD samples and the chunked path above it.
+poly_resample goes between any two rates in one polyphase pass (upfirdn on each block, or an FFT convolution when the
+filter is long next to the resampling factors, see fir_method), with a delay folded into the filter: the whole-sample
+part of the delay moves where the filter is aligned and the fractional part shifts the taps, so
+fb -> 8*fb -> delay -> scope rate becomes one filter. In circular mode the signal is read as one period of a
+repeating waveform, through a Signal_Views.PeriodicView, so the ends wrap rather than fading in and out.
+PolyphaseResampler does the same one input block at a time, for signals that arrive in blocks.
+"""
+
+from fractions import Fraction
+
+import numpy as np
+from scipy import signal as scisig
+
+import Signal_Views
+
+CHUNK_THRESHOLD = 2 ** 20   # output samples per mode above which resample_signal resamples in chunks
+BLOCK_SIZE = 2 ** 14        # output samples per mode worked out at a time
+FFT_RATIO = 16              # poly_resample filters with an FFT when each output needs more than this many taps per
+                            # sample of decimation, as upfirdn's cost grows with the taps and the FFT's with down
+
+
+def resampling_factors(fold, fnew, max_denominator=10 ** 6):
+    """
+    Gets the integer up and down factors that take a signal from fold to fnew, limited as in QAMpy's resample so that
+    both give the same rate
+    """
+    ratio = Fraction(fnew / fold).limit_denominator(max_denominator)
+    return [ratio.numerator, ratio.denominator]
+
+
+def rrcos_taps(t, beta, Ts):
+    """
+    Gets the root raised cosine impulse response at times t, for symbol period Ts and roll-off beta
+    """
+    x = np.asarray(t, dtype=np.float64) / Ts
+    h = np.empty_like(x)
+    zero = np.isclose(x, 0)
+    if beta == 0:
+        singular = np.zeros_like(zero)
+    else:
+        singular = np.isclose(np.abs(x), 1 / (4 * beta))
+    normal = ~(zero | singular)
+    xn = x[normal]
+    h[normal] = ((np.sin(np.pi * xn * (1 - beta)) + 4 * beta * xn * np.cos(np.pi * xn * (1 + beta)))
+                 / (np.pi * xn * (1 - (4 * beta * xn) ** 2)))
+    h[zero] = 1 - beta + 4 * beta / np.pi
+    if beta != 0:
+        h[singular] = beta / np.sqrt(2) * ((1 + 2 / np.pi) * np.sin(np.pi / (4 * beta))
+                                           + (1 - 2 / np.pi) * np.cos(np.pi / (4 * beta)))
+    return h
+
+
+def resample_filter(fold, fnew, Ts=None, beta=None, taps=4001):
+    """
+    Gets the filter that resampling from fold to fnew applies at the upsampled rate, and where it is aligned
+
+    Parameters
+    ---------------------------------------------
+    fold : float
+        Sample rate of the signal
+    fnew : float
+        Sample rate to resample to
+    Ts : float
+        Symbol period, only needed if beta is given
+    beta : float
+        Roll-off of the root raised cosine filter. If None, the resample_poly filter is used
+    taps : integer
+        Number of taps of the root raised cosine filter
+
+    Output
+    ---------------------------------------------
+    h : numpy array
+        Filter taps
+    up, down : integer
+        Upsampling and downsampling factors
+    offset : integer
+        Sample of the filtered, upsampled signal that the first output sample is taken from
+    """
+    [up, down] = resampling_factors(fold, fnew)
+    if beta is None:
+        # same as scipy.signal.resample_poly with its default window
+        max_rate = max(up, down)
+        half_len = 10 * max_rate
+        h = scisig.firwin(2 * half_len + 1, 1. / max_rate, window=("kaiser", 5.0)) * up
+        return [h, up, down, half_len]
+    t = np.linspace(0, taps, taps, endpoint=False)
+    t -= t[(t.size - 1) // 2]
+    t /= up * fold
+    h = rrcos_taps(t, beta, Ts)
+    h /= h.max()
+    return [h, up, down, (taps - 1) // 2]
+
+
+def delayed_filter(fold, fnew, delay=0, Ts=None, beta=None, taps=4001):
+    """
+    Gets the filter and alignment for resampling from fold to fnew with the output delayed by delay input samples,
+    as resample_filter. The whole upsampled samples of the delay are taken off offset, and the taps are the filter's
+    impulse response shifted by the fractional part, so a delay costs nothing extra when resampling
+
+    Parameters
+    ---------------------------------------------
+    fold, fnew, Ts, beta, taps :
+        See resample_filter
+    delay : float
+        Delay in samples at fold, can be any real number. Positive delays move the signal later in time
+
+    Output
+    ---------------------------------------------
+    h : numpy array
+        Filter taps
+    up, down : integer
+        Upsampling and downsampling factors
+    offset : integer
+        Sample of the filtered, upsampled signal that the first output sample is taken from, can be negative
+    """
+    [h, up, down, offset] = resample_filter(fold, fnew, Ts, beta, taps)
+    shift = delay * up     # delay in samples of the upsampled signal
+    whole = int(np.floor(shift))
+    frac = shift - whole
+    if frac != 0:
+        k = np.arange(len(h)) - offset - frac     # times of the taps, in upsampled samples from the filter centre
+        if beta is None:
+            # windowed sinc of resample_poly evaluated off its sample grid, with the same scaling
+            max_rate = max(up, down)
+            k0 = np.arange(len(h)) - offset
+            kaiser = lambda t: np.where(np.abs(t) <= offset,
+                                        np.i0(5.0 * np.sqrt(np.clip(1 - (t / offset) ** 2, 0, None))), 0)
+            scale = np.sum(np.sinc(k0 / max_rate) * kaiser(k0))
+            h = np.sinc(k / max_rate) * kaiser(k) / scale * up
+        else:
+            h = rrcos_taps(k / (up * fold), beta, Ts) / rrcos_taps(np.zeros(1), beta, Ts)
+    return [h, up, down, offset - whole]
+
+
+def fir_method(h, up, down):
+    """
+    Gets the faster way for fir_resample to apply filter h, "direct" or "fft", see FFT_RATIO
+    """
+    return "fft" if len(h) / up > FFT_RATIO * down else "direct"
+
+
+def _fir_block(x, h, up, down, offset, i0, i1, method):
+    """
+    Gets output samples i0 to i1 of y[i] = sum_k h[k] * xup[offset + i*down - k], where xup is x zero-stuffed by up,
+    using only the samples of x under the filter
+    """
+    n_in = x.shape[-1]
+    K = len(h)
+    if method == "direct" and offset + i0 * down < 0 <= offset + (i1 - 1) * down:
+        # outputs from before the start of the signal are zero, which the direct method can't align
+        i_start = -(offset // down)
+        return np.concatenate((_fir_block(x, h, up, down, offset, i0, i_start, method),
+                               _fir_block(x, h, up, down, offset, i_start, i1, method)), axis=-1)
+    first = offset + i0 * down  # first sample of the filtered, upsampled signal that is needed
+    last = offset + (i1 - 1) * down
+    q0 = max(0, -(-(first - K + 1) // up))  # first input sample under the filter
+    q1 = min(n_in, last // up + 1)
+    n = i1 - i0
+    if q1 <= q0:
+        return np.zeros(x.shape[:-1] + (n,), dtype=np.result_type(x.dtype, h.dtype))
+    seg = x[..., q0:q1]
+    if method == "direct":
+        # leading zeros shift the filter so that the first needed sample falls on a multiple of down
+        shift = (-(first - q0 * up)) % down
+        y = scisig.upfirdn(np.concatenate((np.zeros(shift), h)), seg, up, down, axis=-1)
+        start = (first - q0 * up + shift) // down
+    else:
+        # overlap-save, only the filter outputs fully inside the zero-stuffed block are kept
+        p0 = first - K + 1
+        xup = np.zeros(x.shape[:-1] + (last - p0 + 1,), dtype=np.result_type(x.dtype, h.dtype))
+        pos = q0 * up - p0
+        xup[..., pos:pos + (q1 - q0 - 1) * up + 1:up] = seg
+        y = scisig.fftconvolve(xup, h.reshape((1,) * (x.ndim - 1) + (K,)), mode="valid", axes=-1)[..., ::down]
+        start = 0
+    out = y[..., start:start + n]
+    if out.shape[-1] < n:  # past the end of the filtered signal
+        out = np.concatenate((out, np.zeros(x.shape[:-1] + (n - out.shape[-1],), dtype=out.dtype)), axis=-1)
+    return out
+
+
+def fir_resample(x, h, up, down, offset, n_out, method="direct", out=None, block_size=BLOCK_SIZE):
+    """
+    Filters and resamples x one block of output at a time
+
+    Parameters
+    ---------------------------------------------
+    x : numpy array
+        Signal, of shape (nmodes, number of samples)
+    h, up, down, offset :
+        Filter and alignment, see resample_filter
+    n_out : integer
+        Number of output samples per mode
+    method : txt
+        "direct" to filter with upfirdn, or "fft" to filter with an FFT convolution
+    out : numpy array
+        Array of shape (nmodes, n_out) that the output is written to. If None, a new one is made
+    block_size : integer
+        Number of output samples per mode worked out at a time
+
+    Output
+    ---------------------------------------------
+    out : numpy array
+        Resampled signal
+    """
+    if not isinstance(x, Signal_Views.PeriodicView):
+        x = np.asarray(x)
+    if out is None:
+        out = np.empty(x.shape[:-1] + (n_out,), dtype=np.result_type(x.dtype, h.dtype))
+    for i0 in range(0, n_out, block_size):
+        i1 = min(i0 + block_size, n_out)
+        out[..., i0:i1] = _fir_block(x, h, up, down, offset, i0, i1, method)
+    return out
+
+
+def _block_mean(x, function, block_size):
+    """
+    Gets the mean of function(x) along the last axis, one block at a time
+    """
+    total = 0
+    for i0 in range(0, x.shape[-1], block_size):
+        total = total + np.sum(function(x[..., i0:i0 + block_size]), axis=-1, keepdims=True)
+    return total / x.shape[-1]
+
+
+def _renormalise(x, out, block_size):
+    """
+    Centres each mode of out and scales it to the mean power of x, in place, one block at a time
+    """
+    power = _block_mean(x, lambda block: np.abs(block) ** 2, block_size)
+    mean = _block_mean(out, lambda block: block, block_size)
+    for i0 in range(0, out.shape[-1], block_size):
+        out[..., i0:i0 + block_size] -= mean
+    scale = np.sqrt(power / _block_mean(out, lambda block: np.abs(block) ** 2, block_size))
+    for i0 in range(0, out.shape[-1], block_size):
+        out[..., i0:i0 + block_size] *= scale
+    return out
+
+
+def resample(x, fold, fnew, Ts=None, beta=None, taps=4001, renormalise=False, block_size=BLOCK_SIZE, out=None):
+    """
+    Resamples a signal from fold to fnew in blocks, see module docstring
+
+    Parameters
+    ---------------------------------------------
+    x : numpy array
+        Signal, of shape (nmodes, number of samples)
+    fold : float
+        Sample rate of x
+    fnew : float
+        Sample rate to resample to
+    Ts : float
+        Symbol period, only needed if beta is given
+    beta : float
+        Roll-off of the root raised cosine filter. If None, the resample_poly filter is used
+    taps : integer
+        Number of taps of the root raised cosine filter
+    renormalise : bool
+        If True, each mode is centred and scaled to the mean power it had before resampling, in a second pass
+    block_size : integer
+        Number of output samples per mode worked out at a time
+    out : numpy array
+        Array of shape (nmodes, ceil(number of samples * fnew / fold)) that the output is written to. If None, a new
+        one is made
+
+    Output
+    ---------------------------------------------
+    out : numpy array
+        Resampled signal
+    """
+    if not isinstance(x, Signal_Views.PeriodicView):
+        x = np.asarray(x)
+    [h, up, down, offset] = resample_filter(fold, fnew, Ts, beta, taps)
+    if up == down == 1:
+        if out is None:
+            return np.array(x)
+        out[...] = x
+        return out
+    n_out = -(-x.shape[-1] * up // down)
+    out = fir_resample(x, h, up, down, offset, n_out, "direct" if beta is None else "fft", out, block_size)
+    if renormalise:
+        # second pass over the output, one block at a time, to centre it and restore the power of each mode
+        _renormalise(x, out, block_size)
+    return out
+
+
+def resample_signal(sig, fnew, beta=None, taps=4001, renormalise=False, threshold=None):
+    """
+    Resamples a QAMpy signal to fnew, in blocks if the resampled signal has more than threshold samples per mode,
+    otherwise with sig.resample
+
+    Parameters
+    ---------------------------------------------
+    sig : SignalQAMGrayCoded
+        Signal to be resampled. Can be a Signal_Views.PeriodicView of a signal, eg. a lazily delayed signal, which is
+        read through in blocks when resampled in blocks
+    fnew : float
+        Sample rate to resample to
+    beta : float
+        Roll-off of the root raised cosine filter, as for sig.resample
+    taps : integer
+        Number of taps of the root raised cosine filter
+    renormalise : bool
+        If True, the signal is renormalised after resampling
+    threshold : integer
+        Output samples per mode above which the signal is resampled in blocks. If None, CHUNK_THRESHOLD is used
+
+    Output
+    ---------------------------------------------
+    sig : SignalQAMGrayCoded
+        Resampled signal
+    """
+    if threshold is None:
+        threshold = CHUNK_THRESHOLD
+    [up, down] = resampling_factors(sig.fs, fnew)
+    if -(-sig.shape[-1] * up // down) <= threshold:
+        if isinstance(sig, Signal_Views.PeriodicView):
+            sig = sig.materialize()
+        if beta is None:
+            # sig.resample only renormalises after root raised cosine filtering, so it is done here as in resample
+            resampled = sig.resample(fnew)
+            if renormalise:
+                _renormalise(np.asarray(sig), resampled, BLOCK_SIZE)
+            return resampled
+        return sig.resample(fnew, beta=beta, taps=taps, renormalise=renormalise)
+    out = resample(sig, sig.fs, fnew, 1 / sig.fb, beta, taps, renormalise)
+    return sig.recreate_from_np_array(out, fs=fnew)
+
+
+def poly_resample(x, fold, fnew, delay=0, circular=False, Ts=None, beta=None, taps=4001, renormalise=False,
+                  block_size=BLOCK_SIZE, out=None):
+    """
+    Resamples a signal from fold to fnew and delays it, in one polyphase pass, see module docstring
+
+    Parameters
+    ---------------------------------------------
+    x : numpy array
+        Signal, of shape (nmodes, number of samples). Can be a Signal_Views.PeriodicView
+    fold : float
+        Sample rate of x
+    fnew : float
+        Sample rate to resample to
+    delay : float
+        Delay in samples at fold, can be any real number. Positive delays move the signal later in time
+    circular : bool
+        If True, x is one period of a repeating signal, so the delay wraps around and the filter reads across the ends.
+        If False, x is zero outside its samples
+    Ts, beta, taps :
+        See resample_filter
+    renormalise : bool
+        If True, each mode is centred and scaled to the mean power it had before resampling, in a second pass
+    block_size : integer
+        Number of output samples per mode worked out at a time
+    out : numpy array
+        Array of shape (nmodes, ceil(number of samples * fnew / fold)) that the output is written to. If None, a new
+        one is made
+
+    Output
+    ---------------------------------------------
+    out : numpy array
+        Resampled and delayed signal, with ceil(number of samples * fnew / fold) samples per mode
+    """
+    if not isinstance(x, Signal_Views.PeriodicView):
+        x = np.asarray(x)
+    n_in = x.shape[-1]
+    [h, up, down, offset] = delayed_filter(fold, fnew, delay, Ts, beta, taps)
+    n_out = -(-n_in * up // down)
+    src = x
+    if circular:
+        # whole input samples of the delay become a circular shift of the view, the rest stays in offset
+        whole = offset // up
+        offset -= whole * up
+        margin = -(-len(h) // up) + 1    # input samples the filter reaches past each end
+        if isinstance(x, Signal_Views.PeriodicView) and x.length == x.period:
+            src = Signal_Views.PeriodicView(x.signal, n_in + 2 * margin, x.offset + margin - whole)
+        else:
+            src = Signal_Views.PeriodicView(x, n_in + 2 * margin, margin - whole)
+        offset += margin * up
+    out = fir_resample(src, h, up, down, offset, n_out, fir_method(h, up, down), out, block_size)
+    if renormalise:
+        _renormalise(x, out, block_size)
+    return out
+
+
+def poly_resample_signal(sig, fnew, delay=0, circular=False, beta=None, taps=4001, renormalise=False):
+    """
+    Resamples a QAMpy signal to fnew and delays it in one polyphase pass (see poly_resample), in blocks
+
+    Parameters
+    ---------------------------------------------
+    sig : SignalQAMGrayCoded
+        Signal to be resampled. Can be a Signal_Views.PeriodicView of a signal
+    fnew : float
+        Sample rate to resample to
+    delay : float
+        Delay in samples at sig.fs, can be any real number
+    circular : bool
+        If True, the delay wraps around, as for a signal that repeats
+    beta : float
+        Roll-off of the root raised cosine filter. If None, the resample_poly filter is used
+    taps : integer
+        Number of taps of the root raised cosine filter
+    renormalise : bool
+        If True, the signal is renormalised after resampling
+
+    Output
+    ---------------------------------------------
+    sig : SignalQAMGrayCoded
+        Resampled signal
+    """
+    out = poly_resample(sig, sig.fs, fnew, delay, circular, 1 / sig.fb, beta, taps, renormalise)
+    return sig.recreate_from_np_array(out, fs=fnew)
+
+
+class PolyphaseResampler:
+    """
+    Streaming version of poly_resample (not circular), for signals processed in blocks as they arrive
+    Keeps the input samples that are still under the filter, and gives back every output sample that the input so far
+    is enough for, so the output of all the blocks followed by flush is the same as poly_resample on the whole signal.
+
+    Parameters
+    ---------------------------------------------
+    fold, fnew, delay, Ts, beta, taps :
+        See poly_resample
+    nmodes : integer
+        Number of modes of the signal
+    dtype : numpy dtype
+        Data type of the signal
+    """
+
+    def __init__(self, fold, fnew, delay=0, Ts=None, beta=None, taps=4001, nmodes=1, dtype=np.complex128):
+        [self.h, self.up, self.down, self.offset] = delayed_filter(fold, fnew, delay, Ts, beta, taps)
+        self.method = fir_method(self.h, self.up, self.down)
+        self.buffer = np.zeros((nmodes, 0), dtype=dtype)
+        self.start = 0      # input sample that buffer starts at
+        self.n_in = 0       # number of input samples received
+        self.n_out = 0      # number of output samples given back
+
+    def _output(self, i1):
+        x = self.buffer
+        offset = self.offset - self.start * self.up
+        out = np.empty(x.shape[:-1] + (max(i1 - self.n_out, 0),), dtype=np.result_type(x.dtype, self.h.dtype))
+        for i0 in range(self.n_out, i1, BLOCK_SIZE):
+            out[..., i0 - self.n_out:min(i0 + BLOCK_SIZE, i1) - self.n_out] = \
+                _fir_block(x, self.h, self.up, self.down, offset, i0, min(i0 + BLOCK_SIZE, i1), self.method)
+        self.n_out = max(i1, self.n_out)
+        # drops the input samples that no later output needs
+        keep = max(0, -(-(self.offset + self.n_out * self.down - len(self.h) + 1) // self.up) - self.start)
+        keep = min(keep, self.buffer.shape[-1])
+        self.buffer = self.buffer[..., keep:]
+        self.start += keep
+        return out
+
+    def process(self, block):
+        """
+        Resamples the next block of the signal
+
+        Parameters
+        ---------------------------------------------
+        block : numpy array
+            Next samples of the signal, of shape (nmodes, number of samples)
+
+        Output
+        ---------------------------------------------
+        out : numpy array
+            Output samples that the signal received so far is enough for, can be empty
+        """
+        block = np.atleast_2d(block)
+        self.buffer = np.concatenate((self.buffer, block), axis=-1)
+        self.n_in += block.shape[-1]
+        # output i needs upsampled samples up to offset + i*down, which must be before the end of the input so far
+        return self._output((self.n_in * self.up - 1 - self.offset) // self.down + 1)
+
+    def flush(self):
+        """
+        Gets the rest of the output, with the signal taken to be zero after the last block
+        """
+        return self._output(-(-self.n_in * self.up // self.down))
@@ -0,0 +1,154 @@
+"""
+Cache for generated transmitter signals, so that repeated runs with the same configuration skip generation and
+resampling.
+Signals are identified by a hash of everything that determines them: the signal class, M, N, the class's other
+arguments (eg. pilot parameters), nmodes, fb, fs, beta and the random seed. Recently used signals are kept in memory,
+and every signal is also saved to disk so that it can be reused by later runs.
+Only seeded signals are cached, as without a seed every call should give a new random signal.
+"""
+
+from qampy import signals
+from qampy.core import io
+import numpy as np
+from collections import OrderedDict
+import hashlib
+import numbers
+import os
+import Resampling
+import Random_Streams
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".qampy_signal_cache")  # where signals are saved on disk
+MEMORY_SIZE = 8     # number of signals kept in memory
+
+_memory = OrderedDict()     # signals kept in memory, most recently used last
+
+
+def signal_key(cls, M, N, *args, nmodes=1, fb=1, fs=None, beta=0.1, renormalise=False, seed=None, **kwargs):
+    """
+    Gets the key that a signal is cached under, see get_signal for parameters
+    seed must be an integer, as a Generator has no value that would give the same key on the next run
+    """
+    if not isinstance(seed, numbers.Integral):
+        raise TypeError("cached signals need an integer seed, not %s, eg. from Random_Streams.int_seed"
+                        % type(seed).__name__)
+    params = (cls.__module__, cls.__name__, M, N, args, nmodes, float(fb), None if fs is None else float(fs),
+              float(beta), renormalise, int(seed), sorted(kwargs.items()))
+    return hashlib.sha1(repr(params).encode()).hexdigest()
+
+
+def generate_signal(cls, M, N, *args, nmodes=1, fb=1, fs=None, beta=0.1, renormalise=False, seed=None, **kwargs):
+    """
+    Generates a signal without using the cache, see get_signal for parameters
+    If seed is given, as an integer or a numpy Generator (see Random_Streams.int_seed), it is passed on to cls as the
+    seed of its random symbols. numpy's global random state is also seeded from it while the signal is generated, for
+    any parts of cls that use the global state, and then restored
+    """
+    seed = Random_Streams.int_seed(seed)
+    if seed is not None:
+        kwargs["seed"] = seed
+    with Random_Streams.seeded_global(seed):
+        sig = cls(M, N, *args, nmodes=nmodes, fb=fb, **kwargs)
+    if fs is not None:
+        sig = Resampling.resample_signal(sig, fs, beta=beta, renormalise=renormalise)
+    return sig
+
+
+def get_signal(cls, M, N, *args, nmodes=1, fb=1, fs=None, beta=0.1, renormalise=False, seed=None,
+               cache_dir=CACHE_DIR, **kwargs):
+    """
+    Gets the signal cls(M, N, *args, nmodes=nmodes, fb=fb, **kwargs), resampled to fs, from the cache if it is there,
+    otherwise generates it and adds it to the cache
+
+    Parameters
+    ---------------------------------------------
+    cls : class
+        QAMpy signal class, eg. signals.SignalQAMGrayCoded or signals.SignalWithPilots
+    M : integer
+        QAM order
+    N : integer
+        Number of symbols (frame length for signals with pilots)
+    args :
+        Other positional arguments of cls, eg. pilot_seq_len and pilot_ins_rat for SignalWithPilots
+    nmodes : integer
+        Number of polarisations
+    fb : float
+        Baud rate (symbols / s)
+    fs : float
+        Sample rate that the signal is resampled to, if None the signal is not resampled
+    beta : float
+        Roll-off factor used for resampling
+    renormalise : bool
+        If True, the signal is renormalised after resampling
+    seed : integer
+        Seed of the random symbols. If None, a new random signal is generated and nothing is cached. A numpy Generator
+        raises TypeError, as it can't be cached under a repeatable key, so draw a seed with Random_Streams.int_seed
+    cache_dir : txt
+        Directory that signals are saved to. If None, signals are only cached in memory
+    kwargs :
+        Other keyword arguments of cls, eg. Mpilots and nframes for SignalWithPilots
+
+    Output
+    ---------------------------------------------
+    sig : signal object
+        Copy of the cached signal, so that it can be changed without changing the cache
+    """
+    if seed is None:
+        return generate_signal(cls, M, N, *args, nmodes=nmodes, fb=fb, fs=fs, beta=beta, renormalise=renormalise,
+                               **kwargs)
+
+    key = signal_key(cls, M, N, *args, nmodes=nmodes, fb=fb, fs=fs, beta=beta, renormalise=renormalise, seed=seed,
+                     **kwargs)
+    if key in _memory:
+        _memory.move_to_end(key)
+        return _memory[key].copy()
+
+    file_path = None if cache_dir is None else os.path.join(cache_dir, key + ".sig")
+    if file_path is not None and os.path.isfile(file_path):
+        sig = io.load_signal(file_path)
+    else:
+        sig = generate_signal(cls, M, N, *args, nmodes=nmodes, fb=fb, fs=fs, beta=beta, renormalise=renormalise,
+                              seed=seed, **kwargs)
+        if file_path is not None:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            # saves to a temporary file first so that other processes never see a partly written signal
+            tmp_path = "%s.%d.tmp" % (file_path, os.getpid())
+            io.save_signal(tmp_path, sig, lvl=1)
+            os.replace(tmp_path, file_path)
+
+    _memory[key] = sig
+    while len(_memory) > MEMORY_SIZE:
+        _memory.popitem(last=False)
+    return sig.copy()
+
+
+def symbol_template(symbols, M, fb=1):
+    """
+    Gets a signal built from transmitted symbols, kept in memory under a hash of the symbols, M and fb
+    Building a signal from symbols (SignalQAMGrayCoded.from_symbol_array) makes a decision on every symbol to find its
+    bits, so captures of the same transmission reuse one template through recreate_from_np_array instead. The template
+    is shared, so should not be changed
+    """
+    symbols = np.ascontiguousarray(symbols)
+    digest = hashlib.sha1(repr((symbols.shape, symbols.dtype.str, M, float(fb))).encode())
+    digest.update(memoryview(symbols).cast("B"))
+    key = "symbols-" + digest.hexdigest()
+    if key in _memory:
+        _memory.move_to_end(key)
+        return _memory[key]
+    sig = signals.SignalQAMGrayCoded.from_symbol_array(symbols, M=M, fb=fb)
+    _memory[key] = sig
+    while len(_memory) > MEMORY_SIZE:
+        _memory.popitem(last=False)
+    return sig
+
+
+def clear(cache_dir=CACHE_DIR, disk=False):
+    """
+    Empties the in-memory cache, and if disk is True also deletes the signals saved in cache_dir
+    """
+    _memory.clear()
+    if disk and cache_dir is not None and os.path.isdir(cache_dir):
+        for filename in os.listdir(cache_dir):
+            if filename.endswith(".sig"):
+                os.remove(os.path.join(cache_dir, filename))
@@ -0,0 +1,114 @@
+"""
+Binary container for storing signal data along with its parameters and reference symbols
+The file is made of a short header, a JSON block of metadata, then the raw signal data and symbols, each aligned so
+that they can be memory-mapped straight from the file.
+"""
+
+import numpy as np
+import json
+import os
+
+MAGIC = b"QSIG0001"     # marks the start of a container file
+ALIGNMENT = 64          # data and symbols start on multiples of this many bytes
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_container(file_path, data, meta, symbols=None):
+    """
+    Writes signal data, its metadata and optionally its reference symbols to a container file
+
+    Parameters
+    ---------------------------------------------
+    file_path : txt
+        Path of the file to be written. If file already exists, overwrites it.
+    data : numpy array
+        Signal data, of shape (nmodes, number of samples)
+    meta : dictionary
+        Signal parameters, such as fs, fb, M and nmodes. Must be JSON serialisable
+    symbols : numpy array
+        Reference symbols of the signal, not stored if None
+
+    Output
+    ---------------------------------------------
+    File at given location with signal data
+    """
+    data = np.ascontiguousarray(data)
+    meta = dict(meta)
+    meta["data"] = {"dtype": data.dtype.str, "shape": list(data.shape), "offset": 0}
+    if symbols is not None:
+        symbols = np.ascontiguousarray(symbols)
+        meta["symbols"] = {"dtype": symbols.dtype.str, "shape": list(symbols.shape), "offset": 0}
+
+    # offsets depend on the size of the metadata, which depends on the offsets, so repeats until they settle
+    while True:
+        header = json.dumps(meta).encode("utf-8")
+        data_offset = _align(len(MAGIC) + 8 + len(header))
+        symbols_offset = _align(data_offset + data.nbytes)
+        if meta["data"]["offset"] == data_offset and (symbols is None or meta["symbols"]["offset"] == symbols_offset):
+            break
+        meta["data"]["offset"] = data_offset
+        if symbols is not None:
+            meta["symbols"]["offset"] = symbols_offset
+
+    with open(file_path, "wb") as fid:
+        fid.write(MAGIC)
+        fid.write(np.uint64(len(header)).tobytes())
+        fid.write(header)
+        fid.seek(data_offset)
+        data.tofile(fid)
+        if symbols is not None:
+            fid.seek(symbols_offset)
+            symbols.tofile(fid)
+    return
+
+
+def read_meta(file_path):
+    """
+    Reads only the metadata of a container file
+    """
+    with open(file_path, "rb") as fid:
+        if fid.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a signal container" % file_path)
+        header_len = int(np.frombuffer(fid.read(8), dtype=np.uint64)[0])
+        return json.loads(fid.read(header_len).decode("utf-8"))
+
+
+def _read_array(file_path, info, mmap):
+    dtype = np.dtype(info["dtype"])
+    shape = tuple(info["shape"])
+    if mmap:
+        # copy-on-write, so the array can be changed in memory without changing the file
+        return np.memmap(file_path, dtype=dtype, mode="c", offset=info["offset"], shape=shape)
+    count = int(np.prod(shape))
+    return np.fromfile(file_path, dtype=dtype, count=count, offset=info["offset"]).reshape(shape)
+
+
+def read_container(file_path, mmap=True):
+    """
+    Reads a container file
+
+    Parameters
+    ---------------------------------------------
+    file_path : txt
+        Path of the container file
+    mmap : bool
+        If True, the signal data and symbols are memory-mapped rather than read into memory
+
+    Output
+    ---------------------------------------------
+    data : numpy array
+        Signal data
+    symbols : numpy array
+        Reference symbols, or None if they were not stored
+    meta : dictionary
+        Signal parameters
+    """
+    meta = read_meta(file_path)
+    data = _read_array(file_path, meta.pop("data"), mmap)
+    symbols = None
+    if "symbols" in meta:
+        symbols = _read_array(file_path, meta.pop("symbols"), mmap)
+    return [data, symbols, meta]
@@ -0,0 +1,158 @@
+"""
+Periodic extension of signals, for signals made of repeated copies of one data packet
+PeriodicView reads a signal repeated along its last axis without copying it, by indexing the original data modulo its
+length, so it only costs memory for the parts that are read. It can also be circularly shifted, so a delayed signal is
+only a record of its offset until its samples are read. periodic_extend writes the repetition into a
+preallocated array, copying the data once and then doubling the filled part, so each output sample is written once.
+"""
+
+import numpy as np
+
+
+def periodic_extend(data, length, out=None):
+    """
+    Repeats data along its last axis to a given length, which need not be a whole number of copies
+
+    Parameters
+    ---------------------------------------------
+    data : numpy array
+        Data to repeat, of shape (nmodes, period)
+    length : integer
+        Number of samples per mode of the output
+    out : numpy array
+        Array of shape (nmodes, length) to write the output to. If None, a new one is made
+
+    Output
+    ---------------------------------------------
+    out : numpy array
+        data repeated to length samples
+    """
+    data = np.asarray(data)
+    period = data.shape[-1]
+    if out is None:
+        out = np.empty(data.shape[:-1] + (length,), dtype=data.dtype)
+    filled = min(period, length)
+    out[..., :filled] = data[..., :filled]
+    while filled < length:
+        n = min(filled, length - filled)
+        out[..., filled:filled + n] = out[..., :n]
+        filled += n
+    return out
+
+
+class PeriodicView:
+    """
+    Read-only view of data repeated along its last axis to a given length and circularly shifted by an offset, see
+    module docstring. Sample i of the view is data[..., (i - offset) % period], so an offset of k is np.roll by k.
+    Indexing returns numpy arrays, and np.asarray(view) gives the whole repeated signal. If data is a signal, its
+    parameters (fs, fb, M, nmodes, symbols) and recreate_from_np_array can be read from the view.
+
+    Parameters
+    ---------------------------------------------
+    data : numpy array
+        Data to repeat, of shape (nmodes, period)
+    length : integer
+        Number of samples per mode of the repeated signal. If None, the length of data, for a circular shift
+    offset : integer
+        Number of samples the repetition is shifted by, wrapping around
+    """
+    SIGNAL_ATTRIBUTES = ("fs", "fb", "M", "nmodes", "symbols", "recreate_from_np_array")
+
+    def __init__(self, data, length=None, offset=0):
+        self.signal = data
+        self.data = np.asarray(data)
+        self.period = self.data.shape[-1]
+        self.length = self.period if length is None else int(length)
+        self.offset = int(np.sum(offset)) % self.period if self.period else 0
+
+    def __getattr__(self, name):
+        if name in PeriodicView.SIGNAL_ATTRIBUTES:
+            return getattr(self.signal, name)
+        raise AttributeError("'PeriodicView' object has no attribute '%s'" % name)
+
+    @property
+    def shape(self):
+        return self.data.shape[:-1] + (self.length,)
+
+    @property
+    def ndim(self):
+        return self.data.ndim
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def rolled(self, shift):
+        """
+        Gets the view circularly shifted by a further shift samples, without copying, if the view is a whole number of
+        periods long, otherwise None as the shifted repetition is no longer periodic
+        """
+        if self.length % self.period != 0:
+            return None
+        return PeriodicView(self.signal, self.length, self.offset + int(np.sum(shift)))
+
+    def _read_contiguous(self, data, start, n, out=None):
+        """
+        Reads samples start to start + n, as a view of the data if they don't wrap around and out is None
+        """
+        start = (start - self.offset) % self.period
+        if out is None:
+            if start + n <= self.period:
+                return data[..., start:start + n]
+            out = np.empty(data.shape[:-1] + (n,), dtype=data.dtype)
+        first = min(self.period - start, n)
+        out[..., :first] = data[..., start:start + first]
+        if n > first:
+            periodic_extend(data, n - first, out[..., first:])
+        return out
+
+    def _read(self, data, index):
+        """
+        Reads index (an integer, slice or array along the last axis) from data repeated to self.length samples
+        """
+        if isinstance(index, slice):
+            [start, stop, step] = index.indices(self.length)
+            if step == 1:
+                return self._read_contiguous(data, start, max(stop - start, 0))
+            return np.take(data, (np.arange(start, stop, step) - self.offset) % self.period, axis=-1)
+        if np.ndim(index) == 0:
+            index = int(index)
+            if not -self.length <= index < self.length:
+                raise IndexError("index %d is out of bounds for length %d" % (index, self.length))
+            return data[..., (index % self.length - self.offset) % self.period]
+        index = np.asarray(index)
+        return np.take(data, (np.where(index < 0, index + self.length, index) - self.offset) % self.period, axis=-1)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = [k is Ellipsis for k in key].index(True)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1:]
+        key = key + (slice(None),) * (self.ndim - len(key))
+        # the leading axes (eg. modes) are not repeated, so they are indexed as normal
+        data = self.data[key[:-1] + (slice(None),)]
+        return self._read(data, key[-1])
+
+    def read_into(self, out, start=0):
+        """
+        Writes samples start to start + out.shape[-1] of every mode into out, without an intermediate copy
+        """
+        return self._read_contiguous(self.data, start, out.shape[-1], out)
+
+    def materialize(self, out=None):
+        """
+        Gets the repeated signal as an array, rebuilt as a signal if data is a signal
+        out is an array of the view's shape to write the samples to, if None a new one is made
+        """
+        out = self.read_into(np.empty(self.shape, dtype=self.dtype) if out is None else out)
+        if hasattr(self.signal, "recreate_from_np_array"):
+            return self.signal.recreate_from_np_array(out)
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        out = self.read_into(np.empty(self.shape, dtype=self.dtype))
+        return out if dtype is None else out.astype(dtype, copy=False)
@@ -1,51 +1,221 @@
 """
 Code for server to receive files from host
+The server runs until it is stopped and handles any number of hosts at once. Each connection is a session that can
+carry many files, with each file sent as:
+    header: magic (4 bytes), length of filename (2 bytes), file size (8 bytes), all big-endian
+    filename: utf-8 encoded
+    data: file size bytes
+Once a file has been written to disk, the server replies with its size as an 8 byte big-endian integer, so the host
+knows the file is ready to be imported by the AWG. The session ends when the host closes the connection.
+Files in the compact .qwf format (see Waveform_Format) are expanded into the AWG's text or binary import format before
+they are confirmed.
 """
 
-import socket
+import argparse
+import asyncio
 import os
+import struct
+from functools import partial
 
+from Waveform_Format import expandCompactFile
 
 # device's IP address
 SERVER_HOST = "0.0.0.0"
 SERVER_PORT = 5001
-# receive 4096 bytes each time
-BUFFER_SIZE = 4096
-SEPARATOR = "<SEPARATOR>"
-
-# create the server socket
-# TCP socket
-s = socket.socket()
-# bind the socket to our local address
-s.bind((SERVER_HOST, SERVER_PORT))
-s.listen(5)     # can allow up to 5 unaccepted connections before refusing further requests
-print(f"[*] Listening as {SERVER_HOST}:{SERVER_PORT}")
-# accept connection if there is any
-client_socket, address = s.accept()
-# if below code is executed, that means the sender is connected
-print(f"[+] {address} is connected.")
-
-# receive the file infos
-# receive using client socket, not server socket
-received = client_socket.recv(BUFFER_SIZE).decode()
-filename, filesize = received.split(SEPARATOR)
-# remove absolute path if there is
-filename = os.path.basename(filename)
-# convert to integer
-filesize = int(filesize)
-
-# receive file data and write to file
-with open(filename, "wb") as f:
-    while True:
-        bytes_read = client_socket.recv(BUFFER_SIZE)
-        if not bytes_read:
-            # nothing is received
-            # file transmitting is done
-            break
-        # write to the file the bytes we just received
-        f.write(bytes_read)
-
-# close the client socket
-client_socket.close()
-# close the server socket
-s.close()
+# received data is written to the file from one of two buffers of this size, while the other is being filled
+BUFFER_SIZE = 4 * 2 ** 20
+
+FILE_MAGIC = b"QFS1"  # marks the start of each file header
+FILE_HEADER = struct.Struct("!4sHQ")  # magic, length of filename, file size
+FILE_ACK = struct.Struct("!Q")  # number of bytes received, sent back once a file is written
+
+
+def writeAll(file, data):
+    """
+    Writes all of data to a file opened with buffering=0, whose writes can be partial
+    """
+    while data:
+        data = data[file.write(data):]
+
+
+class FileReceiver(asyncio.BufferedProtocol):
+    """
+    Receives the files of one session. The socket reads directly into the header, filename or data buffer, depending on
+    which part of a file is expected next, and data is written to disk from the buffer without being copied
+    Data is written in a worker thread, so that one connection's disk writes don't hold up the others. While one
+    buffer is being written the other is filled, and reading is paused if it fills before the write has finished
+    """
+
+    def __init__(self, out_dir=".", on_file=None):
+        """
+        :param out_dir: directory that received files are saved to
+        :param on_file: function called with the path of each file once it has been received. It is run in a worker
+        thread, and the file is only confirmed to the host once it returns
+        """
+        self.out_dir = out_dir
+        self.on_file = on_file
+        self._pending = None  # processing of the last received file, so files are confirmed in order
+        self.transport = None
+        self.address = None
+        self._buffer = bytearray(BUFFER_SIZE)  # buffer being filled
+        self._spare = bytearray(BUFFER_SIZE)  # buffer being written, or free
+        self._writing = None  # write of the spare buffer in a worker thread
+        self._lost = False
+        self._file = None
+        self._startHeader()
+
+    def _startHeader(self):
+        self._state = "header"
+        self._part = bytearray(FILE_HEADER.size)
+        self._filled = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.address = transport.get_extra_info("peername")
+        print(f"[+] {self.address} is connected.")
+
+    def get_buffer(self, sizehint):
+        if self._state == "data":
+            return memoryview(self._buffer)[self._filled:min(BUFFER_SIZE, self._filled + self._remaining)]
+        return memoryview(self._part)[self._filled:]  # never reads past the end of the header or filename
+
+    def buffer_updated(self, nbytes):
+        if self._state == "data":
+            self._filled += nbytes
+            self._remaining -= nbytes
+            if self._writing is None:
+                self._writeBuffer()
+            if self._remaining == 0 or self._filled == BUFFER_SIZE:
+                # waits for the write to finish, before the buffer is reused or the file is confirmed
+                self.transport.pause_reading()
+            return
+
+        self._filled += nbytes
+        if self._filled < len(self._part):
+            return
+        if self._state == "header":
+            [magic, name_len, self._filesize] = FILE_HEADER.unpack(self._part)
+            if magic != FILE_MAGIC or name_len == 0:
+                print(f"[-] {self.address} sent an invalid header, closing connection")
+                self.transport.close()
+                return
+            self._state = "name"
+            self._part = bytearray(name_len)
+            self._filled = 0
+        else:  # filename has been received
+            # remove absolute path if there is
+            filename = os.path.basename(self._part.decode())
+            self._path = os.path.join(self.out_dir, filename)
+            self._file = open(self._path + ".part", "wb", buffering=0)
+            self._state = "data"
+            self._filled = 0
+            self._remaining = self._filesize
+            if self._remaining == 0:
+                self._finishFile()
+
+    def _writeBuffer(self):
+        """
+        Starts writing the data received so far to the file in a worker thread, and swaps the buffers
+        """
+        data = memoryview(self._buffer)[:self._filled]
+        [self._buffer, self._spare] = [self._spare, self._buffer]
+        self._filled = 0
+        self._writing = asyncio.get_running_loop().run_in_executor(None, writeAll, self._file, data)
+        self._writing.add_done_callback(self._written)
+
+    def _written(self, writing):
+        self._writing = None
+        if self._lost:
+            self._removeFile()
+            return
+        if writing.exception() is not None:
+            print(f"[-] Could not write {self._path}: {writing.exception()}")
+            self.transport.close()
+            return
+        if self._filled:
+            self._writeBuffer()  # data that arrived during the write
+        elif self._remaining == 0:
+            self._finishFile()
+        if self._writing is None or self._remaining:
+            self.transport.resume_reading()
+
+    def _finishFile(self):
+        self._file.close()
+        self._file = None
+        os.replace(self._path + ".part", self._path)  # file only appears once it is complete
+        print(f"[+] Received {self._path} ({self._filesize} bytes) from {self.address}")
+        if self.on_file is None:
+            self.transport.write(FILE_ACK.pack(self._filesize))
+        else:
+            self._pending = asyncio.ensure_future(self._processFile(self._pending, self._path, self._filesize))
+        self._startHeader()
+
+    async def _processFile(self, previous, path, filesize):
+        """
+        Runs on_file for a received file without blocking other connections, then confirms the file to the host
+        """
+        if previous is not None:
+            await previous
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.on_file, path)
+        except Exception as err:
+            print(f"[-] Could not process {path}: {err}")
+            filesize = 0  # host sees that the size doesn't match
+        if not self.transport.is_closing():
+            self.transport.write(FILE_ACK.pack(filesize))
+
+    def eof_received(self):
+        if self._state != "header" or self._filled != 0:
+            print(f"[-] {self.address} disconnected part way through a file")
+        return False  # closes the transport
+
+    def connection_lost(self, exc):
+        self._lost = True
+        if self._writing is None:  # otherwise removed once the write has finished
+            self._removeFile()
+        print(f"[-] {self.address} disconnected.")
+
+    def _removeFile(self):
+        if self._file is not None:  # removes incomplete file
+            self._file.close()
+            os.remove(self._path + ".part")
+            self._file = None
+
+
+def expandCompact(path, file_format="txt"):
+    """
+    Expands a received file into the AWG's import format if it is in the compact .qwf format
+    """
+    if path.endswith(".qwf"):
+        out_filename = expandCompactFile(path, file_format)
+        print(f"[+] Expanded {path} to {out_filename}")
+
+
+async def serve(host=SERVER_HOST, port=SERVER_PORT, out_dir=".", on_file=None):
+    """
+    Runs the file server until it is cancelled
+    :param host: address to listen on
+    :param port: port to listen on
+    :param out_dir: directory that received files are saved to
+    :param on_file: function called with the path of each file once it has been received
+    """
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(lambda: FileReceiver(out_dir, on_file), host, port)
+    print(f"[*] Listening as {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Receives waveform files from the host")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--dir", default=".", help="directory that received files are saved to")
+    parser.add_argument("--expand", default="txt", choices=["txt", "bin", "none"],
+                        help="format that compact .qwf files are expanded to")
+    args = parser.parse_args()
+    on_file = None if args.expand == "none" else partial(expandCompact, file_format=args.expand)
+    try:
+        asyncio.run(serve(args.host, args.port, args.dir, on_file))
+    except KeyboardInterrupt:
+        print("[*] Server stopped")